@@ -0,0 +1,289 @@
+# bench_bot_load.py
+"""
+AnabolicPizza Shop - Bot load test
+Runs the real bot Application (build_application from bot.py, all handlers,
+MongoDB) against the stub Bot API and replays a scripted session for N
+synthetic users: /start -> browse category -> product -> add to cart ->
+quantity + -> cart -> checkout -> country -> city -> skip referral ->
+support menu -> my tickets -> /orders. Each user waits for the reply to one
+step (plus think time) before sending the next, like a real client.
+
+Reports latency percentiles per handler, Mongo commands per update (pymongo
+command monitoring), event loop lag and Bot API calls by method.
+
+Needs a MongoDB. The bot runs against --db (default telegram_shop_bench, via
+MONGODB_DB); if that database has no active category with an active product,
+one of each is created. Synthetic users get telegram ids from 900000000 up;
+--cleanup removes their users, chat messages, carts and other session state,
+support tickets, and the seeded catalog afterwards.
+
+Usage: python bench_bot_load.py [--users 100] [--think-ms 200] [--mode webhook|polling] [--api-latency-ms 40] [--db telegram_shop_bench] [--cleanup]
+"""
+
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+from pymongo import monitoring
+
+STUB_PORT = 8081
+USER_ID_BASE = 900_000_000
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--think-ms", type=float, default=200)
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook")
+    parser.add_argument("--api-latency-ms", type=float, default=40)
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--no-rate-limit", action="store_true", help="bypass the outbound scheduler")
+    parser.add_argument("--db", default="telegram_shop_bench")
+    parser.add_argument("--cleanup", action="store_true")
+    return parser.parse_args()
+
+# The bot modules pick their database when imported
+args = parse_args()
+os.environ["MONGODB_DB"] = args.db
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Counts Mongo commands against the update being processed"""
+
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+    def __init__(self):
+        self.current = contextvars.ContextVar("bench_update_ops", default=None)
+        self.commands = Counter()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        self.commands[event.command_name] += 1
+        ops = self.current.get()
+        if ops is not None:
+            ops[0] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Must be registered before bot_modules.database creates the client
+mongo_counter = MongoCommandCounter()
+monitoring.register(mongo_counter)
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import bot
+from bench_stub_bot_api import StubBotAPI
+from bot_modules.callbacks import callback_router
+from bot_modules.config import EU_COUNTRIES
+from bot_modules.database import db
+from bot_modules.message_loader import message_loader
+from bot_modules.session_store import session_store
+
+def build_session(category_id: str, product_id: str, country: str):
+    """One shopper: (kind, payload) steps"""
+    return [
+        ("text", "/start"),
+        ("callback", "shop"),
+        ("callback", f"cat_{category_id}"),
+        ("callback", f"view_{product_id}"),
+        ("callback", f"add_{product_id}"),
+        ("callback", f"qty_plus_{product_id}"),
+        ("callback", f"qty_minus_{product_id}"),
+        ("callback", "cart"),
+        ("callback", "checkout_start"),
+        ("callback", "select_country"),
+        ("callback", f"country_{country}"),
+        ("text", "Berlin"),
+        ("callback", "skip_referral"),
+        ("callback", "support_menu"),
+        ("callback", "my_tickets"),
+        ("text", "/orders"),
+    ]
+
+def handler_name(update: Update) -> str:
+    if update.callback_query:
+        route, _ = callback_router.resolve(update.callback_query.data or "")
+        return f"cb {route.name}" if route else "cb unknown"
+    message = update.effective_message
+    if message and message.text:
+        if message.text.startswith("/"):
+            spec = bot.command_router.resolve(message.text, None)
+            return f"cmd {spec.command}" if spec else "cmd unknown"
+        return "text"
+    return "other"
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def monitor_loop_lag(samples: list, interval: float = 0.01):
+    """Measures how late the event loop wakes a sleeping task"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+async def seed_catalog():
+    """An active category with an active product - created if the database has none.
+    Returns (category, product, seeded)"""
+    category = await db.categories.find_one({"is_active": True})
+    product = category and await db.products.find_one({"category_id": category["_id"], "is_active": True})
+    if product:
+        return category, product, False
+
+    category = {"name": "Bench Category", "emoji": "📦", "description": "Load test", "is_active": True}
+    category["_id"] = (await db.categories.insert_one(category)).inserted_id
+    product = {
+        "name": "Bench Product",
+        "description": "Load test",
+        "category_id": category["_id"],
+        "price_usdt": 25.0,
+        "purchase_price_usdt": 10.0,
+        "stock_quantity": 1_000_000,
+        "is_active": True
+    }
+    product["_id"] = (await db.products.insert_one(product)).inserted_id
+    print(f"📦 Seeded a category and a product in {args.db}")
+    return category, product, True
+
+async def cleanup(user_ids: list, category: dict, product: dict, seeded: bool):
+    user_filter = {"telegram_id": {"$in": user_ids}}
+    await db.users.delete_many(user_filter)
+    await db.chat_messages.delete_many(user_filter)
+
+    tickets = await db.support_tickets.find(user_filter, {"_id": 1}).to_list(None)
+    if tickets:
+        await db.ticket_messages.delete_many({"ticket_id": {"$in": [t["_id"] for t in tickets]}})
+        await db.support_tickets.delete_many(user_filter)
+
+    # Carts and conversation state - whichever session backend is configured
+    for user_id in user_ids:
+        await session_store.clear_user(user_id)
+
+    if seeded:
+        await db.products.delete_one({"_id": product["_id"]})
+        await db.categories.delete_one({"_id": category["_id"]})
+    print("🧹 Removed synthetic users, chat messages, sessions and tickets"
+          + (" and the seeded catalog" if seeded else ""))
+
+async def main():
+    print(f"🗄️ Database: {args.db}")
+    category, product, seeded = await seed_catalog()
+    session = build_session(str(category["_id"]), str(product["_id"]), next(iter(EU_COUNTRIES.values())))
+
+    stub = StubBotAPI(args.api_latency_ms)
+    await stub.start(port=args.port)
+
+    application = bot.build_application(
+        base_url=f"http://127.0.0.1:{args.port}/bot",
+        rate_limited=not args.no_rate_limit
+    )
+
+    latencies = defaultdict(list)
+    ops_per_update = defaultdict(list)
+    errors = Counter()
+    started = {}
+    finished = {}
+
+    async def stamp(update: Update, context):
+        ops = [0]
+        mongo_counter.current.set(ops)
+        started[update.update_id] = (time.perf_counter(), handler_name(update), ops)
+
+    async def record(update: Update, context):
+        start, name, ops = started.pop(update.update_id)
+        latencies[name].append(time.perf_counter() - start)
+        ops_per_update[name].append(ops[0])
+        mongo_counter.current.set(None)
+        waiter = finished.pop(update.update_id, None)
+        if waiter and not waiter.done():
+            waiter.set_result(None)
+
+    async def count_error(update, context):
+        if isinstance(update, Update) and update.update_id in started:
+            errors[started[update.update_id][1]] += 1
+
+    application.add_handler(TypeHandler(Update, stamp), group=-2)
+    application.add_handler(TypeHandler(Update, record), group=100)
+    application.add_error_handler(count_error)
+
+    # What post_init does, minus background tasks and the payment gateway
+    await message_loader.reload_all()
+    await bot.register_dynamic_commands()
+
+    await application.initialize()
+    await application.start()
+    if args.mode == "polling":
+        stub.reset_updates()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    async def deliver(raw: dict):
+        waiter = asyncio.get_running_loop().create_future()
+        finished[raw["update_id"]] = waiter
+        if args.mode == "polling":
+            stub.push_update(raw)
+        else:
+            # What the FastAPI webhook route does for every POST
+            await application.update_queue.put(Update.de_json(raw, application.bot))
+        await asyncio.wait_for(waiter, timeout=120)
+
+    async def run_user(user_id: int):
+        await asyncio.sleep(random.uniform(0, args.think_ms / 1000))
+        for kind, payload in session:
+            if kind == "text":
+                raw = stub.make_message_update(user_id, payload)
+            else:
+                raw = stub.make_callback_update(user_id, payload)
+            await deliver(raw)
+            await asyncio.sleep(random.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+    lag_samples = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+    commands_before = Counter(mongo_counter.commands)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_user(USER_ID_BASE + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - start
+    finally:
+        lag_task.cancel()
+        if application.updater.running:
+            await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await stub.stop()
+
+    total = sum(len(values) for values in latencies.values())
+    total_ops = sum(sum(values) for values in ops_per_update.values())
+
+    print(f"{args.users} users x {len(session)} steps, mode {args.mode}, api latency {args.api_latency_ms}ms, "
+          f"think {args.think_ms}ms, rate limiter {'off' if args.no_rate_limit else 'on'}")
+    print(f"{'handler':<24}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'mongo/upd':>11}{'errors':>8}")
+    for name in sorted(latencies):
+        values = latencies[name]
+        ops = ops_per_update[name]
+        print(f"{name:<24}{len(values):>7}{percentile(values, 0.5) * 1000:>9.1f}{percentile(values, 0.95) * 1000:>9.1f}"
+              f"{percentile(values, 0.99) * 1000:>9.1f}{max(values) * 1000:>9.1f}{sum(ops) / len(ops):>11.1f}{errors[name]:>8}")
+
+    print(f"\nupdates: {total} in {elapsed:.2f}s = {total / elapsed:.1f} upd/s")
+    print(f"mongo: {total_ops / max(total, 1):.1f} commands per update, "
+          f"{dict(mongo_counter.commands - commands_before)}")
+    print(f"event loop lag: p50 {percentile(lag_samples, 0.5) * 1000:.1f}ms, "
+          f"p99 {percentile(lag_samples, 0.99) * 1000:.1f}ms, max {max(lag_samples, default=0) * 1000:.1f}ms")
+    print(f"bot api calls: {dict(stub.calls)}")
+
+    if args.cleanup:
+        await cleanup([USER_ID_BASE + i for i in range(args.users)], category, product, seeded)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# bench_callback_router.py
+"""
+AnabolicPizza Shop - Callback dispatch benchmark
+Synthetic: registers N callback types (half exact values, half prefixes) and
+times resolving callback_data through an if/elif startswith chain - the shape
+handle_callback used to have - against CallbackRouter. The chain grows with
+every callback type added; the router stays flat. Pure CPU, no Telegram.
+
+Usage: python bench_callback_router.py [--sizes 10,30,100,300,1000] [--calls 50000]
+"""
+
+import argparse
+import random
+import time
+
+from bot_modules.callback_router import CallbackRouter, object_id
+
+PRODUCT_ID = "64b7f0c2a1b2c3d4e5f60718"
+
+async def noop(*args):
+    pass
+
+def build_routes(size: int):
+    exact = [f"action{i}" for i in range(size // 2)]
+    prefixes = [f"type{i}_" for i in range(size - len(exact))]
+    return exact, prefixes
+
+def build_chain(exact, prefixes):
+    """Equivalent of the old if/elif chain, checking each type in turn"""
+    checks = [(value, True) for value in exact] + [(prefix, False) for prefix in prefixes]
+
+    def resolve(data: str):
+        for value, is_exact in checks:
+            if is_exact:
+                if data == value:
+                    return value, None
+            elif data.startswith(value):
+                return value, object_id(data.replace(value, ""))
+        return None, None
+
+    return resolve
+
+def build_router(exact, prefixes) -> CallbackRouter:
+    router = CallbackRouter()
+    for value in exact:
+        router.exact(value, noop)
+    for prefix in prefixes:
+        router.prefix(prefix, noop, object_id)
+    return router
+
+def time_per_call(resolve, samples, calls: int) -> float:
+    count = len(samples)
+    start = time.perf_counter()
+    for i in range(calls):
+        resolve(samples[i % count])
+    return (time.perf_counter() - start) / calls * 1e9
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,30,100,300,1000")
+    parser.add_argument("--calls", type=int, default=50_000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"{'types':>7}{'if/elif ns':>12}{'router ns':>11}{'speedup':>9}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        exact, prefixes = build_routes(size)
+        chain = build_chain(exact, prefixes)
+        router = build_router(exact, prefixes)
+
+        # Taps spread evenly over all registered types
+        samples = [random.choice(exact) for _ in range(500)]
+        samples += [random.choice(prefixes) + PRODUCT_ID for _ in range(500)]
+        random.shuffle(samples)
+        for data in samples[:50]:
+            route, payload = router.resolve(data)
+            assert (route.name, payload) == chain(data)
+
+        old = time_per_call(chain, samples, args.calls)
+        new = time_per_call(router.resolve, samples, args.calls)
+        print(f"{size:>7}{old:>12.0f}{new:>11.0f}{old / new:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench_chat_search.py
+"""
+AnabolicPizza Shop - Chat search benchmark
+Seeds a synthetic chat corpus into a separate database and times the
+/api/chat/search query shapes (global words, per-user scope, partial words,
+date range, cursor paging). Never touches telegram_shop.
+
+Usage: python bench_chat_search.py [--messages 1000000] [--users 5000] [--reseed]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+
+from main_modules.chat_search import build_search_filter, split_terms, make_snippet, encode_cursor
+
+load_dotenv()
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+BENCH_DB = "telegram_shop_bench"
+
+WORDS = [
+    "order", "payment", "delivery", "tracking", "pizza", "package", "refund", "bitcoin",
+    "address", "invoice", "status", "shipping", "discount", "code", "vip", "support",
+    "hello", "thanks", "please", "when", "where", "price", "stock", "quantity", "germany",
+    "slovakia", "czech", "austria", "confirmed", "pending", "waiting", "received", "wallet"
+]
+
+async def seed(db, total_messages, total_users):
+    await db.chat_messages.drop()
+    now = datetime.now(timezone.utc)
+    batch = []
+    for i in range(total_messages):
+        batch.append({
+            "telegram_id": 100000 + random.randrange(total_users),
+            "message": " ".join(random.choices(WORDS, k=random.randint(3, 14))),
+            "direction": random.choice(["incoming", "outgoing"]),
+            "timestamp": now - timedelta(seconds=random.randrange(90 * 86400)),
+            "read": True
+        })
+        if len(batch) == 10000:
+            await db.chat_messages.insert_many(batch, ordered=False)
+            batch = []
+            print(f"  seeded {i + 1:,} messages", end="\r")
+    if batch:
+        await db.chat_messages.insert_many(batch, ordered=False)
+
+    await db.chat_messages.create_index([("message", "text")])
+    await db.chat_messages.create_index([("telegram_id", 1), ("timestamp", -1)])
+    await db.chat_messages.create_index([("timestamp", -1), ("_id", -1)])
+    print(f"\n✅ Seeded {total_messages:,} messages for {total_users:,} users")
+
+async def run_search(db, query, limit=50, pages=1, **kwargs):
+    terms = split_terms(query)
+    cursor = None
+    started = time.perf_counter()
+    results = 0
+    for _ in range(pages):
+        search_filter = build_search_filter(query, cursor=cursor, **kwargs)
+        messages = await db.chat_messages.find(search_filter).sort(
+            [("timestamp", -1), ("_id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        for msg in messages[:limit]:
+            make_snippet(msg["message"], terms)
+        results += len(messages[:limit])
+        if len(messages) <= limit:
+            break
+        cursor = encode_cursor(messages[limit - 1])
+    return (time.perf_counter() - started) * 1000, results
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[BENCH_DB]
+
+    if args.reseed or await db.chat_messages.estimated_document_count() < args.messages:
+        await seed(db, args.messages, args.users)
+
+    sample_user = 100000 + random.randrange(args.users)
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+
+    scenarios = [
+        ("global words", dict(query="payment bitcoin")),
+        ("global words, 5 pages", dict(query="tracking", pages=5)),
+        ("global words, last 7 days", dict(query="refund", date_from=week_ago)),
+        ("per-user scope", dict(query="delivery", telegram_id=sample_user)),
+        ("per-user partial word", dict(query="deliv", telegram_id=sample_user)),
+        ("global partial word, last 7 days", dict(query="wall", partial=True, date_from=week_ago)),
+    ]
+
+    print(f"\n{'scenario':36s} {'p50 ms':>9s} {'p95 ms':>9s} {'results':>8s}")
+    print("-" * 66)
+    for name, params in scenarios:
+        timings = []
+        results = 0
+        for _ in range(args.runs):
+            elapsed, results = await run_search(db, **params)
+            timings.append(elapsed)
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{name:36s} {p50:9.1f} {p95:9.1f} {results:8d}")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+# bench_message_templates.py
+"""
+AnabolicPizza Shop - Message template rendering benchmark
+Times MessageLoader.get_message rendering per call: the old per-variable
+str.replace loop against the precompiled CompiledTemplate, for the
+`welcome` message and a cart summary template. Pure CPU, no database.
+
+Usage: python bench_message_templates.py [--calls 200000]
+"""
+
+import argparse
+import time
+
+from bot_modules.config import MESSAGES
+from bot_modules.message_loader import CompiledTemplate
+
+# Cart summaries are built in the handlers; this is a typical admin-defined cart message
+CART_TEMPLATE = (
+    "🛒 *YOUR CART, {name}*\n\n{items}\n\n"
+    "💰 Subtotal: ${subtotal}\n"
+    "🎁 Discount ({discount_label}): -{discount}%\n"
+    "🚚 Delivery: {delivery}\n"
+    "💵 *TOTAL: ${total} USDT*\n\n"
+    "Items: {count} | Code: {referral_code}"
+)
+
+CART_VALUES = {
+    "name": "Bro",
+    "items": "• Testosterone E x2 - $90.00\n• Anavar x1 - $60.00\n• Pizza x3 - $30.00",
+    "subtotal": 180.0,
+    "discount_label": "VIP",
+    "discount": 10,
+    "delivery": "Germany",
+    "total": 162.0,
+    "count": 6,
+    "referral_code": "GAINS"
+}
+
+def render_replace(message: str, **kwargs) -> str:
+    """The previous get_message substitution"""
+    for var_key, var_value in kwargs.items():
+        message = message.replace(f"{{{var_key}}}", str(var_value))
+    return message
+
+def time_per_call(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e9
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    cases = [
+        ("welcome", MESSAGES["welcome"], {"name": "Bro"}),
+        ("cart", CART_TEMPLATE, CART_VALUES),
+    ]
+
+    print(f"{'message':<10}{'replace ns':>12}{'compiled ns':>13}{'speedup':>9}")
+    for name, text, values in cases:
+        template = CompiledTemplate(text)
+        assert template.render(values) == render_replace(text, **values)
+
+        old = time_per_call(lambda: render_replace(text, **values), args.calls)
+        new = time_per_call(lambda: template.render(values), args.calls)
+        print(f"{name:<10}{old:>12.0f}{new:>13.0f}{old / new:>8.1f}x")
+
+    start = time.perf_counter()
+    for _ in range(10_000):
+        CompiledTemplate(CART_TEMPLATE)
+    print(f"compile cost (once per load/change): {(time.perf_counter() - start) / 10_000 * 1e9:.0f} ns")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# bench_payout_pipeline.py
+"""
+AnabolicPizza Shop - Payout calculation benchmark
+Synthetic: generates N orders plus partners, per-order expenses and sellers
+and times the old per-order calculation (re-reading every expense and partner
+for every order) against DeductionPipeline - compiled once, applied per order
+and, with NumPy installed, vectorized over the whole batch for partner totals.
+Checks the outputs match before timing. Pure CPU, no MongoDB.
+
+Usage: python bench_payout_pipeline.py [--orders 100000] [--expenses 6] [--partners 3] [--sellers 40]
+"""
+
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from main_modules.payout_pipeline import NUMPY_SUPPORT, DeductionPipeline, add_partner_totals
+
+def legacy_calculate_order_payout(order: dict, context: dict) -> dict:
+    """calculate_order_payout as it was before the pipeline - the reference output"""
+    order_calc = {
+        "order_number": order.get("order_number"),
+        "order_date": order.get("created_at"),
+        "total_usdt": float(order.get("total_usdt", 0)),
+        "base_profit": 0,
+        "deductions": [],
+        "final_profit": 0
+    }
+
+    original_total = float(order.get("total_usdt", 0))
+    discount_amount = float(order.get("discount_amount", 0))
+    original_price_before_discount = original_total + discount_amount
+
+    total_purchase_cost = 0
+
+    for item in order.get("items") or []:
+        quantity = item.get("quantity", 1)
+
+        purchase_price = float(item.get("purchase_price_usdt", 0))
+
+        if purchase_price == 0:
+            product = context["products_by_name"].get(item.get("product_name", ""))
+            if product:
+                purchase_price = float(product.get("purchase_price_usdt", 0))
+
+        total_purchase_cost += purchase_price * quantity
+
+    base_profit = original_price_before_discount - total_purchase_cost
+    order_calc["base_profit"] = base_profit
+
+    current_profit = base_profit
+
+    for expense in context["recurring_expenses"]:
+        expense_amount = 0
+        expense_name = expense.get('name')
+
+        if expense.get('amount_type') == 'percentage' and expense.get('percentage'):
+            percentage = float(expense.get('percentage', 0))
+            if percentage > 0 and current_profit > 0:
+                expense_amount = current_profit * (percentage / 100)
+                expense_name = f"{expense.get('name')} ({percentage}%)"
+        else:
+            expense_amount = float(expense.get('amount', 0))
+
+        if expense_amount > 0:
+            order_calc["deductions"].append({
+                "type": "expense",
+                "name": f"{expense_name} ({expense.get('type', 'expense')})",
+                "rate": expense.get('percentage', 0) if expense.get('amount_type') == 'percentage' else 0,
+                "amount": expense_amount
+            })
+            current_profit -= expense_amount
+
+    if discount_amount > 0:
+        order_calc["deductions"].append({
+            "type": "discount",
+            "name": "Customer Discount",
+            "rate": 0,
+            "amount": discount_amount
+        })
+        current_profit -= discount_amount
+
+    seller = context["sellers_by_code"].get(order.get("referral_code"))
+    if seller and current_profit > 0:
+        commission_rate = float(seller.get("commission_percentage", 30))
+        commission = current_profit * (commission_rate / 100)
+        order_calc["deductions"].append({
+            "type": "seller_commission",
+            "name": seller.get("name"),
+            "rate": commission_rate,
+            "amount": commission
+        })
+        current_profit -= commission
+
+    for partner in context["partners"]:
+        if partner["type"] == "partner" and partner.get("commission_percentage") and current_profit > 0:
+            commission_rate = float(partner["commission_percentage"])
+            commission = current_profit * (commission_rate / 100)
+
+            order_calc["deductions"].append({
+                "type": "partner_commission",
+                "partner_id": str(partner["_id"]),
+                "name": partner["name"],
+                "rate": commission_rate,
+                "amount": commission,
+                "base_amount": current_profit
+            })
+
+            current_profit -= commission
+
+    order_calc["final_profit"] = current_profit
+    return order_calc
+
+def build_context(expenses: int, partners: int, sellers: int) -> dict:
+    products = [{"name": f"Product {i}", "purchase_price_usdt": random.uniform(5, 60)} for i in range(50)]
+
+    recurring_expenses = []
+    for i in range(expenses):
+        if i % 2:
+            recurring_expenses.append({"name": f"Expense {i}", "type": "operational",
+                                       "amount_type": "percentage", "percentage": random.choice([2, 3.5, 5])})
+        else:
+            recurring_expenses.append({"name": f"Expense {i}", "type": "shipping",
+                                       "amount_type": "fixed", "amount": random.uniform(0.5, 4)})
+    # Entries the old code skipped - must stay skipped
+    recurring_expenses.append({"name": "Zero", "amount_type": "fixed", "amount": 0})
+    recurring_expenses.append({"name": "Negative %", "amount_type": "percentage", "percentage": -5})
+
+    partner_docs = [
+        {"_id": ObjectId(), "name": f"Partner {i}", "type": "partner",
+         "commission_percentage": random.choice([10, 20, 25, 50])}
+        for i in range(partners)
+    ]
+    partner_docs.append({"_id": ObjectId(), "name": "Investor", "type": "investor", "commission_percentage": 15})
+
+    return {
+        "partners": partner_docs,
+        "products_by_name": {p["name"]: p for p in products},
+        "recurring_expenses": recurring_expenses,
+        "sellers_by_code": {
+            f"CODE{i}": {"_id": ObjectId(), "name": f"Seller {i}", "commission_percentage": random.choice([20, 30, 40])}
+            for i in range(sellers)
+        }
+    }
+
+def build_orders(count: int, context: dict, sellers: int) -> list:
+    product_names = list(context["products_by_name"])
+    start = datetime(2025, 1, 1)
+    orders = []
+    for i in range(count):
+        items = []
+        for _ in range(random.randint(1, 4)):
+            item = {"product_name": random.choice(product_names), "quantity": random.randint(1, 3)}
+            # Newer orders carry the purchase price, older ones fall back to the product
+            if random.random() < 0.6:
+                item["purchase_price_usdt"] = random.uniform(5, 60)
+            items.append(item)
+        order = {
+            "order_number": f"ORD-{i:06d}",
+            "created_at": start + timedelta(minutes=i),
+            "items": items,
+            "total_usdt": random.uniform(20, 400),
+            "discount_amount": random.choice([0, 0, 0, 5, 12.5])
+        }
+        if random.random() < 0.4:
+            order["referral_code"] = f"CODE{random.randrange(sellers + 5)}"
+        orders.append(order)
+    return orders
+
+def same_number(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+def check_parity(orders, context, pipeline):
+    for order in orders:
+        old = legacy_calculate_order_payout(order, context)
+        new = pipeline.calculate(order)
+        assert old == new, f"calculation differs for {order['order_number']}"
+
+    old_totals = {}
+    for order in orders:
+        add_partner_totals(old_totals, legacy_calculate_order_payout(order, context))
+    new_totals = pipeline.partner_totals(orders)
+    assert old_totals.keys() == new_totals.keys()
+    for partner_id, total in old_totals.items():
+        assert total["count"] == new_totals[partner_id]["count"]
+        assert same_number(total["total"], new_totals[partner_id]["total"]), \
+            f"partner total differs: {total['total']} vs {new_totals[partner_id]['total']}"
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--expenses", type=int, default=6)
+    parser.add_argument("--partners", type=int, default=3)
+    parser.add_argument("--sellers", type=int, default=40)
+    args = parser.parse_args()
+
+    random.seed(1)
+    context = build_context(args.expenses, args.partners, args.sellers)
+    orders = build_orders(args.orders, context, args.sellers)
+    pipeline = DeductionPipeline(context)
+
+    check_parity(orders, context, pipeline)
+    print(f"✅ Parity with the old calculation on {len(orders)} orders")
+
+    def legacy_totals():
+        totals = {}
+        for order in orders:
+            add_partner_totals(totals, legacy_calculate_order_payout(order, context))
+
+    def pipeline_totals():
+        totals = {}
+        for order in orders:
+            add_partner_totals(totals, pipeline.calculate(order))
+
+    def compile_and_calculate():
+        compiled = DeductionPipeline(context)
+        for order in orders:
+            compiled.calculate(order)
+
+    rows = [
+        ("legacy per order", timed(lambda: [legacy_calculate_order_payout(o, context) for o in orders])),
+        ("pipeline per order", timed(compile_and_calculate)),
+        ("legacy totals", timed(legacy_totals)),
+        ("pipeline totals (loop)", timed(pipeline_totals)),
+    ]
+    if NUMPY_SUPPORT:
+        rows.append(("pipeline totals (numpy)", timed(lambda: pipeline.partner_totals(orders))))
+    else:
+        print("ℹ️ NumPy not installed - skipping the vectorized path")
+
+    baseline = {"per order": rows[0][1], "totals": rows[2][1]}
+    print(f"{'variant':<26}{'total ms':>10}{'us/order':>10}{'speedup':>9}")
+    for name, elapsed in rows:
+        reference = baseline["totals"] if "totals" in name else baseline["per order"]
+        print(f"{name:<26}{elapsed * 1000:>10.1f}{elapsed / len(orders) * 1e6:>10.2f}{reference / elapsed:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
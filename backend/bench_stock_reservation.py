@@ -0,0 +1,114 @@
+# bench_stock_reservation.py
+"""
+AnabolicPizza Shop - Stock reservation benchmark (flash sale)
+N buyers check out the same SKU at once against a limited stock. Compares
+the read-then-write check (find the product, compare stock_quantity, $inc)
+with reserve_stock's conditional decrement: units sold vs stock, oversold
+units, checkout latency percentiles and throughput. Afterwards releases every
+hold and checks the stock is back where it started.
+
+Needs a MongoDB; works in a scratch database (default telegram_shop_bench)
+that is dropped at the end.
+
+Usage: python bench_stock_reservation.py [--buyers 1000] [--stock 100] [--qty 1] [--db telegram_shop_bench]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from bot_modules.stock import reserve_stock, release_stock
+
+load_dotenv()
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+
+async def naive_checkout(db, product_id: ObjectId, quantity: int) -> bool:
+    """Check then decrement - two round trips with a gap in between"""
+    product = await db.products.find_one({"_id": product_id}, {"stock_quantity": 1})
+    if product["stock_quantity"] < quantity:
+        return False
+    await db.products.update_one({"_id": product_id}, {"$inc": {"stock_quantity": -quantity}})
+    return True
+
+async def reserved_checkout(db, product_id: ObjectId, quantity: int, order_id: ObjectId) -> bool:
+    item = {"product_id": product_id, "product_name": "Flash Sale SKU", "quantity": quantity}
+    return await reserve_stock(db, order_id, [item]) is None
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def run(db, name: str, checkout, buyers: int, stock: int, quantity: int):
+    product_id = (await db.products.insert_one({
+        "name": f"Flash Sale SKU ({name})",
+        "price_usdt": 10.0,
+        "stock_quantity": stock,
+        "is_active": True
+    })).inserted_id
+
+    latencies = []
+    order_ids = [ObjectId() for _ in range(buyers)]
+    start_gate = asyncio.Event()
+
+    async def buyer(order_id: ObjectId) -> bool:
+        await start_gate.wait()
+        started = time.perf_counter()
+        ok = await checkout(db, product_id, quantity, order_id)
+        latencies.append(time.perf_counter() - started)
+        return ok
+
+    tasks = [asyncio.create_task(buyer(order_id)) for order_id in order_ids]
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    start_gate.set()
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    product = await db.products.find_one({"_id": product_id}, {"stock_quantity": 1})
+    sold = sum(results) * quantity
+    oversold = max(0, sold - stock)
+
+    print(f"{name:<12}{sum(results):>8}{sold:>7}{oversold:>10}{product['stock_quantity']:>8}"
+          f"{percentile(latencies, 0.5) * 1000:>9.1f}{percentile(latencies, 0.95) * 1000:>9.1f}"
+          f"{percentile(latencies, 0.99) * 1000:>9.1f}{buyers / elapsed:>10.0f}")
+    return product_id, [order_id for order_id, ok in zip(order_ids, results) if ok]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--qty", type=int, default=1)
+    parser.add_argument("--db", default="telegram_shop_bench")
+    args = parser.parse_args()
+
+    # Enough connections that the buyers really race
+    client = AsyncIOMotorClient(MONGODB_URI, maxPoolSize=max(100, args.buyers))
+    db = client[args.db]
+
+    try:
+        print(f"{args.buyers} buyers x {args.qty} unit(s), stock {args.stock}")
+        print(f"{'variant':<12}{'orders':>8}{'units':>7}{'oversold':>10}{'left':>8}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'buyers/s':>10}")
+
+        await run(db, "read+write", lambda db, pid, qty, order_id: naive_checkout(db, pid, qty),
+                  args.buyers, args.stock, args.qty)
+        product_id, held = await run(db, "reserve", reserved_checkout, args.buyers, args.stock, args.qty)
+
+        # Every payment expires - all stock must come back exactly once
+        await asyncio.gather(*(release_stock(db, order_id, "bench") for order_id in held))
+        await asyncio.gather(*(release_stock(db, order_id, "bench") for order_id in held))
+        product = await db.products.find_one({"_id": product_id}, {"stock_quantity": 1})
+        assert product["stock_quantity"] == args.stock, f"stock after release: {product['stock_quantity']}"
+        print(f"✅ Released {len(held)} holds (twice) - stock back to {product['stock_quantity']}")
+    finally:
+        await client.drop_database(args.db)
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+# bench_stub_bot_api.py
+"""
+AnabolicPizza Shop - Stub Telegram Bot API for local benchmarks
+
+Answers the methods the bot uses with well-formed results after a
+configurable latency, serves queued updates to getUpdates and counts calls.
+Point the bot at it with Application.builder().base_url("http://127.0.0.1:8081/bot").
+
+Usage: python bench_stub_bot_api.py [--port 8081] [--latency-ms 40]
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {
+    "id": 100000001,
+    "is_bot": True,
+    "first_name": "BenchBot",
+    "username": "bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False
+}
+
+class StubBotAPI:
+    """Fake Bot API server - one instance per benchmark run"""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.calls = Counter()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.webhook_url = ""
+        self.runner = None
+
+    # ==================== UPDATES ====================
+
+    def make_message_update(self, user_id: int, text: str) -> dict:
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        message = {
+            "message_id": self._message_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"user{user_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def make_callback_update(self, user_id: int, data: str, message_id: int = 1) -> dict:
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(user_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private", "first_name": f"user{user_id}"},
+                    "from": BOT_USER,
+                    "text": "menu"
+                }
+            }
+        }
+
+    def reset_updates(self):
+        """Fresh update queue - a getUpdates left hanging by a stopped poller can't steal from it"""
+        self.updates = asyncio.Queue()
+
+    def push_update(self, update: dict):
+        """Queue an update for getUpdates (polling mode)"""
+        self.updates.put_nowait(update)
+
+    # ==================== METHODS ====================
+
+    def _message_id(self) -> int:
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        return message_id
+
+    def _sent_message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": self._message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": BOT_USER,
+            "text": params.get("text") or params.get("caption") or ""
+        }
+
+    async def _get_updates(self, params: dict):
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        offset = int(params.get("offset") or 0)
+
+        queue = self.updates
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(queue.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            return []
+        while len(updates) < limit and not queue.empty():
+            updates.append(queue.get_nowait())
+        return [u for u in updates if u["update_id"] >= offset]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+
+        params = {}
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                params = await request.json()
+            else:
+                params = dict(await request.post())
+                for key, value in params.items():
+                    if isinstance(value, str) and value[:1] in "[{":
+                        try:
+                            params[key] = json.loads(value)
+                        except ValueError:
+                            pass
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = ""
+            result = True
+        elif method == "getWebhookInfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in ("sendMessage", "sendPhoto", "sendVideo", "sendAnimation", "sendDocument"):
+            result = self._sent_message(params)
+        elif method in ("editMessageText", "editMessageCaption", "editMessageReplyMarkup"):
+            result = self._sent_message(params)
+            result["message_id"] = int(params.get("message_id", result["message_id"]))
+        else:
+            # answerCallbackQuery, deleteMessage(s), sendChatAction, setMyCommands, ...
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    # ==================== SERVER ====================
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+async def main():
+    parser = argparse.ArgumentParser(description="Stub Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    stub = StubBotAPI(args.latency_ms)
+    await stub.start(args.host, args.port)
+    print(f"Stub Bot API on http://{args.host}:{args.port}/bot<token>/<method> (latency {args.latency_ms}ms)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"calls: {dict(stub.calls)}")
+    finally:
+        await stub.stop()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
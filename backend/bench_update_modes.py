@@ -0,0 +1,136 @@
+# bench_update_modes.py
+"""
+AnabolicPizza Shop - Update processing benchmark
+Compares sequential long-polling (the old setup), concurrent long-polling and
+webhook delivery with UserOrderedUpdateProcessor. Runs against the stub Bot
+API; the handler simulates a Mongo round trip plus one reply, so numbers show
+how much per-update I/O wait the processing mode hides. Also checks that
+each user's updates were handled in the order they were sent.
+
+Usage: python bench_update_modes.py [--users 200] [--updates-per-user 10] [--api-latency-ms 40] [--db-latency-ms 15]
+"""
+
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+from bench_stub_bot_api import StubBotAPI
+from bot_modules.update_processor import UserOrderedUpdateProcessor
+
+STUB_PORT = 8081
+BENCH_TOKEN = "123456:bench"
+
+def build_app(concurrent: bool, workers: int) -> Application:
+    builder = (
+        Application.builder()
+        .token(BENCH_TOKEN)
+        .base_url(f"http://127.0.0.1:{STUB_PORT}/bot")
+        .connection_pool_size(workers + 8)
+        .get_updates_connection_pool_size(2)
+    )
+    if concurrent:
+        builder = builder.concurrent_updates(UserOrderedUpdateProcessor(workers))
+    return builder.build()
+
+async def run_mode(stub: StubBotAPI, mode: str, users: int, per_user: int, workers: int, db_latency: float):
+    concurrent = mode != "polling-sequential"
+    application = build_app(concurrent, workers)
+
+    total = users * per_user
+    done = asyncio.Event()
+    seen = defaultdict(list)
+    latencies = []
+    sent_at = {}
+
+    async def handler(update: Update, context):
+        await asyncio.sleep(db_latency)  # simulated Mongo lookup
+        await update.message.reply_text("ok")
+        seen[update.effective_user.id].append(int(update.message.text))
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+        if len(latencies) >= total:
+            done.set()
+
+    application.add_handler(MessageHandler(filters.TEXT, handler))
+    await application.initialize()
+    await application.start()
+
+    updates = []
+    for seq in range(per_user):
+        for user in range(users):
+            updates.append(stub.make_message_update(1000 + user, str(seq)))
+
+    start = time.perf_counter()
+    if mode.startswith("polling"):
+        stub.reset_updates()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        for raw in updates:
+            sent_at[raw["update_id"]] = time.perf_counter()
+            stub.push_update(raw)
+    else:
+        # What the FastAPI webhook route does for every POST
+        for raw in updates:
+            sent_at[raw["update_id"]] = time.perf_counter()
+            await application.update_queue.put(Update.de_json(raw, application.bot))
+
+    await asyncio.wait_for(done.wait(), timeout=600)
+    elapsed = time.perf_counter() - start
+    processor = application.update_processor
+    max_user_queue = processor.stats["max_user_queue"] if concurrent else "-"
+
+    if application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+
+    in_order = all(values == sorted(values) for values in seen.values())
+    latencies.sort()
+    return {
+        "mode": mode,
+        "updates": total,
+        "seconds": elapsed,
+        "throughput": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "max_user_queue": max_user_queue,
+        "in_order": in_order
+    }
+
+async def main():
+    global STUB_PORT
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates-per-user", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--api-latency-ms", type=float, default=40)
+    parser.add_argument("--db-latency-ms", type=float, default=15)
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--modes", default="polling-sequential,polling-concurrent,webhook-concurrent")
+    args = parser.parse_args()
+    STUB_PORT = args.port
+
+    stub = StubBotAPI(args.api_latency_ms)
+    await stub.start(port=STUB_PORT)
+
+    print(f"{args.users} users x {args.updates_per_user} updates, "
+          f"api latency {args.api_latency_ms}ms, db latency {args.db_latency_ms}ms, {args.workers} workers")
+    print(f"{'mode':<22}{'updates':>9}{'seconds':>10}{'upd/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'user q':>8}  ordered")
+
+    try:
+        for mode in args.modes.split(","):
+            result = await run_mode(
+                stub, mode.strip(), args.users, args.updates_per_user,
+                args.workers, args.db_latency_ms / 1000
+            )
+            print(f"{result['mode']:<22}{result['updates']:>9}{result['seconds']:>10.2f}"
+                  f"{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['max_user_queue']:>8}"
+                  f"  {'yes' if result['in_order'] else 'NO'}")
+    finally:
+        await stub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
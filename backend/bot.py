@@ -1,22 +1,28 @@
 import logging
 import asyncio
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+import os
+from telegram.ext import Application, CallbackQueryHandler, MessageHandler, TypeHandler, filters
 from telegram import Update
 
 from bot_modules.config import BOT_TOKEN
 from bot_modules.message_loader import message_loader
+from bot_modules.outbound_scheduler import outbound_scheduler, report_outbound_metrics
+from bot_modules.database import db
+from bot_modules.id_service import ensure_id_sequences
+from bot_modules.update_processor import UserOrderedUpdateProcessor, report_update_metrics
 from bot_modules.handlers import (
     handle_message, handle_group_command, handle_dynamic_command,
     start_command, shop_command, cart_command, orders_command, help_command,
-    request_command, closerequest_command, requests_command, clear_command
+    request_command, closerequest_command, requests_command, clear_command,
+    track_incoming_message
 )
 from bot_modules.callbacks import handle_callback
+from bot_modules.command_router import CommandRouter, CommandSpec
+from bot_modules.keyboards import keyboard_cache
 from bot_modules.support_handlers import (
     get_support_conversation_handler,
     mytickets_command,
-    closeticket_command,
-    view_ticket,
-    handle_ticket_reply
+    closeticket_command
 )
 
 try:
@@ -32,135 +38,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def start_background_tasks():
+async def start_background_tasks(application):
     if ANIMATION_SUPPORT and cleanup_old_messages:
         asyncio.create_task(cleanup_old_messages())
         logger.info("✅ Started message cleanup background task for smooth animations")
+    
+    asyncio.create_task(report_outbound_metrics(db))
+    asyncio.create_task(report_update_metrics(db, application.update_processor))
+    
+    message_loader.add_listener(refresh_command_table)
+    message_loader.add_listener(keyboard_cache.on_config_change)
+    asyncio.create_task(message_loader.watch_config())
+
+# Built-in commands - available even without bot_commands entries
+command_router = CommandRouter(
+    static_commands={
+        '/start': CommandSpec('/start', start_command),
+        '/help': CommandSpec('/help', help_command),
+        '/clear': CommandSpec('/clear', clear_command),
+        '/request': CommandSpec('/request', request_command, private_only=False),
+        '/closerequest': CommandSpec('/closerequest', closerequest_command, private_only=False),
+        '/requests': CommandSpec('/requests', requests_command),
+        '/mytickets': CommandSpec('/mytickets', mytickets_command),
+        '/closeticket': CommandSpec('/closeticket', closeticket_command)
+    },
+    core_handlers={
+        '/start': start_command,
+        '/shop': shop_command,
+        '/cart': cart_command,
+        '/orders': orders_command,
+        '/help': help_command,
+        '/clear': clear_command,
+        '/request': request_command,
+        '/closerequest': closerequest_command,
+        '/requests': requests_command
+    },
+    dynamic_handler=handle_dynamic_command,
+    group_redirect_handler=handle_group_command
+)
 
-async def register_dynamic_commands(application):
+async def refresh_command_table(collection):
+    """Config listener - rebuilds the command table after bot_commands changed"""
+    if collection in ("bot_commands", "all"):
+        command_router.rebuild(await message_loader.get_commands())
+
+async def register_dynamic_commands():
     try:
-        commands = await message_loader.load_commands()
+        commands = await message_loader.get_commands()
         
         logger.info(f"Loading {len(commands)} commands from database...")
         
-        registered_commands = set()
-        registered_group_commands = set()
-        
-        core_commands = {
-            '/start': start_command,
-            '/shop': shop_command,
-            '/cart': cart_command,
-            '/orders': orders_command,
-            '/help': help_command,
-            '/clear': clear_command,
-            '/request': request_command,
-            '/closerequest': closerequest_command,
-            '/requests': requests_command
-        }
-        
-        for command, data in commands.items():
-            command_name = command.replace('/', '')
-            
-            if command_name in registered_commands:
-                continue
-            
-            if not data.get('enabled', True):
-                logger.info(f"Skipping disabled command: /{command_name}")
-                continue
-            
-            if command in core_commands:
-                handler = core_commands[command]
-                logger.info(f"Using specific handler for core command: {command}")
-            else:
-                handler = handle_dynamic_command
-            
-            private_only = data.get('private_only', True)
-            group_redirect = data.get('group_redirect', True)
-            
-            logger.info(f"Registering /{command_name}: private_only={private_only}, group_redirect={group_redirect}")
-            
-            if private_only:
-                application.add_handler(CommandHandler(
-                    command_name, 
-                    handler, 
-                    filters=filters.ChatType.PRIVATE
-                ))
-                registered_commands.add(command_name)
-                logger.info(f"  ✓ Registered /{command_name} for PRIVATE chats")
-                
-                if group_redirect:
-                    application.add_handler(CommandHandler(
-                        command_name,
-                        handle_group_command,
-                        filters=filters.ChatType.GROUPS
-                    ))
-                    registered_group_commands.add(command_name)
-                    logger.info(f"  ✓ Added GROUP redirect for /{command_name}")
-            else:
-                application.add_handler(CommandHandler(
-                    command_name,
-                    handler
-                ))
-                registered_commands.add(command_name)
-                logger.info(f"  ✓ Registered /{command_name} for ALL chat types")
-            
-            for alias in data.get('aliases', []):
-                alias_name = alias.replace('/', '')
-                if alias_name not in registered_commands:
-                    alias_handler = core_commands.get(alias, handle_dynamic_command)
-                    
-                    if private_only:
-                        application.add_handler(CommandHandler(
-                            alias_name, 
-                            alias_handler, 
-                            filters=filters.ChatType.PRIVATE
-                        ))
-                        if group_redirect:
-                            application.add_handler(CommandHandler(
-                                alias_name,
-                                handle_group_command,
-                                filters=filters.ChatType.GROUPS
-                            ))
-                            registered_group_commands.add(alias_name)
-                    else:
-                        application.add_handler(CommandHandler(
-                            alias_name, 
-                            alias_handler
-                        ))
-                    registered_commands.add(alias_name)
-                    logger.info(f"    └─ Alias /{alias_name}")
-        
-        clear_handler = CommandHandler(
-            "clear",
-            clear_command,
-            filters=filters.ChatType.PRIVATE
-        )
-        application.add_handler(clear_handler)
-        
-        request_handler = CommandHandler(
-            "request",
-            request_command
-        )
-        application.add_handler(request_handler)
-        
-        closerequest_handler = CommandHandler(
-            "closerequest",
-            closerequest_command
-        )
-        application.add_handler(closerequest_handler)
-        
-        requests_handler = CommandHandler(
-            "requests",
-            requests_command,
-            filters=filters.ChatType.PRIVATE
-        )
-        application.add_handler(requests_handler)
-        
-        application.add_handler(get_support_conversation_handler())
-        application.add_handler(CommandHandler("mytickets", mytickets_command, filters=filters.ChatType.PRIVATE))
-        application.add_handler(CommandHandler("closeticket", closeticket_command, filters=filters.ChatType.PRIVATE))
+        total = command_router.rebuild(commands)
         
-        logger.info(f"✅ Registration complete: {len(registered_commands) + 6} commands including /support")
+        logger.info(f"✅ Registration complete: {total} commands and aliases")
         return True
         
     except Exception as e:
@@ -169,64 +99,21 @@ async def register_dynamic_commands(application):
         traceback.print_exc()
         return False
 
-def register_fallback_commands(application):
-    logger.warning("⚠️ Using fallback commands - database unavailable")
-    
-    application.add_handler(CommandHandler(
-        "start", 
-        start_command,
-        filters=filters.ChatType.PRIVATE
-    ))
-    
-    application.add_handler(CommandHandler(
-        "help", 
-        help_command,
-        filters=filters.ChatType.PRIVATE
-    ))
-    
-    application.add_handler(CommandHandler(
-        "clear",
-        clear_command,
-        filters=filters.ChatType.PRIVATE
-    ))
-    
-    application.add_handler(CommandHandler(
-        "request",
-        request_command
-    ))
-    
-    application.add_handler(CommandHandler(
-        "closerequest",
-        closerequest_command
-    ))
-    
-    application.add_handler(CommandHandler(
-        "requests",
-        requests_command,
-        filters=filters.ChatType.PRIVATE
-    ))
-    
-    application.add_handler(get_support_conversation_handler())
-    application.add_handler(CommandHandler("mytickets", mytickets_command, filters=filters.ChatType.PRIVATE))
-    application.add_handler(CommandHandler("closeticket", closeticket_command, filters=filters.ChatType.PRIVATE))
-    
-    logger.info("Registered 9 fallback commands including /support")
-
 async def post_init(application):
     try:
         logger.info("🔄 Loading configuration from database...")
         
         await message_loader.reload_all()
+        await ensure_id_sequences(db)
         
-        success = await register_dynamic_commands(application)
+        success = await register_dynamic_commands()
         
         if success:
             logger.info("✅ Successfully loaded commands from database")
         else:
-            logger.warning("⚠️ Failed to load commands, using minimal fallback")
-            register_fallback_commands(application)
+            logger.warning("⚠️ Failed to load commands, using built-in commands only")
         
-        await start_background_tasks()
+        await start_background_tasks(application)
         
         settings = await message_loader.load_settings()
         if settings.get('maintenance_mode'):
@@ -255,62 +142,63 @@ async def post_init(application):
         
     except Exception as e:
         logger.error(f"❌ Initialization error: {e}")
-        register_fallback_commands(application)
 
-async def reload_bot_config():
-    try:
-        logger.info("🔄 Reloading configuration...")
-        await message_loader.reload_all()
-        logger.info("✅ Configuration reloaded")
-        return True
-    except Exception as e:
-        logger.error(f"❌ Reload error: {e}")
-        return False
+def build_application(base_url: str = None, rate_limited: bool = True):
+    """Create the bot Application - used by polling (main), webhook mode in main.py
+    and bench_bot_load.py (base_url pointing at the stub Bot API)"""
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(UserOrderedUpdateProcessor())
+    )
+    if rate_limited:
+        builder = builder.rate_limiter(outbound_scheduler)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    
+    application.post_init = post_init
+    
+    application.add_handler(TypeHandler(Update, track_incoming_message), group=-1)
+    
+    application.add_handler(CallbackQueryHandler(handle_callback))
+    
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, 
+        handle_message
+    ))
+    
+    # /support conversation first, then every other command through one table lookup
+    application.add_handler(get_support_conversation_handler())
+    application.add_handler(MessageHandler(
+        filters.COMMAND & filters.UpdateType.MESSAGES,
+        command_router.dispatch
+    ))
+    
+    return application
 
 def main():
     if not BOT_TOKEN:
         logger.error("❌ BOT_TOKEN not found!")
         return
     
+    if os.getenv("TELEGRAM_WEBHOOK_URL"):
+        logger.error("❌ Webhook mode is enabled (TELEGRAM_WEBHOOK_URL) - updates are served by the API process")
+        return
+    
     try:
         logger.info("🚀 Creating bot application...")
-        application = Application.builder().token(BOT_TOKEN).build()
-        
-        application.post_init = post_init
-        
-        application.add_handler(CallbackQueryHandler(handle_callback))
-        
-        application.add_handler(CallbackQueryHandler(view_ticket, pattern="^view_ticket_"))
-        application.add_handler(CallbackQueryHandler(handle_ticket_reply, pattern="^reply_ticket_"))
-        application.add_handler(CallbackQueryHandler(handle_ticket_reply, pattern="^resolve_ticket_"))
-        
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, 
-            handle_message
-        ))
-        
-        job_queue = application.job_queue
-        if job_queue:
-            async def reload_job(context):
-                await reload_bot_config()
-            
-            job_queue.run_repeating(
-                reload_job,
-                interval=300,
-                first=300,
-                name='reload_config'
-            )
-            logger.info("📅 Auto-reload scheduled every 5 minutes")
+        application = build_application()
         
         logger.info("="*60)
         logger.info("🍕💪 AnabolicPizza Bot - WITH SUPPORT SYSTEM")
         logger.info("🔧 Dynamic Loading + Clear Chat + Product Requests + Support Tickets")
         logger.info("💫 Smooth payment status animations enabled!")
         logger.info("✅ Buttons will work after restart!")
-        logger.info("🧹 /clear command enabled")
+        logger.info("🧹 /clear command enabled (bulk deleteMessages)")
         logger.info("📝 /request, /closerequest, /requests enabled")
         logger.info("🎫 /support, /mytickets, /closeticket enabled")
-        logger.info("🔄 Auto-reload: 5 minutes")
+        logger.info("🔄 Live config: admin edits apply within a second")
         if ANIMATION_SUPPORT:
             logger.info("🎬 Animation support: ACTIVE")
         else:
@@ -334,6 +222,7 @@ if __name__ == "__main__":
     try:
         from motor.motor_asyncio import AsyncIOMotorClient
         from bot_modules.config import MONGODB_URI
+        from bot_modules.database import MONGODB_DB
         
         async def test_db():
             try:
@@ -341,7 +230,7 @@ if __name__ == "__main__":
                 await client.server_info()
                 logger.info("✅ Database connected")
                 
-                db = client.telegram_shop
+                db = client[MONGODB_DB]
                 commands = await db.bot_commands.find({}).to_list(100)
                 logger.info(f"📋 Found {len(commands)} commands in database")
                 
@@ -60,9 +60,9 @@ async def admin_view_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += "*Messages:*\n"
     text += "─" * 20 + "\n"
     
-    for msg in ticket.get("messages", [])[-5:]:
+    for msg in await get_ticket_messages(ticket["_id"], limit=5):
         sender = f"@{ticket['username']}" if msg["sender_type"] == "customer" else "Admin"
-        time = msg["timestamp"].strftime("%H:%M")
+        time = msg["created_at"].strftime("%H:%M")
         text += f"*{sender}* ({time}):\n{msg['message'][:200]}\n\n"
     
     keyboard = [
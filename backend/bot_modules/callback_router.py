@@ -0,0 +1,90 @@
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from bson import ObjectId
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+_ROUTE = ""  # trie key holding the route that ends at this node
+
+INVALID = object()  # parser result for malformed payloads
+
+def object_id(value: str):
+    """Payload parser - a Mongo id, as the string the handlers expect"""
+    return value if ObjectId.is_valid(value) else INVALID
+
+def upper(value: str):
+    return value.upper() if value else INVALID
+
+def non_empty(value: str):
+    return value if value else INVALID
+
+class CallbackRoute:
+    __slots__ = ("name", "callback", "parser")
+
+    def __init__(self, name: str, callback: Callable, parser: Optional[Callable] = None):
+        self.name = name
+        self.callback = callback
+        self.parser = parser
+
+class CallbackRouter:
+    """Dispatch table for inline button callback_data.
+
+    Exact values ("home", "cart") are one dict lookup. Prefixed values
+    ("cat_<id>", "qty_plus_<id>") walk a character trie over the data and
+    take the longest registered prefix, so "view_ticket_" wins over "view_"
+    regardless of registration order. Cost depends on the length of the
+    data, not on how many routes exist. The rest after the prefix goes
+    through the route's parser and is passed to the callback; routes without
+    a parser get just (update, context).
+    """
+
+    def __init__(self):
+        self.exact_routes: Dict[str, CallbackRoute] = {}
+        self.trie: Dict[str, Any] = {}
+
+    def exact(self, data: str, callback: Callable):
+        self.exact_routes[data] = CallbackRoute(data, callback)
+
+    def prefix(self, prefix: str, callback: Callable, parser: Optional[Callable] = None):
+        node = self.trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_ROUTE] = CallbackRoute(prefix, callback, parser)
+
+    def resolve(self, data: str) -> Tuple[Optional[CallbackRoute], Any]:
+        """(route, payload) - route is None when nothing matches"""
+        route = self.exact_routes.get(data)
+        if route is not None:
+            return route, None
+
+        node = self.trie
+        match, match_length = None, 0
+        for position, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if _ROUTE in node:
+                match, match_length = node[_ROUTE], position + 1
+
+        if match is None:
+            return None, None
+        if match.parser is None:
+            return match, None
+        return match, match.parser(data[match_length:])
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Run the matching callback. Returns False for unknown or malformed data"""
+        data = update.callback_query.data or ""
+        route, payload = self.resolve(data)
+
+        if route is None or payload is INVALID:
+            return False
+
+        if route.parser is None:
+            await route.callback(update, context)
+        else:
+            await route.callback(update, context, payload)
+        return True
@@ -10,6 +10,7 @@ from pathlib import Path
 import os
 import sys
 from datetime import datetime
+from bson import ObjectId
 
 try:
     from .message_updater import message_updater, status_animator
@@ -22,12 +23,14 @@ except ImportError:
 
 from .handlers import (
     start_command, show_categories, show_category_products, show_product_detail,
-    show_cart, help_command, user_states, user_context
+    show_cart, help_command, user_states, user_context, checkout_state
 )
 from .cart_manager import cart_manager
+from .order_items import order_item
+from .stock import reserve_stock, release_stock
 from .database import (
-    get_product_by_id, get_user_orders, create_order,
-    update_order_payment, get_order_by_id, apply_referral_code,
+    db, get_product_by_id, get_user_orders, create_order,
+    update_order_payment, get_order_by_id, apply_referral_code, release_referral_code,
     validate_referral_code, calculate_discount, get_user_stats
 )
 from .keyboards import (
@@ -36,110 +39,36 @@ from .keyboards import (
 )
 from .config import MESSAGES, CRYPTO_CURRENCIES
 from .public_notifications import public_notifier
+from .callback_router import CallbackRouter, INVALID, object_id, upper, non_empty
+from .support_handlers import (
+    view_ticket, handle_ticket_reply, show_user_tickets, support_command,
+    show_support_menu, handle_category_selection_callback
+)
 
 logger = logging.getLogger(__name__)
 
+callback_router = CallbackRouter()
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
+    if not await callback_router.dispatch(update, context):
+        logger.warning(f"Unknown callback data: {query.data}")
+        await query.answer("Unknown action", show_alert=False)
+
+async def handle_back_to_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    data = query.data
-    
-    if data == "home":
-        await start_command(update, context)
-    
-    elif data == "shop":
-        await show_categories(update, context)
-    
-    elif data == "cart":
-        await show_cart(update, context)
-    
-    elif data == "help":
-        await help_command(update, context)
-    
-    elif data == "orders":
-        await show_orders(update, context)
-    
-    elif data.startswith("cat_"):
-        category_id = data.replace("cat_", "")
+    category_id = (await user_context.get(user_id, {})).get("category_id")
+    if category_id:
         await show_category_products(update, context, category_id)
+    else:
+        await show_categories(update, context)
+
+async def show_support_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
     
-    elif data.startswith("view_ticket_"):
-        from .support_handlers import view_ticket
-        await view_ticket(update, context)
-    
-    elif data.startswith("reply_ticket_"):
-        from .support_handlers import handle_ticket_reply
-        await handle_ticket_reply(update, context)
-    
-    elif data.startswith("resolve_ticket_"):
-        from .support_handlers import handle_ticket_reply
-        await handle_ticket_reply(update, context)
-    
-    elif data.startswith("view_") and not data.startswith("view_ticket_"):
-        product_id = data.replace("view_", "")
-        await show_product_detail(update, context, product_id)
-    
-    elif data == "my_tickets":
-        from .support_handlers import show_user_tickets
-        await show_user_tickets(update, context)
-    
-    elif data == "create_ticket":
-        from .support_handlers import support_command
-        await support_command(update, context)
-    
-    elif data.startswith("view_") and not data.startswith("view_ticket_"):
-        product_id = data.replace("view_", "")
-        await show_product_detail(update, context, product_id)
-    
-    elif data == "back_to_category":
-        category_id = user_context.get(user_id, {}).get("category_id")
-        if category_id:
-            await show_category_products(update, context, category_id)
-        else:
-            await show_categories(update, context)
-    
-    elif data.startswith("qty_"):
-        await handle_quantity_change(update, context, data)
-    
-    elif data.startswith("add_"):
-        await handle_add_to_cart(update, context, data)
-    
-    elif data == "clear_cart":
-        await handle_clear_cart(update, context)
-    
-    elif data == "checkout_start":
-        await handle_checkout_start(update, context)
-    
-    elif data == "select_country":
-        await handle_select_country(update, context)
-    
-    elif data.startswith("country_"):
-        await handle_country_selection(update, context, data)
-    
-    elif data == "skip_referral":
-        await handle_skip_referral(update, context)
-    
-    elif data.startswith("pay_"):
-        await handle_payment(update, context, data)
-    
-    elif data.startswith("retry_pay_"):
-        await handle_retry_payment(update, context, data)
-    
-    elif data.startswith("check_pay_"):
-        await handle_check_payment(update, context, data)
-        
-    elif data == "support_menu":
-        from .support_handlers import show_support_menu
-        await show_support_menu(update, context)
-    
-    elif data.startswith("ticket_cat_"):
-        from .support_handlers import handle_category_selection_callback
-        await handle_category_selection_callback(update, context)
-    
-    elif data == "support":
-        support_text = """
+    support_text = """
 💬 *NEED HELP?*
 
 *Contact Support:*
@@ -154,51 +83,36 @@ Include your order number when contacting!
 
 _"We're here to help you get massive!"_ 💪
 """
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🏠 Main Menu", callback_data="home")],
-            [InlineKeyboardButton("📦 My Orders", callback_data="orders")]
-        ])
-        await query.edit_message_text(support_text, reply_markup=keyboard, parse_mode='Markdown')
-    
-    elif data == "payment_help":
-        await show_payment_help(update, context)
-    
-    elif data == "cancel_order":
-        await handle_cancel_order(update, context)
-    
-    elif data.startswith("fake_pay_"):
-        order_id = data.replace("fake_pay_", "")
-        await query.edit_message_text(
-            "⚠️ *Payment system is currently in maintenance mode*\n\n"
-            "The cryptocurrency payment gateway is temporarily unavailable.\n\n"
-            "Please try again later or contact support for manual payment options.",
-            parse_mode='Markdown',
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("💳 Try Different Payment", callback_data="skip_referral")],
-                [InlineKeyboardButton("💬 Contact Support", callback_data="support")],
-                [InlineKeyboardButton("🏠 Main Menu", callback_data="home")]
-            ])
-        )
-    
-    elif data.startswith("ticket_cat_"):
-        from .support_handlers import handle_category_selection
-        context.user_data['support_callback_data'] = data
-        await handle_category_selection(update, context)
-    
-    elif data == "my_tickets":
-        from .support_handlers import show_user_tickets
-        await show_user_tickets(update, context)
-    
-    elif data == "create_ticket":
-        from .support_handlers import support_command
-        await support_command(update, context)
-    
-    elif data == "noop":
-        pass
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🏠 Main Menu", callback_data="home")],
+        [InlineKeyboardButton("📦 My Orders", callback_data="orders")]
+    ])
+    await query.edit_message_text(support_text, reply_markup=keyboard, parse_mode='Markdown')
+
+async def show_payment_maintenance(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: str):
+    query = update.callback_query
     
-    else:
-        logger.warning(f"Unknown callback data: {data}")
-        await query.answer("Unknown action", show_alert=False)
+    await query.edit_message_text(
+        "⚠️ *Payment system is currently in maintenance mode*\n\n"
+        "The cryptocurrency payment gateway is temporarily unavailable.\n\n"
+        "Please try again later or contact support for manual payment options.",
+        parse_mode='Markdown',
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("💳 Try Different Payment", callback_data="skip_referral")],
+            [InlineKeyboardButton("💬 Contact Support", callback_data="support")],
+            [InlineKeyboardButton("🏠 Main Menu", callback_data="home")]
+        ])
+    )
+
+async def handle_noop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    pass
+
+def parse_retry_payment(value: str):
+    """retry_pay_<method>_<order_id> -> (METHOD, order_id or None)"""
+    method, _, order_id = value.partition("_")
+    if not method:
+        return INVALID
+    return method.upper(), order_id or None
 
 async def show_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -228,20 +142,11 @@ async def show_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
-async def handle_quantity_change(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+async def handle_quantity_change(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: str, adjustment: int):
     query = update.callback_query
     user_id = update.effective_user.id
     
-    if "minus" in data:
-        product_id = data.replace("qty_minus_", "")
-        adjustment = -1
-    elif "plus" in data:
-        product_id = data.replace("qty_plus_", "")
-        adjustment = 1
-    else:
-        return
-    
-    new_qty = cart_manager.adjust_quantity(user_id, product_id, adjustment)
+    new_qty = await cart_manager.adjust_quantity(user_id, product_id, adjustment)
     
     if adjustment < 0 and new_qty == 1:
         await query.answer("Minimum quantity is 1!", show_alert=False)
@@ -252,20 +157,19 @@ async def handle_quantity_change(update: Update, context: ContextTypes.DEFAULT_T
     
     await show_product_detail(update, context, product_id)
 
-async def handle_add_to_cart(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+async def handle_add_to_cart(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: str):
     query = update.callback_query
     user_id = update.effective_user.id
-    product_id = data.replace("add_", "")
     
     product = await get_product_by_id(product_id)
     if not product:
         await query.answer("Product not found!", show_alert=True)
         return
     
-    quantity = cart_manager.get_quantity(user_id, product_id)
-    cart_manager.add_to_cart(user_id, product_id, product, quantity)
+    quantity = await cart_manager.get_quantity(user_id, product_id)
+    await cart_manager.add_to_cart(user_id, product_id, quantity)
     
-    total = cart_manager.get_cart_total(user_id)
+    total = await cart_manager.get_cart_total(user_id)
     
     success_text = MESSAGES.get("product_added", "").format(
         quantity=quantity,
@@ -292,7 +196,7 @@ async def handle_clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = update.effective_user.id
     
-    cart_manager.clear_cart(user_id)
+    await cart_manager.clear_cart(user_id)
     
     await query.edit_message_text(
         "🗑️ *Cart Cleared!*\n\n"
@@ -308,7 +212,7 @@ async def handle_clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_checkout_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = update.effective_user.id
-    cart = cart_manager.get_cart(user_id)
+    cart = await cart_manager.get_cart(user_id)
     
     if not cart:
         await query.edit_message_text(
@@ -317,10 +221,11 @@ async def handle_checkout_start(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return
     
-    total = cart_manager.get_cart_total(user_id)
-    context.user_data['checkout_cart'] = cart
-    context.user_data['checkout_total'] = total
-    context.user_data['checkout_message_id'] = query.message.message_id
+    total = cart_manager.cart_total(cart)
+    await checkout_state.update(
+        user_id, checkout_cart=cart, checkout_total=total,
+        checkout_message_id=query.message.message_id
+    )
     
     order_summary = ""
     for product_id, item in cart.items():
@@ -346,13 +251,12 @@ async def handle_select_country(update: Update, context: ContextTypes.DEFAULT_TY
     
     await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
-async def handle_country_selection(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+async def handle_country_selection(update: Update, context: ContextTypes.DEFAULT_TYPE, country: str):
     query = update.callback_query
     user_id = update.effective_user.id
     
-    country = data.replace("country_", "")
-    context.user_data['delivery_country'] = country
-    user_states[user_id] = "waiting_city"
+    await checkout_state.update(user_id, delivery_country=country)
+    await user_states.set(user_id, "waiting_city")
     
     await query.edit_message_text(
         f"✅ *Country:* {country}\n\n" + MESSAGES.get("ask_city", "Now enter your city:"),
@@ -361,27 +265,30 @@ async def handle_country_selection(update: Update, context: ContextTypes.DEFAULT
 
 async def handle_skip_referral(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
+    user_id = update.effective_user.id
     
-    context.user_data['referral_code'] = None
-    context.user_data['discount_amount'] = 0
-    context.user_data['final_total'] = context.user_data.get('checkout_total', 0)
+    checkout = await checkout_state.get(user_id, {})
+    await checkout_state.update(
+        user_id, referral_code=None, discount_amount=0,
+        final_total=checkout.get('checkout_total', 0)
+    )
     
     text = MESSAGES.get("payment_select", "💳 *SELECT PAYMENT METHOD*")
     keyboard = get_payment_keyboard()
     
     await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
-async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, payment_data: str):
+async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, payment_method: str):
     query = update.callback_query
-    payment_method = payment_data.replace("pay_", "").upper()
     
     user_id = update.effective_user.id
-    cart = context.user_data.get('checkout_cart', {})
-    country = context.user_data.get('delivery_country', 'Unknown')
-    city = context.user_data.get('delivery_city', 'Unknown')
-    total = context.user_data.get('final_total', context.user_data.get('checkout_total', 0))
-    referral_code = context.user_data.get('referral_code')
-    discount_amount = context.user_data.get('discount_amount', 0)
+    checkout = await checkout_state.get(user_id, {})
+    cart = checkout.get('checkout_cart', {})
+    country = checkout.get('delivery_country', 'Unknown')
+    city = checkout.get('delivery_city', 'Unknown')
+    total = checkout.get('final_total', checkout.get('checkout_total', 0))
+    referral_code = checkout.get('referral_code')
+    discount_amount = checkout.get('discount_amount', 0)
     
     minimum_amounts = {
         "BTC": 5.0,
@@ -415,36 +322,86 @@ async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, pay
         parse_mode='Markdown'
     )
     
-    order_items = []
-    for product_id, item in cart.items():
-        order_items.append({
-            "product_name": item['name'],
-            "quantity": item['quantity'],
-            "price_usdt": item['price'],
-            "subtotal_usdt": item['price'] * item['quantity']
-        })
-    
-    order_data = {
-        "telegram_id": user_id,
-        "items": order_items,
-        "total_usdt": total,
-        "delivery_country": country,
-        "delivery_city": city,
-        "referral_code": referral_code,
-        "discount_amount": discount_amount,
-        "payment": {
-            "method": payment_method,
-            "amount_usdt": total,
-            "status": "pending"
-        },
-        "status": "pending"
-    }
+    order_items = [order_item(product_id, item) for product_id, item in cart.items()]
     
-    order_id = await create_order(order_data)
-    order = await get_order_by_id(order_id)
+    # Hold the stock before the order exists - nobody else can buy these units meanwhile
+    new_order_id = ObjectId()
+    shortfall = await reserve_stock(db, new_order_id, order_items)
+    if shortfall:
+        if shortfall['available']:
+            stock_text = f"only {shortfall['available']} left, you wanted {shortfall['requested']}."
+        else:
+            stock_text = "sold out."
+        await query.edit_message_text(
+            f"😔 *Not enough stock*\n\n*{shortfall['name']}*: {stock_text}\n\n"
+            f"Please adjust your cart and try again.",
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🛒 View Cart", callback_data="cart")],
+                [InlineKeyboardButton("🏠 Main Menu", callback_data="home")]
+            ])
+        )
+        return
+    
+    redeemed = False
+    try:
+        # Redeem the code now - the limit check and the use are one update
+        if referral_code:
+            redeemed = await apply_referral_code(referral_code) is not None
+        if referral_code and not redeemed:
+            await release_stock(db, new_order_id, "referral_unavailable")
+            checkout = await checkout_state.update(
+                user_id, referral_code=None, discount_amount=0,
+                final_total=checkout.get('checkout_total', 0)
+            )
+            await query.edit_message_text(
+                f"⚠️ *Code {referral_code} is no longer available*\n\n"
+                f"It was just used up or expired. Your total without it: "
+                f"${checkout['final_total']:.2f}\n\n"
+                + MESSAGES.get("payment_select", "💳 *SELECT PAYMENT METHOD*"),
+                parse_mode='Markdown',
+                reply_markup=get_payment_keyboard()
+            )
+            return
+        
+        order_data = {
+            "_id": new_order_id,
+            "telegram_id": user_id,
+            "items": order_items,
+            "total_usdt": total,
+            "delivery_country": country,
+            "delivery_city": city,
+            "referral_code": referral_code,
+            "discount_amount": discount_amount,
+            "payment": {
+                "method": payment_method,
+                "amount_usdt": total,
+                "status": "pending"
+            },
+            "status": "pending"
+        }
+        
+        order_id = await create_order(order_data)
+        order = await get_order_by_id(order_id)
+    except Exception as e:
+        # No payment will come for this - give back the stock and the code use
+        logger.error(f"Failed to create order for user {user_id}: {e}")
+        await release_stock(db, new_order_id, "order_not_created")
+        if redeemed:
+            await release_referral_code(referral_code)
+        await query.edit_message_text(
+            "❌ *Could not create your order*\n\nNothing was charged. Please try again in a moment.",
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🛒 View Cart", callback_data="cart")],
+                [InlineKeyboardButton("🏠 Main Menu", callback_data="home")]
+            ])
+        )
+        return
     
-    context.user_data['current_order_number'] = order['order_number']
-    context.user_data['current_order_id'] = str(order_id)
+    await checkout_state.update(
+        user_id, current_order_number=order['order_number'], current_order_id=str(order_id)
+    )
     
     payment_created = False
     payment_error_reason = "Unknown error"
@@ -496,17 +453,14 @@ async def handle_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, pay
                     "pay_currency": payment_result["pay_currency"]
                 }, query.message.message_id)
                 
-                cart_manager.clear_cart(user_id)
+                await cart_manager.clear_cart(user_id)
                 
-                if referral_code:
-                    await apply_referral_code(referral_code)
-                
-                context.user_data['payment_details'] = {
+                await checkout_state.update(user_id, payment_details={
                     'payment_id': payment_result["payment_id"],
                     'address': payment_result["pay_address"],
                     'amount': f"{payment_result['pay_amount']:.8f}",
                     'currency': payment_result["pay_currency"].upper()
-                }
+                })
                 
                 payment_text = f"""
 💰 *PAYMENT INSTRUCTIONS*
@@ -582,6 +536,10 @@ Amount: **${total:.2f}**
     
     if not payment_created:
         logger.warning(f"Payment creation failed for order {order['order_number']}: {payment_error_reason}")
+        # Retrying creates a new order with its own hold and redemption
+        await release_stock(db, order_id, "payment_not_created")
+        if referral_code:
+            await release_referral_code(referral_code)
         
         if "API key not configured" in payment_error_reason:
             error_title = "⚠️ *PAYMENT GATEWAY NOT CONFIGURED*"
@@ -618,28 +576,26 @@ Your order has been saved and you can retry payment anytime.
         
         await query.edit_message_text(error_text, reply_markup=keyboard, parse_mode='Markdown')
 
-async def handle_retry_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+async def handle_retry_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, retry: tuple):
     query = update.callback_query
-    parts = data.replace("retry_pay_", "").split("_")
-    payment_method = parts[0].upper()
-    order_id = "_".join(parts[1:]) if len(parts) > 1 else None
+    payment_method, order_id = retry
     
     if order_id:
         order = await get_order_by_id(order_id)
         if order:
-            context.user_data['current_order_id'] = order_id
-            context.user_data['current_order_number'] = order['order_number']
-            context.user_data['final_total'] = order['total_usdt']
+            await checkout_state.update(
+                update.effective_user.id, current_order_id=order_id,
+                current_order_number=order['order_number'], final_total=order['total_usdt']
+            )
             
-            await handle_payment(update, context, f"pay_{payment_method.lower()}")
+            await handle_payment(update, context, payment_method)
         else:
             await query.answer("Order not found!", show_alert=True)
     else:
         await query.answer("Invalid retry request", show_alert=True)
 
-async def handle_check_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+async def handle_check_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, payment_id: str):
     query = update.callback_query
-    payment_id = data.replace("check_pay_", "")
     
     await query.answer("Checking payment status...", show_alert=False)
     
@@ -651,7 +607,8 @@ async def handle_check_payment(update: Update, context: ContextTypes.DEFAULT_TYP
             status = await payment_gateway.check_payment_status(payment_id)
             
             if status and status.get("payment_status") == "finished":
-                order_number = context.user_data.get('current_order_number', 'YOUR-ORDER')
+                checkout = await checkout_state.get(update.effective_user.id, {})
+                order_number = checkout.get('current_order_number', 'YOUR-ORDER')
                 
                 success_text = f"""
 ✅ *PAYMENT CONFIRMED!*
@@ -727,8 +684,11 @@ async def handle_cancel_order(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     user_id = update.effective_user.id
     
-    user_states.pop(user_id, None)
-    context.user_data.clear()
+    await user_states.pop(user_id, None)
+    checkout = await checkout_state.pop(user_id, {})
+    order_id = checkout.get('current_order_id')
+    if order_id:
+        await release_stock(db, order_id, "cancelled")
     
     await query.edit_message_text(
         "❌ *Order Cancelled*\n\n"
@@ -897,13 +857,15 @@ Amount: **${price_amount:.2f}**
                         message_text += f"\n💳 Received: {percent:.1f}% ({paid:.8f}/{total:.8f})"
             
             if message_id and current_status not in ["finished", "failed", "expired"]:
+                # Don't wait for delivery - if Telegram is slow only the newest frame goes out
                 await message_updater.update_message(
                     bot=bot,
                     chat_id=telegram_id,
                     message_id=message_id,
                     text=message_text,
                     reply_markup=keyboard,
-                    parse_mode='Markdown'
+                    parse_mode='Markdown',
+                    wait=False
                 )
                 last_animation_update = elapsed_time
         
@@ -1094,3 +1056,40 @@ async def update_order_payment_details(order_id: str, payment_details: dict, mes
         {"_id": ObjectId(order_id)},
         {"$set": update_data}
     )
+
+# ==================== CALLBACK ROUTES ====================
+
+callback_router.exact("home", start_command)
+callback_router.exact("shop", show_categories)
+callback_router.exact("cart", show_cart)
+callback_router.exact("help", help_command)
+callback_router.exact("orders", show_orders)
+callback_router.exact("back_to_category", handle_back_to_category)
+callback_router.exact("clear_cart", handle_clear_cart)
+callback_router.exact("checkout_start", handle_checkout_start)
+callback_router.exact("select_country", handle_select_country)
+callback_router.exact("skip_referral", handle_skip_referral)
+callback_router.exact("payment_help", show_payment_help)
+callback_router.exact("cancel_order", handle_cancel_order)
+callback_router.exact("support", show_support_contact)
+callback_router.exact("support_menu", show_support_menu)
+callback_router.exact("my_tickets", show_user_tickets)
+callback_router.exact("create_ticket", support_command)
+callback_router.exact("noop", handle_noop)
+
+callback_router.prefix("cat_", show_category_products, object_id)
+callback_router.prefix("view_", show_product_detail, object_id)
+callback_router.prefix("qty_minus_", lambda update, context, product_id: handle_quantity_change(update, context, product_id, -1), object_id)
+callback_router.prefix("qty_plus_", lambda update, context, product_id: handle_quantity_change(update, context, product_id, 1), object_id)
+callback_router.prefix("add_", handle_add_to_cart, object_id)
+callback_router.prefix("country_", handle_country_selection, non_empty)
+callback_router.prefix("pay_", handle_payment, upper)
+callback_router.prefix("retry_pay_", handle_retry_payment, parse_retry_payment)
+callback_router.prefix("check_pay_", handle_check_payment, non_empty)
+callback_router.prefix("fake_pay_", show_payment_maintenance, non_empty)
+
+# Support tickets - these handlers read query.data themselves
+callback_router.prefix("view_ticket_", view_ticket)
+callback_router.prefix("reply_ticket_", handle_ticket_reply)
+callback_router.prefix("resolve_ticket_", handle_ticket_reply)
+callback_router.prefix("ticket_cat_", handle_category_selection_callback)
@@ -1,62 +1,87 @@
 """
 Shopping cart management
 """
-from typing import Dict, Optional
+from typing import Dict
+from bson import ObjectId
+
+from .database import db
+from .session_store import session_store
+
+MAX_QUANTITY = 50
 
 class CartManager:
-    """Manage user shopping carts"""
-    
+    """Manage user shopping carts
+
+    Carts live in the session store as {product_id: quantity}; names and
+    prices are resolved from the catalog when the cart is read.
+    """
+
     def __init__(self):
-        self.user_carts: Dict[int, Dict] = {}
-        self.user_quantities: Dict[int, Dict] = {}
-    
-    def get_cart(self, user_id: int) -> Dict:
-        """Get user cart"""
-        return self.user_carts.get(user_id, {})
-    
-    def add_to_cart(self, user_id: int, product_id: str, product_data: dict, quantity: int) -> None:
+        self.carts = session_store.namespace("cart")
+        self.quantities = session_store.namespace("cart_qty")
+
+    async def _resolve(self, items: Dict[str, int]) -> Dict:
+        ids = [ObjectId(pid) for pid in items if ObjectId.is_valid(pid)]
+        if not ids:
+            return {}
+
+        products = await db.products.find(
+            {"_id": {"$in": ids}, "is_active": True},
+            {"name": 1, "price_usdt": 1, "category_id": 1, "purchase_price_usdt": 1}
+        ).to_list(len(ids))
+        by_id = {str(p["_id"]): p for p in products}
+
+        cart = {}
+        for product_id, quantity in items.items():
+            product = by_id.get(product_id)
+            if product:
+                cart[product_id] = {
+                    'name': product['name'],
+                    'price': float(product['price_usdt']),
+                    'quantity': quantity,
+                    'category_id': str(product['category_id']) if product.get('category_id') else None,
+                    'purchase_price': float(product.get('purchase_price_usdt', 0))
+                }
+        return cart
+
+    async def get_cart(self, user_id: int) -> Dict:
+        """Get user cart with names and prices from the catalog"""
+        return await self._resolve(await self.carts.get(user_id, {}))
+
+    async def add_to_cart(self, user_id: int, product_id: str, quantity: int) -> None:
         """Add product to cart"""
-        if user_id not in self.user_carts:
-            self.user_carts[user_id] = {}
-        
-        if product_id in self.user_carts[user_id]:
-            self.user_carts[user_id][product_id]['quantity'] += quantity
-        else:
-            self.user_carts[user_id][product_id] = {
-                'name': product_data['name'],
-                'price': float(product_data['price_usdt']),
-                'quantity': quantity
-            }
-    
-    def clear_cart(self, user_id: int) -> None:
+        items = await self.carts.get(user_id, {})
+        items[product_id] = items.get(product_id, 0) + quantity
+        await self.carts.set(user_id, items)
+
+    async def clear_cart(self, user_id: int) -> None:
         """Clear user cart"""
-        if user_id in self.user_carts:
-            self.user_carts[user_id] = {}
-    
-    def get_cart_total(self, user_id: int) -> float:
-        """Calculate cart total"""
-        cart = self.get_cart(user_id)
+        await self.carts.set(user_id, None)
+
+    def cart_total(self, cart: Dict) -> float:
+        """Total of an already resolved cart"""
         return sum(item['price'] * item['quantity'] for item in cart.values())
-    
-    def get_quantity(self, user_id: int, product_id: str) -> int:
+
+    async def get_cart_total(self, user_id: int) -> float:
+        """Calculate cart total"""
+        return self.cart_total(await self.get_cart(user_id))
+
+    async def get_quantity(self, user_id: int, product_id: str) -> int:
         """Get selected quantity for product"""
-        if user_id not in self.user_quantities:
-            self.user_quantities[user_id] = {}
-        if product_id not in self.user_quantities[user_id]:
-            self.user_quantities[user_id][product_id] = 1
-        return self.user_quantities[user_id][product_id]
-    
-    def set_quantity(self, user_id: int, product_id: str, quantity: int) -> None:
+        quantities = await self.quantities.get(user_id, {})
+        return quantities.get(product_id, 1)
+
+    async def set_quantity(self, user_id: int, product_id: str, quantity: int) -> None:
         """Set quantity for product"""
-        if user_id not in self.user_quantities:
-            self.user_quantities[user_id] = {}
-        self.user_quantities[user_id][product_id] = max(1, min(50, quantity))
-    
-    def adjust_quantity(self, user_id: int, product_id: str, adjustment: int) -> int:
+        quantities = await self.quantities.get(user_id, {})
+        quantities[product_id] = max(1, min(MAX_QUANTITY, quantity))
+        await self.quantities.set(user_id, quantities)
+
+    async def adjust_quantity(self, user_id: int, product_id: str, adjustment: int) -> int:
         """Adjust quantity by amount"""
-        current = self.get_quantity(user_id, product_id)
-        new_qty = max(1, min(50, current + adjustment))
-        self.set_quantity(user_id, product_id, new_qty)
+        current = await self.get_quantity(user_id, product_id)
+        new_qty = max(1, min(MAX_QUANTITY, current + adjustment))
+        await self.set_quantity(user_id, product_id, new_qty)
         return new_qty
 
 # Global cart manager instance
@@ -0,0 +1,103 @@
+import logging
+from typing import Callable, Dict, Optional
+
+from telegram import Update
+from telegram.constants import ChatType
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+class CommandSpec:
+    __slots__ = ("command", "callback", "private_only", "group_redirect")
+
+    def __init__(self, command: str, callback: Callable, private_only: bool = True, group_redirect: bool = False):
+        self.command = command
+        self.callback = callback
+        self.private_only = private_only
+        self.group_redirect = group_redirect
+
+class CommandRouter:
+    """Resolves every /command with one dict lookup.
+
+    Registered as a single MessageHandler(filters.COMMAND). The table maps
+    command and alias names to a CommandSpec; rebuild() swaps in a new table
+    when bot_commands change, so handlers are never re-registered at runtime.
+    Built-in commands are defaults - a bot_commands entry with the same name
+    overrides their chat rules.
+    """
+
+    def __init__(
+        self,
+        static_commands: Dict[str, CommandSpec],
+        core_handlers: Dict[str, Callable],
+        dynamic_handler: Callable,
+        group_redirect_handler: Callable
+    ):
+        self.static_commands = static_commands
+        self.core_handlers = core_handlers
+        self.dynamic_handler = dynamic_handler
+        self.group_redirect_handler = group_redirect_handler
+        self.table: Dict[str, CommandSpec] = dict(static_commands)
+
+    def rebuild(self, commands: Dict[str, dict]) -> int:
+        """Build the lookup table from MessageLoader commands and swap it in"""
+        table: Dict[str, CommandSpec] = {}
+
+        for command, data in commands.items():
+            name = command.lower()
+            if name in table or not data.get('enabled', True):
+                continue
+
+            private_only = data.get('private_only', True)
+            group_redirect = data.get('group_redirect', True)
+            table[name] = CommandSpec(
+                name, self.core_handlers.get(name, self.dynamic_handler), private_only, group_redirect
+            )
+
+            for alias in data.get('aliases', []):
+                alias = alias.lower()
+                if alias not in table:
+                    table[alias] = CommandSpec(
+                        alias, self.core_handlers.get(alias, self.dynamic_handler), private_only, group_redirect
+                    )
+
+        for name, spec in self.static_commands.items():
+            table.setdefault(name, spec)
+
+        self.table = table
+        logger.info(f"✅ Command table: {len(table)} commands and aliases")
+        return len(table)
+
+    def resolve(self, text: str, bot_username: Optional[str]) -> Optional[CommandSpec]:
+        command = text.split(maxsplit=1)[0].lower()
+        command, _, target = command.partition('@')
+        if target and bot_username and target != bot_username.lower():
+            # Addressed to another bot in the group
+            return None
+        return self.table.get(command)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = update.effective_message
+        if not message or not message.text:
+            return
+
+        spec = self.resolve(message.text, context.bot.username)
+        if spec is None:
+            return
+
+        chat_type = update.effective_chat.type
+        if chat_type == ChatType.PRIVATE:
+            callback = spec.callback
+        elif chat_type in (ChatType.GROUP, ChatType.SUPERGROUP):
+            if not spec.private_only:
+                callback = spec.callback
+            elif spec.group_redirect:
+                callback = self.group_redirect_handler
+            else:
+                return
+        else:
+            return
+
+        # What CommandHandler would have provided
+        context.args = message.text.split()[1:]
+        await callback(update, context)
@@ -2,19 +2,16 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 from bson import ObjectId
 import secrets
-import random
 from typing import Dict, List, Optional
 from .config import MONGODB_URI
+from .id_service import next_custom_order_id, insert_with_sequence
+from .database import MONGODB_DB
 
 mongo_client = AsyncIOMotorClient(MONGODB_URI)
-db = mongo_client.telegram_shop
+db = mongo_client[MONGODB_DB]
 
 async def generate_custom_order_id() -> int:
-    while True:
-        order_id = random.randint(1000, 9999)
-        existing = await db.custom_orders.find_one({"custom_id": order_id})
-        if not existing:
-            return order_id
+    return await next_custom_order_id(db)
 
 async def create_custom_order(telegram_id: int, username: str, product_text: str, first_name: str = None, last_name: str = None) -> dict:
     user_pending = await db.custom_orders.count_documents({
@@ -25,10 +22,7 @@ async def create_custom_order(telegram_id: int, username: str, product_text: str
     if user_pending >= 3:
         return {"error": "limit_reached"}
     
-    custom_id = await generate_custom_order_id()
-    
     order_data = {
-        "custom_id": custom_id,
         "telegram_id": telegram_id,
         "username": username,
         "first_name": first_name,
@@ -39,7 +33,7 @@ async def create_custom_order(telegram_id: int, username: str, product_text: str
         "updated_at": datetime.utcnow()
     }
     
-    result = await db.custom_orders.insert_one(order_data)
+    result = await insert_with_sequence(db.custom_orders, order_data, "custom_id", generate_custom_order_id)
     order_data["_id"] = str(result.inserted_id)
     return order_data
 
@@ -3,20 +3,25 @@ Enhanced database operations with categories, referral codes and VIP support
 """
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
+import os
 from bson import ObjectId
 import secrets
 from typing import Dict, List, Optional
 from .config import MONGODB_URI
+from .seller_ledger import accrue_order_commission
+from .order_items import increment_sold_counts
+from .stock import commit_stock
+from .referrals import validate_code, redeem_code, unredeem_code
+from .id_service import next_order_number, insert_with_sequence
 
-# Database connection
+# Database connection - MONGODB_DB points the bot at another database (benchmarks)
+MONGODB_DB = os.getenv("MONGODB_DB", "telegram_shop")
 mongo_client = AsyncIOMotorClient(MONGODB_URI)
-db = mongo_client.telegram_shop
+db = mongo_client[MONGODB_DB]
 
 async def generate_order_number() -> str:
-    """Generate random order number"""
-    part1 = secrets.token_hex(2).upper()
-    part2 = secrets.token_hex(2).upper()
-    return f"APZ-{part1}-{part2}"
+    """Next order number from the id service"""
+    return await next_order_number(db)
 
 async def create_or_update_user(user_data: dict) -> dict:
     """Create or update user in database"""
@@ -87,26 +92,27 @@ async def get_category_by_id(category_id: str) -> Optional[dict]:
 
 # Product Functions
 async def get_products_by_category(category_id: str, limit: int = 20, vip_discount: float = 0) -> List[dict]:
-    """Get active products in a category with VIP pricing"""
-    try:
-        products = await db.products.find({
-            "category_id": ObjectId(category_id),
-            "is_active": True
-        }).limit(limit).to_list(limit)
-        
-        # Apply VIP discount to prices
-        for product in products:
-            original_price = float(product.get("price_usdt", 0))
-            if vip_discount > 0:
-                product["original_price"] = original_price
-                product["price_usdt"] = await calculate_vip_price(original_price, vip_discount)
-                product["has_vip_discount"] = True
-            else:
-                product["has_vip_discount"] = False
-                
-        return products
-    except:
+    """Get active products in a category with VIP pricing. Database errors
+    propagate - an empty list means the category really has no products"""
+    if not ObjectId.is_valid(category_id):
         return []
+    
+    products = await db.products.find({
+        "category_id": ObjectId(category_id),
+        "is_active": True
+    }).limit(limit).to_list(limit)
+    
+    # Apply VIP discount to prices
+    for product in products:
+        original_price = float(product.get("price_usdt", 0))
+        if vip_discount > 0:
+            product["original_price"] = original_price
+            product["price_usdt"] = await calculate_vip_price(original_price, vip_discount)
+            product["has_vip_discount"] = True
+        else:
+            product["has_vip_discount"] = False
+            
+    return products
 
 async def get_active_products(limit: int = 20, vip_discount: float = 0) -> List[dict]:
     """Get active products from database with VIP pricing"""
@@ -150,36 +156,16 @@ async def get_product_by_id(product_id: str, vip_discount: float = 0) -> Optiona
 
 # Referral Functions
 async def validate_referral_code(code: str) -> Optional[dict]:
-    """Validate and get referral code details"""
-    referral = await db.referral_codes.find_one({
-        "code": code.upper(),
-        "is_active": True
-    })
-    
-    if not referral:
-        return None
-    
-    # Check if expired
-    if referral.get("valid_until") and referral["valid_until"] < datetime.utcnow():
-        return None
-    
-    # Check if not yet valid
-    if referral.get("valid_from") and referral["valid_from"] > datetime.utcnow():
-        return None
-    
-    # Check usage limit
-    if referral.get("usage_limit") and referral.get("used_count", 0) >= referral["usage_limit"]:
-        return None
-    
-    return referral
+    """Validate and get referral code details (from the cached active codes)"""
+    return await validate_code(db, code)
 
-async def apply_referral_code(code: str) -> bool:
-    """Increment usage count for referral code"""
-    result = await db.referral_codes.update_one(
-        {"code": code.upper()},
-        {"$inc": {"used_count": 1}}
-    )
-    return result.modified_count > 0
+async def apply_referral_code(code: str) -> Optional[dict]:
+    """Redeem referral code - None if it got used up or expired meanwhile"""
+    return await redeem_code(db, code)
+
+async def release_referral_code(code: str) -> bool:
+    """Undo apply_referral_code for an order that didn't go through"""
+    return await unredeem_code(db, code)
 
 async def calculate_discount(total: float, referral: dict) -> tuple[float, float]:
     """Calculate discount amount and new total"""
@@ -201,7 +187,6 @@ async def get_user_orders(telegram_id: int, limit: int = 10) -> List[dict]:
 async def create_order(order_data: dict) -> str:
     """Create new order with referral and VIP support"""
     order_data["created_at"] = datetime.utcnow()
-    order_data["order_number"] = await generate_order_number()
     
     # Store original total if discount applied
     if order_data.get("referral_code") or order_data.get("vip_discount_applied"):
@@ -209,7 +194,7 @@ async def create_order(order_data: dict) -> str:
         if order_data.get("discount_amount", 0) > 0:
             order_data["original_total"] = original_total + order_data["discount_amount"]
     
-    result = await db.orders.insert_one(order_data)
+    result = await insert_with_sequence(db.orders, order_data, "order_number", generate_order_number)
     
     # Update user's referral usage
     if order_data.get("referral_code"):
@@ -240,12 +225,8 @@ async def update_order_payment(order_id: str, payment_data: dict) -> bool:
             order = await db.orders.find_one({"_id": ObjectId(order_id)})
             if order:
                 # Update products
-                if order.get("items"):
-                    for item in order["items"]:
-                        await db.products.update_one(
-                            {"name": item["product_name"]},
-                            {"$inc": {"sold_count": item.get("quantity", 1)}}
-                        )
+                await increment_sold_counts(db, order)
+                await commit_stock(db, order["_id"])
                 
                 # Update user stats
                 await db.users.update_one(
@@ -257,6 +238,8 @@ async def update_order_payment(order_id: str, payment_data: dict) -> bool:
                         }
                     }
                 )
+                
+                await accrue_order_commission(db, order)
         
         return result.modified_count > 0
     except Exception as e:
@@ -4,6 +4,7 @@ Enhanced bot command and message handlers with /clear command
 import asyncio
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
+from telegram.error import TelegramError
 from bson import ObjectId
 from datetime import datetime
 import logging
@@ -20,14 +21,25 @@ from .database import (
 from .keyboards import (
     get_main_menu_keyboard, get_categories_keyboard, get_products_keyboard,
     get_product_detail_keyboard, get_cart_keyboard, get_checkout_confirm_keyboard,
-    get_referral_keyboard, get_back_keyboard, get_order_complete_keyboard
+    get_referral_keyboard, get_back_keyboard, get_order_complete_keyboard,
+    keyboard_cache
 )
 from .cart_manager import cart_manager
+from .message_tracker import message_tracker, DELETE_BATCH_SIZE
+from .session_store import session_store
 
 logger = logging.getLogger(__name__)
 
-user_states = {}
-user_context = {}
+user_states = session_store.namespace("state")
+user_context = session_store.namespace("context")
+# Cart snapshot, delivery, discount and the order being paid - shared by all bot workers
+checkout_state = session_store.namespace("checkout")
+
+async def track_incoming_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remember user message ids in private chats so /clear can bulk-delete them"""
+    message = update.message
+    if message and update.effective_chat and update.effective_chat.type == "private":
+        message_tracker.track(update.effective_chat.id, message.message_id, message.date.timestamp())
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -36,29 +48,33 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         message_id = update.message.message_id
         
+        message_ids, too_old = message_tracker.pop_deletable(chat_id)
+        message_ids = [msg_id for msg_id in message_ids if msg_id != message_id]
+        # Nothing tracked (e.g. bot restarted) - sweep the most recent id window instead.
+        # Telegram skips ids that don't exist and still confirms, so a sweep has no count
+        swept = not message_ids
+        if swept:
+            message_ids = list(range(max(1, message_id - DELETE_BATCH_SIZE + 1), message_id))
+        message_ids = sorted(set(message_ids) | {message_id})
+        
         deleted_count = 0
-        failed_count = 0
         
-        for msg_id in range(message_id, 0, -1):
+        for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            batch = message_ids[i:i + DELETE_BATCH_SIZE]
             try:
-                await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-                deleted_count += 1
-                
-                if deleted_count >= 100:
-                    break
-                    
-                if deleted_count % 10 == 0:
-                    await asyncio.sleep(0.5)
-                    
-            except:
-                failed_count += 1
-                if failed_count > 50:
-                    break
+                # Only batches Telegram confirmed count as deleted
+                if await context.bot.delete_messages(chat_id=chat_id, message_ids=batch):
+                    deleted_count += len(batch)
+            except TelegramError as e:
+                logger.warning(f"Bulk delete failed for {len(batch)} messages in {chat_id}: {e}")
+        
+        too_old_note = f"\n_{too_old} older messages can't be removed (Telegram 48h limit)._" if too_old else ""
+        deleted_note = "Chat cleared." if swept else f"Deleted {deleted_count} messages."
         
         welcome_text = f"""
 🧹 *Chat Cleared!*
 
-Deleted {deleted_count} messages.
+{deleted_note}{too_old_note}
 
 Welcome back, {user.first_name or 'friend'}! 
 Ready to start fresh? Your gains journey continues! 💪
@@ -343,10 +359,9 @@ async def handle_group_command(update: Update, context: ContextTypes.DEFAULT_TYP
     
     if update.message:
         try:
-            command = update.message.text.split()[0].lower() if update.message.text else ""
+            command = update.message.text.split()[0].lower().split('@')[0] if update.message.text else ""
             
-            commands = await message_loader.load_commands()
-            cmd_data = commands.get(command)
+            cmd_data = await message_loader.resolve_command(command)
             
             if cmd_data and not cmd_data.get('group_redirect', True):
                 response = cmd_data.get('response', 'Command response')
@@ -355,7 +370,7 @@ async def handle_group_command(update: Update, context: ContextTypes.DEFAULT_TYP
             
             bot_username = BOT_USERNAME.replace('@', '')
             
-            messages = await message_loader.load_messages()
+            messages = await message_loader.get_messages()
             
             group_messages = []
             for i in range(1, 10):
@@ -460,17 +475,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(maintenance_msg, parse_mode='Markdown')
         return
     
-    settings = await message_loader.load_settings()
-    
-    if settings.get("welcome_delay", 0) > 0:
-        await asyncio.sleep(settings["welcome_delay"])
-    
-    if settings.get("typing_delay", 0) > 0:
-        await context.bot.send_chat_action(
-            chat_id=update.effective_chat.id, 
-            action="typing"
-        )
-        await asyncio.sleep(settings["typing_delay"])
+    settings = await message_loader.get_settings()
     
     if update.message:
         await save_chat_message(
@@ -512,9 +517,44 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message=welcome_text,
             direction="outgoing"
         )
-        await update.message.reply_text(welcome_text, reply_markup=keyboard, parse_mode='Markdown')
+        send = update.message.reply_text(welcome_text, reply_markup=keyboard, parse_mode='Markdown')
     elif update.callback_query:
+        # "home" button - edit right away. A delayed edit could land after the
+        # user already moved on to the next screen and overwrite it
         await update.callback_query.edit_message_text(welcome_text, reply_markup=keyboard, parse_mode='Markdown')
+        return
+    else:
+        return
+    
+    welcome_delay = settings.get("welcome_delay", 0)
+    typing_delay = settings.get("typing_delay", 0)
+    if welcome_delay > 0 or typing_delay > 0:
+        # Cosmetic delays run in their own task - the update is done once the data work is.
+        # Only /start gets here: it sends a new message, nothing it could overwrite
+        context.application.create_task(
+            send_after_delays(context.bot, update.effective_chat.id, send, welcome_delay, typing_delay),
+            update=update
+        )
+    else:
+        await send
+
+async def send_after_delays(bot, chat_id: int, send, welcome_delay: float, typing_delay: float):
+    """Waits the welcome delay, shows 'typing...' for the typing delay, then sends"""
+    try:
+        if welcome_delay > 0:
+            await asyncio.sleep(welcome_delay)
+        
+        if typing_delay > 0:
+            await bot.send_chat_action(chat_id=chat_id, action="typing")
+            await asyncio.sleep(typing_delay)
+        
+        await send
+    except asyncio.CancelledError:
+        send.close()
+        raise
+    except Exception as e:
+        send.close()
+        logger.error(f"Error sending delayed message to {chat_id}: {e}")
 
 async def shop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -530,15 +570,16 @@ async def shop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await show_categories(update, context)
 
-async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def build_categories_view():
     categories = await get_active_categories()
     
     if not categories:
-        text = MESSAGES["no_categories"]
-        keyboard = get_back_keyboard()
-    else:
-        text = MESSAGES["shop_categories"]
-        keyboard = get_categories_keyboard(categories)
+        return None
+    return MESSAGES["shop_categories"], get_categories_keyboard(categories)
+
+async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    view = await keyboard_cache.get_or_build(("categories",), build_categories_view)
+    text, keyboard = view or (MESSAGES["no_categories"], get_back_keyboard())
     
     if update.message:
         user = update.effective_user
@@ -557,32 +598,45 @@ async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
+async def build_category_products_view(category_id: str, vip_discount: float, is_vip: bool):
+    products = await get_products_by_category(category_id, vip_discount=vip_discount)
+    
+    if not products:
+        return None
+    
+    from .database import get_category_by_id
+    category = await get_category_by_id(category_id)
+    if not category:
+        return None
+    
+    text = f"{category.get('emoji', '📦')} *{category['name']}*\n"
+    text += f"_{category.get('description', 'Premium products')}_"
+    
+    if is_vip:
+        text += f"\n👑 *VIP {vip_discount}% OFF*"
+    
+    text += "\n\nSelect product:"
+    
+    return text, get_products_keyboard(products, category_id)
+
 async def show_category_products(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str):
     query = update.callback_query
     user_id = update.effective_user.id
     
-    user_context[user_id] = {"category_id": category_id}
+    await user_context.set(user_id, {"category_id": category_id})
     
     vip_status = await get_user_vip_status(user_id)
-    
-    products = await get_products_by_category(category_id, vip_discount=vip_status["discount"])
-    
-    if not products:
-        text = MESSAGES["category_empty"]
-        keyboard = get_back_keyboard("shop")
-    else:
-        from .database import get_category_by_id
-        category = await get_category_by_id(category_id)
-        
-        text = f"{category.get('emoji', '📦')} *{category['name']}*\n"
-        text += f"_{category.get('description', 'Premium products')}_"
-        
-        if vip_status["is_vip"]:
-            text += f"\n👑 *VIP {vip_status['discount']}% OFF*"
-        
-        text += "\n\nSelect product:"
-        
-        keyboard = get_products_keyboard(products, category_id)
+    discount, is_vip = vip_status["discount"], vip_status["is_vip"]
+    
+    # Same view for every user of the same VIP tier until the catalog changes.
+    # Only real ids become cache keys - callback data can carry anything
+    view = None
+    if ObjectId.is_valid(category_id):
+        view = await keyboard_cache.get_or_build(
+            ("category", category_id, discount, is_vip),
+            lambda: build_category_products_view(category_id, discount, is_vip)
+        )
+    text, keyboard = view or (MESSAGES["category_empty"], get_back_keyboard("shop"))
     
     await query.edit_message_text(text, reply_markup=keyboard, parse_mode='Markdown')
 
@@ -597,9 +651,9 @@ async def show_product_detail(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("Product not found! 🤷", reply_markup=get_back_keyboard("shop"))
         return
     
-    quantity = cart_manager.get_quantity(user_id, product_id)
+    quantity = await cart_manager.get_quantity(user_id, product_id)
     
-    cart = cart_manager.get_cart(user_id)
+    cart = await cart_manager.get_cart(user_id)
     in_cart = cart.get(product_id, {}).get('quantity', 0)
     
     text = f"🏷️ *{product['name']}*\n"
@@ -630,7 +684,7 @@ async def show_product_detail(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    cart = cart_manager.get_cart(user_id)
+    cart = await cart_manager.get_cart(user_id)
     
     vip_status = await get_user_vip_status(user_id)
     
@@ -770,7 +824,7 @@ async def handle_dynamic_command(update: Update, context: ContextTypes.DEFAULT_T
         return
     
     user = update.effective_user
-    command = update.message.text.split()[0].lower()
+    command = update.message.text.split()[0].lower().split('@')[0]
     
     if command == '/start':
         await start_command(update, context)
@@ -837,7 +891,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     first_name = update.effective_user.first_name
     last_name = update.effective_user.last_name
     text = update.message.text.strip()
-    state = user_states.get(user_id)
+    state = await user_states.get(user_id)
+    ticket_state = await user_ticket_state.get(user_id)
     
     await save_chat_message(
         telegram_id=user_id,
@@ -848,9 +903,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         last_name=last_name
     )
     
-    logger.info(f"User {user_id} sent message. Support state: {user_ticket_state.get(user_id)}, Normal state: {state}")
+    logger.info(f"User {user_id} sent message. Support state: {ticket_state}, Normal state: {state}")
     
-    if user_id in user_ticket_state:
+    if ticket_state is not None:
         logger.info(f"Processing support ticket message for user {user_id}")
         await handle_text_message(update, context)
         return
@@ -864,7 +919,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_city_input(update: Update, context: ContextTypes.DEFAULT_TYPE, city: str):
     user_id = update.effective_user.id
-    message_id = context.user_data.get('checkout_message_id')
+    checkout = await checkout_state.get(user_id, {})
+    message_id = checkout.get('checkout_message_id')
     
     if len(city) < 2:
         await update.message.delete()
@@ -888,10 +944,10 @@ async def handle_city_input(update: Update, context: ContextTypes.DEFAULT_TYPE,
             )
         return
     
-    context.user_data['delivery_city'] = city
-    user_states[user_id] = "waiting_referral"
+    checkout = await checkout_state.update(user_id, delivery_city=city)
+    await user_states.set(user_id, "waiting_referral")
     
-    country = context.user_data.get('delivery_country', 'Unknown')
+    country = checkout.get('delivery_country', 'Unknown')
     
     response_text = f"✅ Shipping to: {city}, {country}\n" + MESSAGES["ask_referral"]
     
@@ -921,7 +977,8 @@ async def handle_city_input(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
 async def handle_referral_input(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
     user_id = update.effective_user.id
-    message_id = context.user_data.get('checkout_message_id')
+    checkout = await checkout_state.get(user_id, {})
+    message_id = checkout.get('checkout_message_id')
     
     vip_status = await get_user_vip_status(user_id)
     
@@ -930,7 +987,7 @@ async def handle_referral_input(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.delete()
     
     if referral:
-        total = context.user_data.get('checkout_total', 0)
+        total = checkout.get('checkout_total', 0)
         
         if vip_status["is_vip"] and vip_status["discount"] > 0:
             response_text = (
@@ -954,16 +1011,17 @@ async def handle_referral_input(update: Update, context: ContextTypes.DEFAULT_TY
                     parse_mode='Markdown'
                 )
             
-            context.user_data['referral_code'] = None
-            context.user_data['discount_amount'] = 0
-            context.user_data['final_total'] = total
-            context.user_data['vip_discount_applied'] = True
+            await checkout_state.update(
+                user_id, referral_code=None, discount_amount=0,
+                final_total=total, vip_discount_applied=True
+            )
         else:
             discount_amount, new_total = await calculate_discount(total, referral)
             
-            context.user_data['referral_code'] = code.upper()
-            context.user_data['discount_amount'] = discount_amount
-            context.user_data['final_total'] = new_total
+            await checkout_state.update(
+                user_id, referral_code=referral['code'],
+                discount_amount=discount_amount, final_total=new_total
+            )
             
             discount_text = f"{referral['discount_value']}%"
             if referral['discount_type'] == 'fixed':
@@ -1028,7 +1086,7 @@ async def handle_referral_input(update: Update, context: ContextTypes.DEFAULT_TY
             direction="outgoing"
         )
     
-    user_states[user_id] = None
+    await user_states.set(user_id, None)
 
 async def request_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
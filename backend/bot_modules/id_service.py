@@ -0,0 +1,130 @@
+"""
+Id service - order numbers, ticket numbers and custom order ids from counters
+
+Every sequence is one document in the counters collection. A process takes a
+block of values with a single find_one_and_update $inc and hands them out
+from memory, so issuing an id costs no database round trip until the block
+runs out. Bot and API share the counters, so their ids never overlap; values
+left in a block when a process stops are skipped, which only leaves gaps.
+
+Order numbers keep the APZ-XXXX-XXXX format: the sequence value goes
+through a 32-bit permutation so consecutive orders don't reveal the order
+count. Unique indexes back all three ids; insert_with_sequence() takes the
+next value if a legacy random id is already taken.
+
+Functions take the db handle - the bot, the API and the payment gateway each
+have their own client.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ID_ATTEMPTS = 5
+MASK_32 = 0xFFFFFFFF
+
+class SequenceAllocator:
+    """Increasing integers for one named sequence, reserved block values at a time"""
+
+    def __init__(self, name: str, block: int = 20):
+        self.name = name
+        self.block = block
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next(self, db) -> int:
+        async with self._lock:
+            if self._next >= self._end:
+                counter = await db.counters.find_one_and_update(
+                    {"_id": self.name},
+                    {"$inc": {"value": self.block}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                # This process owns (value - block, value]
+                self._end = counter["value"] + 1
+                self._next = self._end - self.block
+            value = self._next
+            self._next += 1
+            return value
+
+async def seed_sequence(db, name: str, minimum: int):
+    """Make sure the sequence continues after ids that already exist"""
+    await db.counters.update_one({"_id": name}, {"$max": {"value": minimum}}, upsert=True)
+
+def scramble32(value: int) -> int:
+    """Bijective mix of a 32-bit value - distinct inputs give distinct outputs"""
+    value &= MASK_32
+    value = (value * 0x9E3779B1) & MASK_32
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & MASK_32
+    value ^= value >> 13
+    return value
+
+# ==================== IDS ====================
+
+order_numbers = SequenceAllocator("order_number", block=20)
+ticket_numbers = SequenceAllocator("ticket_number", block=10)
+custom_order_ids = SequenceAllocator("custom_order_id", block=10)
+
+async def next_order_number(db) -> str:
+    mixed = f"{scramble32(await order_numbers.next(db)):08X}"
+    return f"APZ-{mixed[:4]}-{mixed[4:]}"
+
+async def next_ticket_number(db) -> str:
+    return f"TKT-{datetime.now().year}-{await ticket_numbers.next(db):04d}"
+
+async def next_custom_order_id(db) -> int:
+    return await custom_order_ids.next(db)
+
+async def insert_with_sequence(collection, document: dict, field: str,
+                               allocate: Callable[[], Awaitable], attempts: int = ID_ATTEMPTS):
+    """insert_one with document[field] from allocate(), taking the next value
+    if the unique index reports it as taken"""
+    for attempt in range(attempts):
+        document[field] = await allocate()
+        try:
+            return await collection.insert_one(document)
+        except DuplicateKeyError as e:
+            if field not in ((e.details or {}).get("keyPattern") or {}) or attempt == attempts - 1:
+                raise
+            logger.warning(f"⚠️ {field} {document[field]} already taken, using the next one")
+
+# ==================== SETUP ====================
+
+async def _max_ticket_number(db) -> int:
+    result = await db.support_tickets.aggregate([
+        {"$project": {"n": {"$convert": {
+            "input": {"$arrayElemAt": [{"$split": ["$ticket_number", "-"]}, -1]},
+            "to": "int", "onError": 0, "onNull": 0
+        }}}},
+        {"$group": {"_id": None, "max": {"$max": "$n"}}}
+    ]).to_list(1)
+    return result[0]["max"] if result else 0
+
+async def ensure_id_sequences(db):
+    """Seed the counters past existing ids and create the unique indexes"""
+    await seed_sequence(db, "ticket_number", await _max_ticket_number(db))
+    newest_custom = await db.custom_orders.find_one(
+        {"custom_id": {"$type": "number"}}, {"custom_id": 1}, sort=[("custom_id", -1)]
+    )
+    await seed_sequence(db, "custom_order_id", newest_custom["custom_id"] if newest_custom else 0)
+
+    for collection, field in (
+        (db.orders, "order_number"),
+        (db.support_tickets, "ticket_number"),
+        (db.custom_orders, "custom_id")
+    ):
+        try:
+            # Partial - old documents without the field don't collide on null
+            await collection.create_index(
+                field, unique=True, partialFilterExpression={field: {"$exists": True}}
+            )
+        except OperationFailure as e:
+            logger.error(f"❌ Duplicate {field} values, no unique index on {collection.name}: {e}")
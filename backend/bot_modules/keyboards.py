@@ -1,10 +1,61 @@
 """
 Enhanced Telegram inline keyboards with better UX
 """
+from functools import lru_cache
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from typing import List, Dict, Optional
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Tuple
 from .config import EU_COUNTRIES, CRYPTO_CURRENCIES
+from .stock import stock_level
 
+STOCK_LABELS = {"in_stock": "✅", "low": "⚠️ Low", "sold_out": "❌ Sold out"}
+
+class KeyboardCache:
+    """Rendered catalog views (text + keyboard), keyed by catalog version.
+    
+    InlineKeyboardMarkup objects are frozen after creation, so one instance
+    can be sent to any number of users. bump() is called when products or
+    categories change and makes every cached view stale at once. A builder
+    returns None for a view that must not be cached (empty category) -
+    get_or_build passes the None on and the caller renders it uncached.
+    """
+    
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.version = 0
+        self.entries: Dict[Tuple, Any] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def bump(self):
+        self.version += 1
+        self.entries = {}
+    
+    async def on_config_change(self, collection: str):
+        """MessageLoader listener"""
+        if collection in ("products", "categories", "all"):
+            self.bump()
+    
+    async def get_or_build(self, key: Tuple, builder: Callable[[], Awaitable[Any]]) -> Any:
+        version = self.version
+        cache_key = (version,) + key
+        
+        entry = self.entries.get(cache_key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        
+        self.misses += 1
+        entry = await builder()
+        # Don't store something built from a catalog that changed meanwhile
+        if entry is not None and version == self.version:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {}
+            self.entries[cache_key] = entry
+        return entry
+
+keyboard_cache = KeyboardCache()
+
+@lru_cache(maxsize=1)
 def get_main_menu_keyboard():
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("🍕 Browse Shop", callback_data="shop")],
@@ -40,7 +91,8 @@ def get_products_keyboard(products: List[Dict], category_id: str = None) -> Inli
     
     for product in products:
         name = product['name'][:20] + "..." if len(product['name']) > 20 else product['name']
-        stock_info = "✅" if product.get('stock_quantity', 999) > 10 else "⚠️ Low"
+        # Coarse label only - the cached view is rebuilt when a product crosses a stock threshold
+        stock_info = STOCK_LABELS[stock_level(product.get('stock_quantity'))]
         button_text = f"{name} • ${product['price_usdt']:.2f} {stock_info}"
         callback_data = f"view_{str(product['_id'])}"
         keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
@@ -55,6 +107,7 @@ def get_products_keyboard(products: List[Dict], category_id: str = None) -> Inli
     
     return InlineKeyboardMarkup(keyboard)
 
+@lru_cache(maxsize=4096)
 def get_product_detail_keyboard(product_id: str, quantity: int, in_cart: int = 0) -> InlineKeyboardMarkup:
     """Simplified product detail keyboard"""
     keyboard = []
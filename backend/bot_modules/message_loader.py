@@ -2,56 +2,139 @@
 Dynamic message loader from database
 """
 import asyncio
+import re
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Dict, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+from typing import Callable, Dict, Optional
 import os
 from dotenv import load_dotenv
 import logging
 
+from .session_store import session_store
+
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/telegram_shop")
+MONGODB_DB = os.getenv("MONGODB_DB", "telegram_shop")
 logger = logging.getLogger(__name__)
 
+# Collections the loader caches - watched for changes instead of reloaded on a timer
+CONFIG_COLLECTIONS = ["bot_messages", "bot_commands", "bot_settings"]
+# Not cached here, but listeners (keyboard cache) need to know when they change
+CATALOG_COLLECTIONS = ["products", "categories"]
+# Updates touching only these don't change what the catalog looks like -
+# stock moves on every checkout, cached views show only products.stock_level,
+# which the stock module sets when a product crosses a threshold
+CATALOG_COUNTER_FIELDS = {"sold_count", "stock_quantity", "updated_at"}
+# Fallback when change streams are unavailable (standalone mongod): admin writes
+# bump bot_config_version {_id: "main", version, changes: [{v, coll, id}]}
+CONFIG_VERSION_COLLECTION = "bot_config_version"
+CONFIG_POLL_INTERVAL = 1.0
+
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+_UNSET = object()
+
+async def bump_config_version(db, collection: str, doc_id=None):
+    """Record a config/catalog change in bot_config_version (read by version
+    polling when MongoDB has no change streams). "all" forces a full reload."""
+    await db[CONFIG_VERSION_COLLECTION].update_one(
+        {"_id": "main"},
+        [
+            {"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}},
+            {"$set": {"changes": {"$slice": [
+                {"$concatArrays": [
+                    {"$ifNull": ["$changes", []]},
+                    [{"v": "$version", "coll": {"$literal": collection}, "id": {"$literal": str(doc_id) if doc_id is not None else None}}]
+                ]},
+                -100
+            ]}}}
+        ],
+        upsert=True
+    )
+
+class CompiledTemplate:
+    """Message text pre-split into literal and {placeholder} segments.
+    
+    render() is one pass + join instead of a str.replace per variable;
+    placeholders without a value are kept as written, like before.
+    """
+    __slots__ = ("text", "literals", "names")
+    
+    def __init__(self, text: str):
+        parts = PLACEHOLDER_PATTERN.split(text)
+        self.text = text
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+    
+    def render(self, values: dict) -> str:
+        if not self.names or not values:
+            return self.text
+        
+        literals = self.literals
+        out = [literals[0]]
+        for i, name in enumerate(self.names):
+            value = values.get(name, _UNSET)
+            out.append("{" + name + "}" if value is _UNSET else str(value))
+            out.append(literals[i + 1])
+        return "".join(out)
+
 class MessageLoader:
     def __init__(self):
         self.client = AsyncIOMotorClient(MONGODB_URI)
-        self.db = self.client.telegram_shop
+        self.db = self.client[MONGODB_DB]
         self.messages_cache = {}
         self.commands_cache = {}
+        # command and alias -> command data
+        self.command_index = {}
         self.settings_cache = {}
+        self.templates: Dict[str, CompiledTemplate] = {}
+        # Keys found neither in the database nor in config.MESSAGES
+        self.missing_keys = set()
+        # _id -> key / command, so deletes (which carry only the _id) can be applied
+        self.message_keys = {}
+        self.command_names = {}
+        self.config_version = 0
+        self.listeners = []
         
     async def load_messages(self) -> Dict[str, str]:
         """Load all active messages from database"""
         messages = await self.db.bot_messages.find({"enabled": True}).to_list(1000)
         
         message_dict = {}
+        message_keys = {}
         for msg in messages:
             message_dict[msg["key"]] = msg["message"]
+            message_keys[str(msg["_id"])] = msg["key"]
         
         # Fallback to default if empty or missing keys
         if not message_dict or 'welcome' not in message_dict:
             from .config import MESSAGES
             # Merge with defaults, database takes priority
-            for key, value in MESSAGES.items():
-                if key not in message_dict:
-                    message_dict[key] = value
-                    # Also save to database for future
-                    await self.db.bot_messages.update_one(
+            missing = {key: value for key, value in MESSAGES.items() if key not in message_dict}
+            message_dict.update(missing)
+            if missing:
+                # Also save to database for future - never overwrites an existing (disabled) message
+                await self.db.bot_messages.bulk_write([
+                    UpdateOne(
                         {"key": key},
-                        {
-                            "$set": {
-                                "key": key,
-                                "message": value,
-                                "category": self._get_category_for_key(key),
-                                "enabled": True
-                            }
-                        },
+                        {"$setOnInsert": {
+                            "key": key,
+                            "message": value,
+                            "category": self._get_category_for_key(key),
+                            "enabled": True
+                        }},
                         upsert=True
                     )
+                    for key, value in missing.items()
+                ], ordered=False)
             logger.info(f"Loaded {len(message_dict)} messages (with defaults)")
             
+        self.templates = {key: CompiledTemplate(text) for key, text in message_dict.items()}
         self.messages_cache = message_dict
+        self.message_keys = message_keys
+        self.missing_keys = set()
         return message_dict
     
     def _get_category_for_key(self, key: str) -> str:
@@ -71,60 +154,36 @@ class MessageLoader:
         else:
             return 'main'
     
+    def _command_data(self, cmd: dict) -> dict:
+        return {
+            "description": cmd["description"],
+            "response": cmd["response"],
+            "aliases": cmd.get("aliases", []),
+            "private_only": cmd.get("private_only", True),
+            "group_redirect": cmd.get("group_redirect", True)
+        }
+    
+    def _build_command_index(self, commands: Dict[str, dict]) -> Dict[str, dict]:
+        index = {}
+        for command, data in commands.items():
+            index.setdefault(command.lower(), data)
+            for alias in data.get("aliases", []):
+                index.setdefault(alias.lower(), data)
+        return index
+    
     async def load_commands(self) -> Dict[str, dict]:
         """Load all active commands from database"""
         commands = await self.db.bot_commands.find({"enabled": True}).to_list(100)
         
         command_dict = {}
+        command_names = {}
         for cmd in commands:
-            # Debug log
-            if cmd["command"] == "/mash":
-                logger.info(f"Loading /mash from DB: private_only={cmd.get('private_only')}, group_redirect={cmd.get('group_redirect')}")
-            
-            command_dict[cmd["command"]] = {
-                "description": cmd["description"],
-                "response": cmd["response"],
-                "aliases": cmd.get("aliases", []),
-                "private_only": cmd.get("private_only", True),
-                "group_redirect": cmd.get("group_redirect", True)
-            }
+            command_dict[cmd["command"]] = self._command_data(cmd)
+            command_names[str(cmd["_id"])] = cmd["command"]
         
+        self.command_index = self._build_command_index(command_dict)
         self.commands_cache = command_dict
-        return command_dict
-        
-        # Add default commands if missing
-        if not command_dict:
-            default_commands = {
-                "/start": {
-                    "description": "Start the bot",
-                    "response": "Welcome to the bot!",
-                    "aliases": ["/begin", "/go"]
-                },
-                "/help": {
-                    "description": "Get help",
-                    "response": "Here's how to use the bot...",
-                    "aliases": []
-                }
-            }
-            for cmd, data in default_commands.items():
-                if cmd not in command_dict:
-                    command_dict[cmd] = data
-                    # Save to database
-                    await self.db.bot_commands.update_one(
-                        {"command": cmd},
-                        {
-                            "$set": {
-                                "command": cmd,
-                                "description": data["description"],
-                                "response": data["response"],
-                                "aliases": data["aliases"],
-                                "enabled": True
-                            }
-                        },
-                        upsert=True
-                    )
-            
-        self.commands_cache = command_dict
+        self.command_names = command_names
         return command_dict
     
     async def load_settings(self) -> dict:
@@ -146,56 +205,83 @@ class MessageLoader:
             await self.db.bot_settings.insert_one(settings)
             
         self.settings_cache = settings
+        session_store.set_ttl(settings.get("session_timeout"))
         return settings
     
-    async def get_message(self, key: str, **kwargs) -> str:
-        """Get a specific message with variable substitution"""
+    async def get_messages(self) -> Dict[str, str]:
+        """Cached messages - kept current by watch_config"""
         if not self.messages_cache:
             await self.load_messages()
+        return self.messages_cache
+    
+    async def get_commands(self) -> Dict[str, dict]:
+        """Cached commands - kept current by watch_config"""
+        if not self.commands_cache:
+            await self.load_commands()
+        return self.commands_cache
+    
+    async def get_settings(self) -> dict:
+        """Cached settings - kept current by watch_config"""
+        if not self.settings_cache:
+            await self.load_settings()
+        return self.settings_cache
+    
+    async def _load_template(self, key: str) -> CompiledTemplate:
+        """Cache miss - look the key up once, then remember the outcome"""
+        from .config import MESSAGES
         
-        # Try to get from cache first
-        message = self.messages_cache.get(key)
+        if key in self.missing_keys:
+            return CompiledTemplate(f"Message '{key}' not found")
         
-        # If not found, try to load from database
-        if not message:
-            db_msg = await self.db.bot_messages.find_one({"key": key})
-            if db_msg:
-                message = db_msg["message"]
-                self.messages_cache[key] = message
-            else:
-                # If still not found, use fallback
-                from .config import MESSAGES
-                message = MESSAGES.get(key, f"Message '{key}' not found")
-                # Save to database for next time
-                await self.db.bot_messages.insert_one({
+        db_msg = await self.db.bot_messages.find_one({"key": key})
+        if db_msg:
+            message = db_msg["message"]
+        elif key in MESSAGES:
+            message = MESSAGES[key]
+            # Save to database for next time - concurrent misses can't create duplicates
+            await self.db.bot_messages.update_one(
+                {"key": key},
+                {"$setOnInsert": {
                     "key": key,
                     "message": message,
                     "category": self._get_category_for_key(key),
                     "enabled": True
-                })
-                self.messages_cache[key] = message
+                }},
+                upsert=True
+            )
+        else:
+            # Unknown key - don't store a placeholder message, just stop asking
+            self.missing_keys.add(key)
+            logger.warning(f"Message '{key}' not found in database or defaults")
+            return CompiledTemplate(f"Message '{key}' not found")
         
-        # Replace variables
-        for var_key, var_value in kwargs.items():
-            message = message.replace(f"{{{var_key}}}", str(var_value))
-            
-        return message
+        template = CompiledTemplate(message)
+        self.messages_cache[key] = message
+        self.templates[key] = template
+        return template
     
-    async def get_command_response(self, command: str) -> Optional[str]:
-        """Get response for a command"""
+    async def get_message(self, key: str, **kwargs) -> str:
+        """Get a specific message with variable substitution"""
+        if not self.messages_cache:
+            await self.load_messages()
+        
+        template = self.templates.get(key)
+        if template is None:
+            template = await self._load_template(key)
+        
+        return template.render(kwargs)
+    
+    async def resolve_command(self, command: str) -> Optional[dict]:
+        """Command data for a command or one of its aliases"""
         if not self.commands_cache:
             await self.load_commands()
-            
-        cmd_data = self.commands_cache.get(command)
-        if cmd_data:
-            return cmd_data["response"]
-            
-        # Check aliases
-        for cmd, data in self.commands_cache.items():
-            if command in data.get("aliases", []):
-                return data["response"]
-                
-        return None
+        
+        return self.command_index.get(command.lower())
+    
+    async def get_command_response(self, command: str) -> Optional[str]:
+        """Get response for a command"""
+        cmd_data = await self.resolve_command(command)
+        return cmd_data["response"] if cmd_data else None
     
     async def is_maintenance_mode(self) -> bool:
         """Check if bot is in maintenance mode"""
@@ -216,10 +302,174 @@ class MessageLoader:
     
     async def reload_all(self):
         """Reload all messages, commands and settings"""
+        version_doc = await self.db[CONFIG_VERSION_COLLECTION].find_one({"_id": "main"})
         await self.load_messages()
         await self.load_commands()
         await self.load_settings()
+        # Changes bumped while we were loading are re-applied, which is harmless
+        self.config_version = version_doc.get("version", 0) if version_doc else 0
         logger.info("Reloaded all bot configuration from database")
+        await self._notify("all")
+    
+    # ==================== LIVE UPDATES ====================
+    
+    def add_listener(self, callback: Callable):
+        """callback(collection) is awaited after a change was applied ("all" after a full reload)"""
+        self.listeners.append(callback)
+    
+    async def _notify(self, collection: str):
+        for callback in self.listeners:
+            try:
+                await callback(collection)
+            except Exception as e:
+                logger.error(f"Config listener error: {e}")
+    
+    async def apply_change(self, collection: str, doc_id, doc: Optional[dict]):
+        """Apply one changed document (None = deleted) to the caches.
+        
+        Caches are copied, changed and swapped in as a whole, so a handler
+        never sees a half-applied change.
+        """
+        doc_id = str(doc_id)
+        
+        if collection == "bot_messages":
+            messages = dict(self.messages_cache)
+            templates = dict(self.templates)
+            message_keys = dict(self.message_keys)
+            old_key = message_keys.pop(doc_id, None)
+            if old_key is not None:
+                messages.pop(old_key, None)
+                templates.pop(old_key, None)
+            if doc and doc.get("enabled", True):
+                messages[doc["key"]] = doc["message"]
+                templates[doc["key"]] = CompiledTemplate(doc["message"])
+                message_keys[doc_id] = doc["key"]
+                self.missing_keys.discard(doc["key"])
+            self.messages_cache, self.templates, self.message_keys = messages, templates, message_keys
+        
+        elif collection == "bot_commands":
+            commands = dict(self.commands_cache)
+            command_names = dict(self.command_names)
+            old_name = command_names.pop(doc_id, None)
+            if old_name is not None:
+                commands.pop(old_name, None)
+            if doc and doc.get("enabled", True):
+                commands[doc["command"]] = self._command_data(doc)
+                command_names[doc_id] = doc["command"]
+            self.command_index = self._build_command_index(commands)
+            self.commands_cache, self.command_names = commands, command_names
+        
+        elif collection == "bot_settings":
+            if doc_id != "main":
+                return
+            if doc:
+                self.settings_cache = doc
+                session_store.set_ttl(doc.get("session_timeout"))
+            else:
+                await self.load_settings()
+        
+        elif collection not in CATALOG_COLLECTIONS:
+            return
+        
+        logger.info(f"🔄 Applied {collection} change ({doc_id})")
+        await self._notify(collection)
+    
+    async def _apply_version_doc(self, version_doc: Optional[dict], fetch_documents: bool):
+        """Catch up with bot_config_version. fetch_documents=False when a change
+        stream already delivers the documents and only "all" reloads matter."""
+        if not version_doc:
+            return
+        
+        version = version_doc.get("version", 0)
+        if version <= self.config_version:
+            return
+        
+        changes = [c for c in version_doc.get("changes", []) if c["v"] > self.config_version]
+        if not changes or changes[0]["v"] > self.config_version + 1:
+            # Fell behind the kept change log - nothing to do but a full reload
+            await self.reload_all()
+            return
+        
+        for change in changes:
+            if change["coll"] == "all":
+                await self.reload_all()
+                return
+            if fetch_documents and change["coll"] in CONFIG_COLLECTIONS:
+                doc_id = change["id"]
+                query_id = ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+                doc = await self.db[change["coll"]].find_one({"_id": query_id})
+                await self.apply_change(change["coll"], doc_id, doc)
+            elif fetch_documents and change["coll"] in CATALOG_COLLECTIONS:
+                await self.apply_change(change["coll"], change["id"], None)
+            self.config_version = change["v"]
+    
+    async def _watch_change_stream(self):
+        """Returns only if change streams aren't supported by the server"""
+        resume_token = None
+        watched = CONFIG_COLLECTIONS + CATALOG_COLLECTIONS + [CONFIG_VERSION_COLLECTION]
+        pipeline = [{"$match": {"ns.coll": {"$in": watched}}}]
+        
+        while True:
+            try:
+                async with self.db.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    resume_after=resume_token
+                ) as stream:
+                    if resume_token is None:
+                        logger.info("✅ Watching bot configuration (change stream)")
+                        # Anything changed before the stream opened
+                        await self.reload_all()
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        if "documentKey" not in change:
+                            # drop / rename of a watched collection
+                            await self.reload_all()
+                            continue
+                        collection = change["ns"]["coll"]
+                        doc_id = change["documentKey"]["_id"]
+                        
+                        if collection in CATALOG_COLLECTIONS and change["operationType"] == "update":
+                            description = change.get("updateDescription", {})
+                            fields = set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+                            if fields <= CATALOG_COUNTER_FIELDS:
+                                continue
+                        doc = change.get("fullDocument")
+                        
+                        if collection == CONFIG_VERSION_COLLECTION:
+                            await self._apply_version_doc(doc, fetch_documents=False)
+                        else:
+                            await self.apply_change(collection, doc_id, doc)
+            except OperationFailure as e:
+                if e.code == 40573 or "replica set" in str(e):
+                    return
+                logger.error(f"Config change stream error: {e}")
+                resume_token = None
+                await asyncio.sleep(5)
+            except PyMongoError as e:
+                logger.error(f"Config change stream interrupted: {e}")
+                await asyncio.sleep(1)
+    
+    async def _poll_config_version(self):
+        logger.info(f"✅ Watching bot configuration (polling {CONFIG_VERSION_COLLECTION} every {CONFIG_POLL_INTERVAL}s)")
+        while True:
+            try:
+                version_doc = await self.db[CONFIG_VERSION_COLLECTION].find_one({"_id": "main"})
+                await self._apply_version_doc(version_doc, fetch_documents=True)
+            except Exception as e:
+                logger.error(f"Config version poll error: {e}")
+            await asyncio.sleep(CONFIG_POLL_INTERVAL)
+    
+    async def watch_config(self):
+        """Background task - keeps the caches in sync with admin edits"""
+        try:
+            await self._watch_change_stream()
+            logger.info("⚠️ Change streams unavailable (not a replica set) - using version polling")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Config change stream failed: {e}")
+        await self._poll_config_version()
 
 # Global instance
 message_loader = MessageLoader()
@@ -0,0 +1,48 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Telegram only lets bots delete messages younger than 48 hours
+DELETE_WINDOW_SECONDS = 48 * 3600
+DELETE_BATCH_SIZE = 100  # deleteMessages limit
+
+class ChatMessageTracker:
+    """Bounded record of recent message ids per chat, for bulk deletion in /clear"""
+
+    def __init__(self, per_chat: int = 300, max_chats: int = 20000):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self.chats: "OrderedDict[int, OrderedDict[int, float]]" = OrderedDict()
+
+    def track(self, chat_id: int, message_id: int, date: Optional[float] = None):
+        messages = self.chats.get(chat_id)
+        if messages is None:
+            messages = OrderedDict()
+            self.chats[chat_id] = messages
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+
+        messages[message_id] = date or time.time()
+        if len(messages) > self.per_chat:
+            messages.popitem(last=False)
+
+    def track_api_result(self, result):
+        """Record messages returned by send* Bot API calls (dict or list of dicts)"""
+        for message in result if isinstance(result, list) else [result]:
+            if isinstance(message, dict) and "message_id" in message and message.get("chat"):
+                self.track(message["chat"]["id"], message["message_id"], message.get("date"))
+
+    def pop_deletable(self, chat_id: int) -> Tuple[List[int], int]:
+        """Forget a chat's tracked ids. Returns (ids still deletable, count too old to delete)"""
+        messages = self.chats.pop(chat_id, None) or {}
+        cutoff = time.time() - DELETE_WINDOW_SECONDS
+
+        deletable = [message_id for message_id, date in messages.items() if date > cutoff]
+        return sorted(deletable), len(messages) - len(deletable)
+
+message_tracker = ChatMessageTracker()
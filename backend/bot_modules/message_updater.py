@@ -5,6 +5,7 @@ Helper module for smooth Telegram message updates without flicker
 
 import asyncio
 import logging
+import time
 from typing import Optional, Dict
 from datetime import datetime
 from telegram import Bot, InlineKeyboardMarkup
@@ -13,12 +14,32 @@ from telegram.error import BadRequest
 logger = logging.getLogger(__name__)
 
 
+class _PendingFrame:
+    """Newest not-yet-sent content for one message"""
+    __slots__ = ("text", "reply_markup", "parse_mode", "future")
+    
+    def __init__(self, text, reply_markup, parse_mode):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.future = asyncio.get_running_loop().create_future()
+
+
 class MessageUpdater:
-    """Manages smooth message updates with anti-flicker protection"""
+    """Manages smooth message updates with anti-flicker protection
     
-    def __init__(self):
-        self.last_updates: Dict[str, Dict] = {}  # Track last update per message
-        self.update_locks: Dict[str, asyncio.Lock] = {}  # Prevent concurrent updates
+    Latest-wins: every message has one pending slot and at most one flusher
+    task. A new frame replaces whatever is still waiting in the slot, so a
+    frame that was superseded before it went out is never sent. Edits in the
+    same chat are spaced by min_edit_interval.
+    """
+    
+    def __init__(self, min_edit_interval: float = 1.0):
+        self.min_edit_interval = min_edit_interval
+        self.last_updates: Dict[str, Dict] = {}  # Last frame actually sent per message
+        self.pending: Dict[str, _PendingFrame] = {}  # Newest frame waiting per message
+        self.flushers: Dict[str, asyncio.Task] = {}  # One flusher task per message
+        self.last_chat_edit: Dict[int, float] = {}  # Monotonic time of last edit per chat
     
     def _get_message_key(self, chat_id: int, message_id: int) -> str:
         """Generate unique key for message tracking"""
@@ -32,7 +53,8 @@ class MessageUpdater:
         text: str,
         reply_markup: Optional[InlineKeyboardMarkup] = None,
         parse_mode: str = 'Markdown',
-        force: bool = False
+        force: bool = False,
+        wait: bool = True
     ) -> bool:
         """
         Update message with anti-flicker protection
@@ -45,70 +67,104 @@ class MessageUpdater:
             reply_markup: Optional keyboard
             parse_mode: Parse mode for text
             force: Force update even if text hasn't changed
+            wait: Wait until the frame is sent or superseded
         
         Returns:
-            bool: True if message was updated, False if skipped
+            bool: True if message was updated (or queued when wait=False),
+                  False if skipped or superseded by a newer frame
         """
         key = self._get_message_key(chat_id, message_id)
         
-        # Create lock if doesn't exist
-        if key not in self.update_locks:
-            self.update_locks[key] = asyncio.Lock()
+        # Skip if this is exactly what the message already shows
+        if not force and key not in self.pending:
+            last_data = self.last_updates.get(key)
+            if last_data and last_data.get("text") == text and last_data.get("reply_markup") == reply_markup:
+                return False
         
-        async with self.update_locks[key]:
-            # Check if we should skip this update
-            if not force and key in self.last_updates:
-                last_data = self.last_updates[key]
-                
-                # Skip if text hasn't changed and last update was recent
-                if (last_data.get("text") == text and 
-                    (datetime.utcnow() - last_data.get("timestamp", datetime.min)).total_seconds() < 0.3):
-                    return False
-            
-            try:
-                # Attempt to update message
-                await bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=text,
-                    reply_markup=reply_markup,
-                    parse_mode=parse_mode
-                )
-                
-                # Record successful update
-                self.last_updates[key] = {
-                    "text": text,
-                    "timestamp": datetime.utcnow()
-                }
-                
-                return True
-                
-            except BadRequest as e:
-                error_str = str(e).lower()
-                
-                # Ignore "message not modified" errors
-                if "message is not modified" in error_str:
-                    return False
+        frame = _PendingFrame(text, reply_markup, parse_mode)
+        
+        previous = self.pending.get(key)
+        if previous is not None and not previous.future.done():
+            previous.future.set_result(False)
+        self.pending[key] = frame
+        
+        if key not in self.flushers:
+            self.flushers[key] = asyncio.create_task(self._flush(bot, chat_id, message_id, key))
+        
+        if not wait:
+            return True
+        
+        return await asyncio.shield(frame.future)
+    
+    async def _flush(self, bot: Bot, chat_id: int, message_id: int, key: str):
+        """Send the newest pending frame until the slot stays empty"""
+        try:
+            while key in self.pending:
+                # Re-check after sleeping - another message in this chat may have gone first
+                while True:
+                    delay = self.last_chat_edit.get(chat_id, 0) + self.min_edit_interval - time.monotonic()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
                 
-                # Log other errors
-                if "message to edit not found" not in error_str:
-                    logger.warning(f"Failed to update message: {e}")
+                frame = self.pending.pop(key, None)
+                if frame is None:
+                    break
                 
-                return False
+                self.last_chat_edit[chat_id] = time.monotonic()
+                sent = await self._send(bot, chat_id, message_id, key, frame)
                 
-            except Exception as e:
-                logger.error(f"Unexpected error updating message: {e}")
+                if not frame.future.done():
+                    frame.future.set_result(sent)
+        finally:
+            self.flushers.pop(key, None)
+    
+    async def _send(self, bot: Bot, chat_id: int, message_id: int, key: str, frame: _PendingFrame) -> bool:
+        try:
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=frame.text,
+                reply_markup=frame.reply_markup,
+                parse_mode=frame.parse_mode
+            )
+            
+            # Record successful update
+            self.last_updates[key] = {
+                "text": frame.text,
+                "reply_markup": frame.reply_markup,
+                "timestamp": datetime.utcnow()
+            }
+            
+            return True
+            
+        except BadRequest as e:
+            error_str = str(e).lower()
+            
+            # Ignore "message not modified" errors
+            if "message is not modified" in error_str:
                 return False
+            
+            # Log other errors
+            if "message to edit not found" not in error_str:
+                logger.warning(f"Failed to update message: {e}")
+            
+            return False
+            
+        except Exception as e:
+            logger.error(f"Unexpected error updating message: {e}")
+            return False
     
     def clear_message_cache(self, chat_id: int, message_id: int):
-        """Clear cached data for a specific message"""
+        """Clear cached data for a specific message and drop its pending frame"""
         key = self._get_message_key(chat_id, message_id)
         
         if key in self.last_updates:
             del self.last_updates[key]
         
-        if key in self.update_locks:
-            del self.update_locks[key]
+        frame = self.pending.pop(key, None)
+        if frame is not None and not frame.future.done():
+            frame.future.set_result(False)
     
     def clear_old_cache(self, max_age_seconds: int = 300):
         """Clear cache entries older than max_age_seconds"""
@@ -121,8 +177,10 @@ class MessageUpdater:
         
         for key in keys_to_remove:
             del self.last_updates[key]
-            if key in self.update_locks:
-                del self.update_locks[key]
+        
+        chat_cutoff = time.monotonic() - max_age_seconds
+        for chat_id in [c for c, t in self.last_chat_edit.items() if t < chat_cutoff]:
+            del self.last_chat_edit[chat_id]
         
         if keys_to_remove:
             logger.info(f"Cleared {len(keys_to_remove)} old message cache entries")
@@ -0,0 +1,180 @@
+"""
+Order items - product reference and cost frozen on each item
+
+Orders created by the bot store product_id, category_id and
+purchase_price_usdt next to product_name, so sold counters and profit joins
+key on the indexed _id and survive product renames. Older orders only have
+product_name; every helper here falls back to a name lookup for those, and
+backfill_order_items() fills the fields in once.
+
+Functions take the db handle - the bot, the API and the payment gateway each
+have their own client.
+"""
+import logging
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH = 500
+
+# ==================== ITEMS ====================
+
+def order_item(product_id: str, item: dict) -> dict:
+    """Order item from a resolved cart entry (see CartManager.get_cart)"""
+    category_id = item.get('category_id')
+    return {
+        "product_id": ObjectId(product_id),
+        "category_id": ObjectId(category_id) if category_id else None,
+        "product_name": item['name'],
+        "quantity": item['quantity'],
+        "price_usdt": item['price'],
+        "subtotal_usdt": item['price'] * item['quantity'],
+        "purchase_price_usdt": item.get('purchase_price', 0)
+    }
+
+def item_product_id(item: dict) -> Optional[ObjectId]:
+    """The item's product _id - simulator orders stored it as a string"""
+    product_id = item.get("product_id")
+    if isinstance(product_id, str) and ObjectId.is_valid(product_id):
+        return ObjectId(product_id)
+    return product_id if isinstance(product_id, ObjectId) else None
+
+def product_filter(item: dict) -> dict:
+    """Query matching the item's product - by _id, or by name for old orders"""
+    product_id = item_product_id(item)
+    if product_id:
+        return {"_id": product_id}
+    return {"name": item.get("product_name")}
+
+class ProductLookup:
+    """Products referenced by a set of orders, resolvable per order item"""
+
+    def __init__(self, products: Iterable[dict]):
+        self.by_id: Dict[str, dict] = {}
+        self.by_name: Dict[str, dict] = {}
+        for product in products:
+            self.by_id[str(product["_id"])] = product
+            self.by_name[product.get("name")] = product
+
+    def get(self, item: dict) -> Optional[dict]:
+        product_id = item.get("product_id")
+        if product_id:
+            product = self.by_id.get(str(product_id))
+            if product:
+                return product
+        return self.by_name.get(item.get("product_name"))
+
+    def purchase_price(self, item: dict) -> Optional[float]:
+        """Cost frozen on the item, else the product's current one. None if unknown"""
+        purchase_price = float(item.get("purchase_price_usdt") or 0)
+        if purchase_price:
+            return purchase_price
+        product = self.get(item)
+        if not product:
+            return None
+        return float(product.get("purchase_price_usdt", 0))
+
+async def load_products(db, orders: Iterable[dict], projection: Optional[dict] = None) -> ProductLookup:
+    """One query for all products referenced by the orders' items"""
+    ids = set()
+    names = set()
+    for order in orders:
+        for item in order.get("items") or []:
+            product_id = item_product_id(item)
+            if product_id:
+                ids.add(product_id)
+            elif item.get("product_name"):
+                names.add(item["product_name"])
+
+    clauses = []
+    if ids:
+        clauses.append({"_id": {"$in": list(ids)}})
+    if names:
+        clauses.append({"name": {"$in": list(names)}})
+    if not clauses:
+        return ProductLookup([])
+
+    products = await db.products.find({"$or": clauses}, projection).to_list(None)
+    return ProductLookup(products)
+
+# ==================== COUNTERS ====================
+
+async def increment_sold_counts(db, order: dict):
+    """Add the order's quantities to products.sold_count in one round trip"""
+    requests = [
+        UpdateOne(product_filter(item), {"$inc": {"sold_count": item.get("quantity", 1)}})
+        for item in order.get("items") or []
+    ]
+    if requests:
+        await db.products.bulk_write(requests, ordered=False)
+
+async def ensure_order_item_indexes(db):
+    await db.orders.create_index("items.product_id")
+    await db.products.create_index("name")
+
+# ==================== MIGRATION ====================
+
+async def backfill_order_items(db, batch_size: int = BACKFILL_BATCH) -> int:
+    """Fill product_id, category_id and purchase_price_usdt on items that only
+    have product_name, matching the product by name. Items whose product no
+    longer exists get product_id None so they aren't scanned again.
+    Returns the number of orders updated."""
+    products = await db.products.find(
+        {}, {"name": 1, "category_id": 1, "purchase_price_usdt": 1}
+    ).to_list(None)
+    by_name = {p["name"]: p for p in products}
+
+    cursor = db.orders.find(
+        {"items": {"$elemMatch": {"product_id": {"$exists": False}}}},
+        {"items": 1}
+    ).batch_size(batch_size)
+
+    requests = []
+    updated = 0
+    unmatched = 0
+
+    async for order in cursor:
+        items = []
+        for item in order["items"]:
+            if "product_id" not in item:
+                product = by_name.get(item.get("product_name"))
+                item = dict(item)
+                if product:
+                    item["product_id"] = product["_id"]
+                    item["category_id"] = product.get("category_id")
+                    # Cost at migration time - what profit reports have been using
+                    if not item.get("purchase_price_usdt"):
+                        item["purchase_price_usdt"] = product.get("purchase_price_usdt", 0)
+                else:
+                    item["product_id"] = None
+                    unmatched += 1
+            items.append(item)
+
+        # Only if the items haven't changed since they were read
+        requests.append(UpdateOne(
+            {"_id": order["_id"], "items": order["items"]},
+            {"$set": {"items": items}}
+        ))
+        if len(requests) >= batch_size:
+            result = await db.orders.bulk_write(requests, ordered=False)
+            updated += result.modified_count
+            requests = []
+
+    if requests:
+        result = await db.orders.bulk_write(requests, ordered=False)
+        updated += result.modified_count
+
+    if updated or unmatched:
+        logger.info(f"🧾 Backfilled items on {updated} orders ({unmatched} items without a matching product)")
+    return updated
+
+async def order_items_migration(db):
+    """Background task - indexes, then backfill of old orders"""
+    try:
+        await ensure_order_item_indexes(db)
+        await backfill_order_items(db)
+    except Exception as e:
+        logger.error(f"Error migrating order items: {e}")
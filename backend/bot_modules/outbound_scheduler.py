@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from .message_tracker import message_tracker
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 30            # messages per second across all chats
+PRIVATE_CHAT_RATE = 1       # messages per second in one private chat
+GROUP_CHAT_RATE = 20 / 60   # messages per second in one group (20 per minute)
+
+# Edits that only matter in their newest form - a queued older edit can be replaced
+COALESCABLE_ENDPOINTS = {
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption", "editMessageMedia"
+}
+# Not messages in a chat, only count against the global bucket
+GLOBAL_ONLY_ENDPOINTS = {"deleteMessage", "deleteMessages", "sendChatAction"}
+# Endpoints that create messages - remembered so /clear can bulk-delete them
+MESSAGE_CREATING_PREFIXES = ("send", "copyMessage", "forwardMessage")
+
+class TokenBucket:
+    """Classic token bucket - rate tokens per second, up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _ChatQueue:
+    __slots__ = ("lock", "bucket", "depth", "last_used")
+
+    def __init__(self, rate: float, capacity: float):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(rate, capacity)
+        self.depth = 0
+        self.last_used = time.monotonic()
+
+class _Request:
+    __slots__ = ("callback", "args", "kwargs", "future")
+
+    def __init__(self, callback, args, kwargs):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """Central outbound queue for every Bot API call.
+
+    Plugged into python-telegram-bot as the rate limiter, so handlers,
+    MessageUpdater, /clear and notifications all share the same limits:
+    a global token bucket, one bucket per chat (private 1/s, groups 20/min),
+    FIFO ordering per chat, coalescing of queued edits to the same message
+    and automatic waiting on RetryAfter. rate_limit_args overrides max_retries.
+    """
+
+    def __init__(self, max_retries: int = 3, max_idle_chats: int = 5000):
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chats: Dict[Any, _ChatQueue] = {}
+        self._pending_edits: Dict[Tuple, _Request] = {}
+        self._flood_until = 0.0
+        self._depth = 0
+        self.stats = {
+            "sent": 0,
+            "coalesced": 0,
+            "retry_after": 0,
+            "failed": 0,
+            "max_queue_depth": 0
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _is_group(self, chat_id) -> bool:
+        if isinstance(chat_id, str):
+            return chat_id.startswith("@") or chat_id.startswith("-")
+        return chat_id < 0
+
+    def _chat_queue(self, chat_id) -> _ChatQueue:
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            if len(self._chats) > self.max_idle_chats:
+                self._prune_idle_chats()
+            if self._is_group(chat_id):
+                queue = _ChatQueue(GROUP_CHAT_RATE, 5)
+            else:
+                queue = _ChatQueue(PRIVATE_CHAT_RATE, 3)
+            self._chats[chat_id] = queue
+        queue.last_used = time.monotonic()
+        return queue
+
+    def _prune_idle_chats(self):
+        cutoff = time.monotonic() - 60
+        for chat_id, queue in list(self._chats.items()):
+            if queue.depth == 0 and queue.last_used < cutoff and queue.bucket.is_full():
+                del self._chats[chat_id]
+
+    async def _wait_for_flood_control(self):
+        delay = self._flood_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _on_retry_after(self, error: RetryAfter, endpoint: str) -> float:
+        delay = error.retry_after
+        if hasattr(delay, "total_seconds"):
+            delay = delay.total_seconds()
+        delay = float(delay) + 0.1
+        self._flood_until = max(self._flood_until, time.monotonic() + delay)
+        self.stats["retry_after"] += 1
+        logger.warning(f"⏳ Flood control on {endpoint}, pausing outbound queue for {delay:.1f}s")
+        return delay
+
+    async def _call(self, request, endpoint: str, max_retries: int, chat_queue=None, edit_key=None):
+        for attempt in range(max_retries + 1):
+            await self._wait_for_flood_control()
+            if chat_queue is not None:
+                await chat_queue.bucket.acquire()
+            await self._global.acquire()
+
+            if edit_key is not None and self._pending_edits.get(edit_key) is request:
+                # Sending now - newer edits queue behind instead of replacing this one
+                del self._pending_edits[edit_key]
+
+            try:
+                result = await request.callback(*request.args, **request.kwargs)
+                self.stats["sent"] += 1
+                return result
+            except RetryAfter as e:
+                self._on_retry_after(e, endpoint)
+                if attempt >= max_retries:
+                    self.stats["failed"] += 1
+                    raise
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        max_retries = rate_limit_args if isinstance(rate_limit_args, int) else self.max_retries
+        chat_id = data.get("chat_id")
+        request = _Request(callback, args, kwargs)
+
+        if chat_id is None:
+            return await self._call(request, endpoint, max_retries)
+
+        edit_key = None
+        if endpoint in COALESCABLE_ENDPOINTS and data.get("message_id"):
+            edit_key = (endpoint, chat_id, data["message_id"])
+            queued = self._pending_edits.get(edit_key)
+            if queued is not None:
+                # An older edit of the same message hasn't gone out yet - send ours instead
+                queued.callback, queued.args, queued.kwargs = callback, args, kwargs
+                self.stats["coalesced"] += 1
+                return await asyncio.shield(queued.future)
+            self._pending_edits[edit_key] = request
+
+        chat_queue = self._chat_queue(chat_id)
+        chat_queue.depth += 1
+        self._depth += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._depth)
+
+        try:
+            async with chat_queue.lock:
+                bucket_queue = None if endpoint in GLOBAL_ONLY_ENDPOINTS else chat_queue
+                result = await self._call(request, endpoint, max_retries, bucket_queue, edit_key)
+            request.future.set_result(result)
+            if endpoint.startswith(MESSAGE_CREATING_PREFIXES) and endpoint != "sendChatAction":
+                message_tracker.track_api_result(result)
+            return result
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                request.future.cancel()
+            elif not request.future.done():
+                request.future.set_exception(e)
+                request.future.exception()
+            raise
+        finally:
+            chat_queue.depth -= 1
+            self._depth -= 1
+            if edit_key is not None and self._pending_edits.get(edit_key) is request:
+                del self._pending_edits[edit_key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        depths = [queue.depth for queue in self._chats.values() if queue.depth]
+        return {
+            "queue_depth": self._depth,
+            "chats_waiting": len(depths),
+            "max_chat_depth": max(depths) if depths else 0,
+            "pending_edits": len(self._pending_edits),
+            "tracked_chats": len(self._chats),
+            "flood_wait_seconds": round(max(0.0, self._flood_until - time.monotonic()), 1),
+            **self.stats,
+            "updated_at": datetime.utcnow()
+        }
+
+async def report_outbound_metrics(db, interval: int = 30):
+    """Background task - publishes queue metrics so the admin API can show them"""
+    while True:
+        try:
+            await asyncio.sleep(interval)
+            await db.bot_metrics.update_one(
+                {"_id": "outbound_scheduler"},
+                {"$set": outbound_scheduler.get_metrics()},
+                upsert=True
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reporting outbound metrics: {e}")
+
+outbound_scheduler = OutboundScheduler()
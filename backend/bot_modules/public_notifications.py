@@ -6,7 +6,8 @@ WITH CUSTOM EMOJI SUPPORT AND API METHODS
 import logging
 import random
 import asyncio
-from telegram import Bot, MessageEntity
+from telegram import MessageEntity
+from telegram.ext import ExtBot
 from datetime import datetime
 from typing import Dict, Any, Optional, List, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -19,10 +20,12 @@ class PublicNotificationManager:
     
     def __init__(self):
         from .config import BOT_TOKEN, MONGODB_URI
+        from .database import MONGODB_DB
+        from .outbound_scheduler import outbound_scheduler
         
-        self.bot = Bot(token=BOT_TOKEN)
+        self.bot = ExtBot(token=BOT_TOKEN, rate_limiter=outbound_scheduler)
         self.mongo_client = AsyncIOMotorClient(MONGODB_URI)
-        self.db = self.mongo_client.telegram_shop
+        self.db = self.mongo_client[MONGODB_DB]
         
         self.country_flags = {
             "Germany": "🇩🇪", "France": "🇫🇷", "Netherlands": "🇳🇱",
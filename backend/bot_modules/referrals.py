@@ -0,0 +1,122 @@
+"""
+Referral codes - normalization, cached validation and atomic redemption
+
+Codes are stored normalized (normalize_referral_code) under a unique index,
+so every lookup is an exact match. Validating what a customer typed reads a
+short-lived in-memory copy of the active codes. Redeeming is one conditional
+find_one_and_update that checks active, validity window and usage limit
+while incrementing used_count, so a burst of checkouts can't overrun
+usage_limit.
+
+Functions take the db handle - the bot and the API each have their own client.
+"""
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_CODES_TTL = 30  # seconds
+
+def normalize_referral_code(code: str) -> str:
+    """The stored form of a code: upper case, no whitespace"""
+    return re.sub(r"\s+", "", code or "").upper()
+
+def redeemable_query(code: str, now: datetime = None) -> dict:
+    """Matches the code only while it can still be used"""
+    now = now or datetime.utcnow()
+    return {
+        "code": code,
+        "is_active": True,
+        "$and": [
+            {"$or": [{"valid_from": None}, {"valid_from": {"$lte": now}}]},
+            {"$or": [{"valid_until": None}, {"valid_until": {"$gte": now}}]},
+            # No limit (missing, null or 0) or still below it
+            {"$or": [
+                {"usage_limit": None},
+                {"usage_limit": 0},
+                {"$expr": {"$lt": [{"$ifNull": ["$used_count", 0]}, "$usage_limit"]}}
+            ]}
+        ]
+    }
+
+def is_redeemable(referral: dict, now: datetime = None) -> bool:
+    """redeemable_query() for a document already in memory"""
+    now = now or datetime.utcnow()
+    if not referral.get("is_active"):
+        return False
+    if referral.get("valid_from") and referral["valid_from"] > now:
+        return False
+    if referral.get("valid_until") and referral["valid_until"] < now:
+        return False
+    if referral.get("usage_limit") and referral.get("used_count", 0) >= referral["usage_limit"]:
+        return False
+    return True
+
+class ActiveReferralCache:
+    """Active referral codes by code, reloaded in one query every ttl seconds.
+
+    Only for validating input - used_count may be a few seconds stale, the
+    redemption itself re-checks everything in the database."""
+
+    def __init__(self, ttl: float = ACTIVE_CODES_TTL):
+        self.ttl = ttl
+        self._codes: Dict[str, dict] = {}
+        self._loaded_at = 0.0
+
+    async def get(self, db, code: str) -> Optional[dict]:
+        if time.monotonic() - self._loaded_at > self.ttl:
+            referrals = await db.referral_codes.find({"is_active": True}).to_list(None)
+            self._codes = {referral["code"]: referral for referral in referrals}
+            self._loaded_at = time.monotonic()
+        return self._codes.get(normalize_referral_code(code))
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+async def validate_code(db, code: str) -> Optional[dict]:
+    """The code's document if it can be used right now"""
+    referral = await active_referral_cache.get(db, code)
+    if referral and is_redeemable(referral):
+        return referral
+    return None
+
+async def redeem_code(db, code: str) -> Optional[dict]:
+    """Use the code once. Returns the updated document, None if it can't be used"""
+    referral = await db.referral_codes.find_one_and_update(
+        redeemable_query(normalize_referral_code(code)),
+        {"$inc": {"used_count": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if referral and referral.get("usage_limit") and referral["used_count"] >= referral["usage_limit"]:
+        # Just used up - stop offering it before the next reload
+        active_referral_cache.invalidate()
+    return referral
+
+async def unredeem_code(db, code: str) -> bool:
+    """Give back a use when the order it was redeemed for didn't go through"""
+    result = await db.referral_codes.update_one(
+        {"code": normalize_referral_code(code), "used_count": {"$gt": 0}},
+        {"$inc": {"used_count": -1}}
+    )
+    return result.modified_count > 0
+
+async def ensure_referral_indexes(db):
+    """Normalize codes stored before normalization, then the unique index"""
+    async for referral in db.referral_codes.find({}, {"code": 1}):
+        code = normalize_referral_code(referral.get("code"))
+        if code != referral.get("code"):
+            await db.referral_codes.update_one({"_id": referral["_id"]}, {"$set": {"code": code}})
+            logger.info(f"🎟️ Normalized referral code {referral.get('code')!r} -> {code}")
+
+    try:
+        await db.referral_codes.create_index("code", unique=True)
+    except OperationFailure as e:
+        logger.error(f"❌ Referral codes are not unique after normalization, no unique index: {e}")
+
+active_referral_cache = ActiveReferralCache()
@@ -0,0 +1,449 @@
+"""
+Seller commission ledger - append-only entries plus running balances
+
+Every paid order with a seller's referral code gets one "accrual" entry when
+it is paid (profit and commission rate frozen at that moment), a "reversal"
+if it later leaves paid/completed, and every seller payout a "payout" entry.
+seller_balances holds per-seller totals maintained with $inc, so seller
+screens read one document per seller instead of re-pricing every order.
+reconcile_ledger() backfills missed entries and rebuilds drifted balances.
+
+Functions take the db handle - the bot, the API and the payment gateway each
+have their own client.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from .order_items import ProductLookup, load_products
+
+logger = logging.getLogger(__name__)
+
+PAID_STATUSES = ["paid", "completed"]
+COMMISSION_TYPES = ["accrual", "reversal"]
+DEFAULT_COMMISSION_PERCENTAGE = 30
+RECONCILE_INTERVAL = 3600  # seconds
+BALANCE_TOLERANCE = 0.01
+TOP_SELLERS_TTL = 60  # seconds
+TOP_SELLERS_LIMIT = 5
+
+# ==================== HELPERS ====================
+
+def order_profit(order: dict, products: ProductLookup) -> float:
+    """Order profit: (selling - purchase price) per item, minus the discount"""
+    total_profit = 0
+
+    for item in order.get("items") or []:
+        purchase_price = products.purchase_price(item)
+        if purchase_price is not None:
+            selling_price = item.get("price_usdt", 0)
+            quantity = item.get("quantity", 1)
+            total_profit += (selling_price - purchase_price) * quantity
+
+    # Discounts reduce our profit
+    return max(0, total_profit - order.get("discount_amount", 0))
+
+def _balance_inc(entry: dict) -> dict:
+    """$inc for seller_balances from one ledger entry"""
+    if entry["type"] == "payout":
+        return {"total_paid": entry["amount"]}
+
+    code = entry.get("referral_code") or "-"
+    return {
+        "total_commission": entry["amount"],
+        "total_sales": entry["order_total"],
+        "total_orders": entry["uses"],
+        f"codes.{code}.commission": entry["amount"],
+        f"codes.{code}.sales": entry["order_total"],
+        f"codes.{code}.uses": entry["uses"]
+    }
+
+async def _append(db, entry: dict) -> bool:
+    """Insert a ledger entry and apply it to the balance. False if it already exists"""
+    try:
+        await db.seller_ledger.insert_one(entry)
+    except DuplicateKeyError:
+        return False
+
+    await db.seller_balances.update_one(
+        {"_id": entry["seller_id"]},
+        {"$inc": _balance_inc(entry), "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    if entry["type"] != "payout":
+        top_sellers_cache.mark_stale()
+    return True
+
+async def ensure_ledger_indexes(db):
+    await db.seller_ledger.create_index([("type", ASCENDING), ("ref", ASCENDING)], unique=True)
+    await db.seller_ledger.create_index([("seller_id", ASCENDING), ("created_at", DESCENDING)])
+    await db.orders.create_index([("status", ASCENDING), ("referral_code", ASCENDING)])
+
+# ==================== ORDERS ====================
+
+async def accrue_order_commission(db, order: dict) -> Optional[float]:
+    """Credit the seller behind the order's referral code. Call when an order
+    becomes paid; safe to call again for the same payment."""
+    code = order.get("referral_code")
+    if not code:
+        return None
+
+    referral = await db.referral_codes.find_one({"code": code}, {"seller_id": 1})
+    seller_id = referral.get("seller_id") if referral else None
+    seller = None
+    if seller_id and ObjectId.is_valid(seller_id):
+        seller = await db.sellers.find_one({"_id": ObjectId(seller_id)}, {"commission_percentage": 1})
+
+    if not seller:
+        # Not a seller's code - mark it so reconciliation doesn't look again
+        await db.orders.update_one(
+            {"_id": order["_id"], "seller_commission": {"$exists": False}},
+            {"$set": {"seller_commission": None}}
+        )
+        return None
+
+    products = await load_products(db, [order], {"name": 1, "purchase_price_usdt": 1})
+    profit = order_profit(order, products)
+
+    rate = seller.get("commission_percentage", DEFAULT_COMMISSION_PERCENTAGE)
+    cycle = order.get("commission_cycle", 0)
+    entry = {
+        "type": "accrual",
+        "ref": f"{order['_id']}:{cycle}",
+        "seller_id": seller_id,
+        "order_id": order["_id"],
+        "order_number": order.get("order_number"),
+        "referral_code": code,
+        "order_total": float(order.get("total_usdt", 0)),
+        "order_profit": profit,
+        "commission_rate": rate,
+        "amount": profit * rate / 100,
+        "uses": 1,
+        "created_at": datetime.utcnow()
+    }
+
+    if not await _append(db, entry):
+        return None
+
+    await db.orders.update_one(
+        {"_id": order["_id"]},
+        {"$set": {"seller_commission": {
+            "seller_id": seller_id,
+            "commission_rate": rate,
+            "order_profit": profit,
+            "amount": entry["amount"],
+            "cycle": cycle
+        }}}
+    )
+    logger.info(f"💰 Commission {entry['amount']:.2f} for seller {seller_id} on order {order.get('order_number')}")
+    return entry["amount"]
+
+async def accrue_code_commissions(db, code: str) -> int:
+    """A seller was assigned to the code - credit its paid orders that were
+    marked as not a seller's. Returns the number accrued"""
+    accrued = 0
+    # None also matches orders never looked at
+    async for order in db.orders.find({
+        "status": {"$in": PAID_STATUSES},
+        "referral_code": code,
+        "seller_commission": None
+    }):
+        if await accrue_order_commission(db, order) is not None:
+            accrued += 1
+    return accrued
+
+async def reverse_order_commission(db, order: dict) -> Optional[float]:
+    """Undo the accrual of an order that left paid/completed"""
+    frozen = order.get("seller_commission") or {}
+    cycle = frozen.get("cycle", order.get("commission_cycle", 0))
+    ref = f"{order['_id']}:{cycle}"
+
+    accrual = await db.seller_ledger.find_one({"type": "accrual", "ref": ref})
+    if accrual:
+        entry = {
+            "type": "reversal",
+            "ref": ref,
+            "seller_id": accrual["seller_id"],
+            "order_id": accrual["order_id"],
+            "order_number": accrual.get("order_number"),
+            "referral_code": accrual.get("referral_code"),
+            "order_total": -accrual["order_total"],
+            "order_profit": -accrual["order_profit"],
+            "commission_rate": accrual["commission_rate"],
+            "amount": -accrual["amount"],
+            "uses": -1,
+            "created_at": datetime.utcnow()
+        }
+        await _append(db, entry)
+
+    # The next payment of this order starts a new accrual cycle
+    await db.orders.update_one(
+        {"_id": order["_id"], "commission_cycle": order.get("commission_cycle")},
+        {"$unset": {"seller_commission": ""}, "$inc": {"commission_cycle": 1}}
+    )
+    return -accrual["amount"] if accrual else None
+
+async def reset_order_commissions(db):
+    """After orders were wiped - drop commission entries, keep payouts"""
+    await db.seller_ledger.delete_many({"type": {"$in": COMMISSION_TYPES}})
+    await rebuild_balances(db)
+
+# ==================== PAYOUTS ====================
+
+async def create_seller_payout(db, seller_id: str, payout_doc: dict) -> Optional[str]:
+    """Debit a payout if the pending balance covers it. Returns the payout id,
+    None when the amount exceeds pending earnings."""
+    amount = payout_doc["amount"]
+
+    balance = await db.seller_balances.find_one_and_update(
+        {
+            "_id": seller_id,
+            "$expr": {"$gte": [
+                {"$round": [{"$subtract": ["$total_commission", {"$ifNull": ["$total_paid", 0]}]}, 2]},
+                amount
+            ]}
+        },
+        {"$inc": {"total_paid": amount}, "$set": {"updated_at": datetime.utcnow()}}
+    )
+    if not balance:
+        return None
+
+    result = None
+    try:
+        result = await db.seller_payouts.insert_one(payout_doc)
+        await db.seller_ledger.insert_one({
+            "type": "payout",
+            "ref": str(result.inserted_id),
+            "seller_id": seller_id,
+            "amount": amount,
+            "created_at": datetime.utcnow()
+        })
+    except Exception:
+        # Reconciliation would turn a leftover payout document into a ledger entry
+        if result is not None:
+            await db.seller_payouts.delete_one({"_id": result.inserted_id})
+        await db.seller_balances.update_one({"_id": seller_id}, {"$inc": {"total_paid": -amount}})
+        raise
+
+    return str(result.inserted_id)
+
+# ==================== BALANCES ====================
+
+async def get_seller_balances(db, seller_ids: List[str]) -> Dict[str, dict]:
+    balances = await db.seller_balances.find({"_id": {"$in": seller_ids}}).to_list(None)
+    return {balance["_id"]: balance for balance in balances}
+
+def pending_balance(balance: Optional[dict]) -> float:
+    if not balance:
+        return 0
+    return balance.get("total_commission", 0) - balance.get("total_paid", 0)
+
+async def _ledger_totals(db) -> Dict[str, dict]:
+    """Per-seller totals straight from the ledger"""
+    pipeline = [
+        {"$group": {
+            "_id": {"seller_id": "$seller_id", "code": {"$ifNull": ["$referral_code", "-"]}, "type": "$type"},
+            "amount": {"$sum": "$amount"},
+            "sales": {"$sum": {"$ifNull": ["$order_total", 0]}},
+            "uses": {"$sum": {"$ifNull": ["$uses", 0]}}
+        }}
+    ]
+
+    totals = {}
+    async for row in db.seller_ledger.aggregate(pipeline):
+        key = row["_id"]
+        seller = totals.setdefault(key["seller_id"], {
+            "total_commission": 0, "total_sales": 0, "total_orders": 0, "total_paid": 0, "codes": {}
+        })
+        if key["type"] == "payout":
+            seller["total_paid"] += row["amount"]
+            continue
+
+        seller["total_commission"] += row["amount"]
+        seller["total_sales"] += row["sales"]
+        seller["total_orders"] += row["uses"]
+        code = seller["codes"].setdefault(key["code"], {"commission": 0, "sales": 0, "uses": 0})
+        code["commission"] += row["amount"]
+        code["sales"] += row["sales"]
+        code["uses"] += row["uses"]
+
+    return totals
+
+def _drifted(balance: Optional[dict], expected: dict) -> bool:
+    if balance is None:
+        return True
+    for field in ("total_commission", "total_sales", "total_paid"):
+        if abs(balance.get(field, 0) - expected[field]) > BALANCE_TOLERANCE:
+            return True
+    return balance.get("total_orders", 0) != expected["total_orders"]
+
+async def rebuild_balances(db, only_drifted: bool = False) -> int:
+    """Recompute seller_balances from the ledger. Returns balances rewritten"""
+    totals = await _ledger_totals(db)
+    balances = {b["_id"]: b for b in await db.seller_balances.find({}).to_list(None)}
+    rewritten = 0
+
+    for seller_id, expected in totals.items():
+        if only_drifted and not _drifted(balances.get(seller_id), expected):
+            continue
+        if only_drifted:
+            logger.warning(f"⚠️ Seller {seller_id} balance drifted from ledger - rebuilding")
+        await db.seller_balances.replace_one(
+            {"_id": seller_id},
+            {**expected, "updated_at": datetime.utcnow()},
+            upsert=True
+        )
+        rewritten += 1
+
+    # Balances with no ledger entries left
+    for seller_id in set(balances) - set(totals):
+        await db.seller_balances.delete_one({"_id": seller_id})
+        rewritten += 1
+
+    if rewritten:
+        top_sellers_cache.mark_stale()
+    return rewritten
+
+# ==================== LEADERBOARD ====================
+
+class TopSellersCache:
+    """Top-N sellers by commission, one aggregation over seller_balances.
+
+    Callers always get the cached list; once it is older than the TTL, or an
+    order was paid/reversed in this process, a refresh runs in the
+    background. Only the very first call waits for the aggregation.
+    """
+
+    def __init__(self, ttl: int = TOP_SELLERS_TTL, limit: int = TOP_SELLERS_LIMIT):
+        self.ttl = ttl
+        self.limit = limit
+        self.db = None
+        self.value: Optional[List[dict]] = None
+        self.refreshed_at = 0.0
+        self.refresh_task: Optional[asyncio.Task] = None
+
+    def _pipeline(self) -> list:
+        return [
+            {"$match": {"total_commission": {"$gt": 0}}},
+            {"$sort": {"total_commission": -1}},
+            {"$lookup": {
+                "from": "sellers",
+                "let": {"seller_id": {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}}},
+                "pipeline": [
+                    {"$match": {
+                        "$expr": {"$eq": ["$_id", "$$seller_id"]},
+                        "is_active": {"$ne": False},
+                        "deleted_at": {"$exists": False}
+                    }},
+                    {"$project": {"name": 1}}
+                ],
+                "as": "seller"
+            }},
+            {"$unwind": "$seller"},
+            {"$limit": self.limit},
+            {"$project": {"_id": 0, "name": "$seller.name", "earnings": {"$round": ["$total_commission", 2]}}}
+        ]
+
+    async def refresh(self) -> List[dict]:
+        self.value = await self.db.seller_balances.aggregate(self._pipeline()).to_list(self.limit)
+        self.refreshed_at = time.monotonic()
+        return self.value
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing top sellers: {e}")
+
+    def _schedule_refresh(self):
+        if self.db is None or (self.refresh_task and not self.refresh_task.done()):
+            return
+        try:
+            self.refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
+        except RuntimeError:
+            # No running loop - the next get() refreshes
+            self.refreshed_at = 0.0
+
+    def mark_stale(self):
+        """An order was paid or reversed - rebuild now instead of waiting for the TTL"""
+        self.refreshed_at = 0.0
+        self._schedule_refresh()
+
+    async def get(self, db) -> List[dict]:
+        self.db = db
+        if self.value is None:
+            return await self.refresh()
+        if time.monotonic() - self.refreshed_at > self.ttl:
+            self._schedule_refresh()
+        return self.value
+
+# ==================== RECONCILIATION ====================
+
+async def reconcile_ledger(db) -> dict:
+    """Verify the ledger against orders and payouts, fix what's missing and
+    rebuild balances that drifted. Also the backfill for pre-ledger data."""
+    report = {"accrued": 0, "reversed": 0, "payouts_recorded": 0, "balances_fixed": 0}
+
+    # Paid orders with a referral code that were never looked at
+    async for order in db.orders.find({
+        "status": {"$in": PAID_STATUSES},
+        "referral_code": {"$nin": [None, ""]},
+        "seller_commission": {"$exists": False}
+    }):
+        if await accrue_order_commission(db, order) is not None:
+            report["accrued"] += 1
+
+    # Commission still counted for orders that are no longer paid
+    async for order in db.orders.find({
+        "status": {"$nin": PAID_STATUSES},
+        "seller_commission.amount": {"$exists": True}
+    }):
+        await reverse_order_commission(db, order)
+        report["reversed"] += 1
+
+    recorded = set()
+    async for entry in db.seller_ledger.find({"type": "payout"}, {"ref": 1}):
+        recorded.add(entry["ref"])
+
+    async for payout in db.seller_payouts.find({}):
+        if str(payout["_id"]) in recorded:
+            continue
+        try:
+            await db.seller_ledger.insert_one({
+                "type": "payout",
+                "ref": str(payout["_id"]),
+                "seller_id": payout["seller_id"],
+                "amount": payout.get("amount", 0),
+                "created_at": payout.get("created_at") or datetime.utcnow()
+            })
+            report["payouts_recorded"] += 1
+        except DuplicateKeyError:
+            pass
+
+    report["balances_fixed"] = await rebuild_balances(db, only_drifted=True)
+
+    if any(report.values()):
+        logger.info(f"🧾 Seller ledger reconciled: {report}")
+    return report
+
+async def seller_ledger_scheduler(db, interval: int = RECONCILE_INTERVAL):
+    """Background task - indexes, initial backfill, then hourly reconciliation"""
+    try:
+        await ensure_ledger_indexes(db)
+    except Exception as e:
+        logger.error(f"Error creating seller ledger indexes: {e}")
+
+    while True:
+        try:
+            await reconcile_ledger(db)
+        except Exception as e:
+            logger.error(f"Error reconciling seller ledger: {e}")
+        await asyncio.sleep(interval)
+
+top_sellers_cache = TopSellersCache()
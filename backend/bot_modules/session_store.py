@@ -0,0 +1,190 @@
+"""
+Pluggable per-user session store (carts, conversation state)
+"""
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+DEFAULT_SESSION_TIMEOUT = 3600
+
+class BaseSessionStore(ABC):
+    """Stores one JSON-serializable value per (namespace, user_id) with a sliding TTL"""
+
+    def __init__(self, ttl: int = DEFAULT_SESSION_TIMEOUT):
+        self.ttl = ttl
+        # Every namespace handed out, so a user's whole session can be cleared
+        self.namespaces = set()
+
+    def set_ttl(self, ttl: int):
+        """Apply BotSettingsModel.session_timeout"""
+        if ttl and ttl > 0:
+            self.ttl = int(ttl)
+
+    def namespace(self, name: str) -> "SessionNamespace":
+        self.namespaces.add(name)
+        return SessionNamespace(self, name)
+
+    async def clear_user(self, user_id: int):
+        """Delete the user's value in every namespace"""
+        for name in self.namespaces:
+            await self.delete(name, user_id)
+
+    @abstractmethod
+    async def get(self, namespace: str, user_id: int) -> Any:
+        """The stored value, None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, namespace: str, user_id: int, value: Any):
+        """Store the value and restart its TTL"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, user_id: int):
+        """Remove the value - no error if there is none"""
+
+class MemorySessionStore(BaseSessionStore):
+    """Single-process LRU with TTL - the default, fine for one bot worker"""
+
+    def __init__(self, ttl: int = DEFAULT_SESSION_TIMEOUT, max_entries: int = 50000):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    async def get(self, namespace, user_id):
+        key = (namespace, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, namespace, user_id, value):
+        key = (namespace, user_id)
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete(self, namespace, user_id):
+        self.entries.pop((namespace, user_id), None)
+
+class RedisSessionStore(BaseSessionStore):
+    """Shared store for running several bot workers"""
+
+    def __init__(self, url: str, ttl: int = DEFAULT_SESSION_TIMEOUT):
+        super().__init__(ttl)
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, decode_responses=True)
+
+    def _key(self, namespace, user_id) -> str:
+        return f"session:{namespace}:{user_id}"
+
+    async def get(self, namespace, user_id):
+        raw = await self.redis.get(self._key(namespace, user_id))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, namespace, user_id, value):
+        await self.redis.set(self._key(namespace, user_id), json.dumps(value), ex=self.ttl)
+
+    async def delete(self, namespace, user_id):
+        await self.redis.delete(self._key(namespace, user_id))
+
+class MongoSessionStore(BaseSessionStore):
+    """Shared store without extra infrastructure - expired docs are removed by a TTL index"""
+
+    def __init__(self, db, ttl: int = DEFAULT_SESSION_TIMEOUT):
+        super().__init__(ttl)
+        self.collection = db.bot_sessions
+        self.index_ready = False
+
+    async def _ensure_index(self):
+        if not self.index_ready:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self.index_ready = True
+
+    async def get(self, namespace, user_id):
+        doc = await self.collection.find_one({"_id": f"{namespace}:{user_id}"})
+        # The TTL monitor only runs once a minute
+        if not doc or doc["expires_at"] < datetime.utcnow():
+            return None
+        return doc.get("value")
+
+    async def set(self, namespace, user_id, value):
+        await self._ensure_index()
+        await self.collection.update_one(
+            {"_id": f"{namespace}:{user_id}"},
+            {"$set": {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)}},
+            upsert=True
+        )
+
+    async def delete(self, namespace, user_id):
+        await self.collection.delete_one({"_id": f"{namespace}:{user_id}"})
+
+class SessionNamespace:
+    """dict-like async view of one namespace, e.g. await user_states.get(user_id)"""
+
+    def __init__(self, store: BaseSessionStore, name: str):
+        self.store = store
+        self.name = name
+
+    async def get(self, user_id: int, default: Any = None) -> Any:
+        value = await self.store.get(self.name, user_id)
+        return default if value is None else value
+
+    async def set(self, user_id: int, value: Any):
+        if value is None:
+            await self.store.delete(self.name, user_id)
+        else:
+            await self.store.set(self.name, user_id, value)
+
+    async def update(self, user_id: int, **fields) -> dict:
+        """Merge fields into a dict value and store it. Returns the new dict"""
+        value = await self.store.get(self.name, user_id) or {}
+        value.update(fields)
+        await self.store.set(self.name, user_id, value)
+        return value
+
+    async def pop(self, user_id: int, default: Any = None) -> Any:
+        value = await self.store.get(self.name, user_id)
+        if value is None:
+            return default
+        await self.store.delete(self.name, user_id)
+        return value
+
+    async def contains(self, user_id: int) -> bool:
+        return await self.store.get(self.name, user_id) is not None
+
+def create_session_store(backend: Optional[str] = None) -> BaseSessionStore:
+    backend = backend or SESSION_BACKEND
+
+    if backend == "redis":
+        try:
+            store = RedisSessionStore(REDIS_URL)
+            logger.info(f"✅ Session store: Redis ({REDIS_URL})")
+            return store
+        except ImportError:
+            logger.warning("⚠️ redis package not installed - falling back to in-memory sessions")
+    elif backend == "mongo":
+        from .database import db
+        logger.info("✅ Session store: MongoDB (bot_sessions)")
+        return MongoSessionStore(db)
+
+    return MemorySessionStore()
+
+session_store = create_session_store()
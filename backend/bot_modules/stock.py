@@ -0,0 +1,241 @@
+"""
+Stock reservations - conditional decrements at checkout, released on expiry
+
+reserve_stock() takes each item's quantity off products.stock_quantity only
+if that much is left, so two buyers can't both get the last unit. When any
+item falls short, the decrements that did succeed are put back. What was
+taken is recorded in stock_reservations under the order's _id:
+  held      - stock taken, payment pending
+  committed - order paid, the stock stays taken
+  released  - payment failed/expired, order cancelled or the hold timed out
+Status changes are conditional updates, so the payment webhook, the bot and
+the sweeper can race on one order and stock still goes back only once.
+
+Products without a stock_quantity field are not tracked.
+
+The catalog keyboards are cached and show only a coarse products.stock_level
+(in_stock / low / sold_out). It is rewritten - and the catalog version bumped -
+only when a product crosses a threshold, not on every decrement.
+
+Functions take the db handle - the bot, the API and the payment gateway each
+have their own client.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+from .message_loader import bump_config_version
+from .order_items import item_product_id
+
+logger = logging.getLogger(__name__)
+
+# Payment window is 20 minutes
+RESERVATION_TTL = timedelta(minutes=30)
+SWEEP_INTERVAL = 60  # seconds
+# Order statuses that keep the stock taken
+STOCK_KEPT_STATUSES = ["paid", "processing", "completed"]
+# Crypto already sent - hold past the TTL until the gateway decides
+PAYMENT_IN_FLIGHT = ["confirming", "confirmed", "sending", "partially_paid"]
+# At or below this the product list shows "Low"
+LOW_STOCK_THRESHOLD = 10
+
+def stock_level(quantity: Optional[int]) -> str:
+    """Coarse stock state shown in the cached product list"""
+    if quantity is None:
+        return "in_stock"
+    if quantity <= 0:
+        return "sold_out"
+    if quantity <= LOW_STOCK_THRESHOLD:
+        return "low"
+    return "in_stock"
+
+# ==================== HELPERS ====================
+
+async def _sync_stock_levels(db, products: Iterable[dict]):
+    """Store the new stock_level of products that crossed a threshold and
+    bump the catalog version for them. The write is conditional on the
+    quantity read, so a stale level never overwrites a newer one"""
+    for product in products:
+        if "stock_quantity" not in product:
+            continue
+        level = stock_level(product["stock_quantity"])
+        if product.get("stock_level") == level:
+            continue
+        result = await db.products.update_one(
+            {"_id": product["_id"], "stock_quantity": product["stock_quantity"]},
+            {"$set": {"stock_level": level}}
+        )
+        if result.modified_count:
+            await bump_config_version(db, "products", product["_id"])
+
+async def _take(db, product_id: ObjectId, quantity: int) -> Optional[dict]:
+    """Decrement only if enough is left. Returns the product after, None if short"""
+    return await db.products.find_one_and_update(
+        {"_id": product_id, "stock_quantity": {"$gte": quantity}},
+        {"$inc": {"stock_quantity": -quantity}},
+        projection={"stock_quantity": 1, "stock_level": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def _restock(db, quantities: Dict[ObjectId, int]):
+    """Add quantities back (negative takes them again, unconditionally)"""
+    if quantities:
+        await db.products.bulk_write([
+            UpdateOne({"_id": product_id}, {"$inc": {"stock_quantity": quantity}})
+            for product_id, quantity in quantities.items()
+        ], ordered=False)
+        products = await db.products.find(
+            {"_id": {"$in": list(quantities)}}, {"stock_quantity": 1, "stock_level": 1}
+        ).to_list(None)
+        await _sync_stock_levels(db, products)
+
+async def ensure_stock_indexes(db):
+    await db.stock_reservations.create_index([("status", ASCENDING), ("expires_at", ASCENDING)])
+
+# ==================== RESERVATIONS ====================
+
+async def reserve_stock(db, order_id: ObjectId, items: Iterable[dict],
+                        ttl: timedelta = RESERVATION_TTL) -> Optional[dict]:
+    """Take stock for the order's items, all or nothing. Returns None when
+    reserved, else the item that fell short: {product_id, name, requested,
+    available}. Call before the order is inserted - a hold without an order
+    is released by the sweeper."""
+    wanted: Dict[ObjectId, int] = {}
+    names: Dict[ObjectId, str] = {}
+    for item in items:
+        product_id = item_product_id(item)
+        if product_id:
+            wanted[product_id] = wanted.get(product_id, 0) + item.get("quantity", 1)
+            names[product_id] = item.get("product_name")
+    if not wanted:
+        return None
+
+    # One conditional update per product, all in flight at once
+    product_ids = list(wanted)
+    results = await asyncio.gather(
+        *(_take(db, product_id, wanted[product_id]) for product_id in product_ids),
+        return_exceptions=True
+    )
+    taken = {product_id: wanted[product_id] for product_id, result in zip(product_ids, results) if isinstance(result, dict)}
+    missed = [product_id for product_id, result in zip(product_ids, results) if not isinstance(result, dict)]
+
+    error = next((result for result in results if isinstance(result, Exception)), None)
+    if error:
+        await _restock(db, taken)
+        raise error
+
+    shortfall = None
+    if missed:
+        products = await db.products.find(
+            {"_id": {"$in": missed}}, {"name": 1, "stock_quantity": 1}
+        ).to_list(None)
+        by_id = {p["_id"]: p for p in products}
+        for product_id in missed:
+            product = by_id.get(product_id)
+            if product and "stock_quantity" not in product:
+                continue
+            shortfall = {
+                "product_id": str(product_id),
+                "name": product.get("name") if product else names[product_id],
+                "requested": wanted[product_id],
+                "available": max(0, product.get("stock_quantity", 0)) if product else 0
+            }
+            break
+
+    if shortfall:
+        await _restock(db, taken)
+        return shortfall
+
+    await _sync_stock_levels(db, [result for result in results if isinstance(result, dict)])
+    if taken:
+        now = datetime.utcnow()
+        await db.stock_reservations.insert_one({
+            "_id": order_id,
+            "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in taken.items()],
+            "status": "held",
+            "created_at": now,
+            "expires_at": now + ttl
+        })
+    return None
+
+async def release_stock(db, order_id, reason: str, include_committed: bool = False) -> bool:
+    """Give the order's held stock back. include_committed also returns stock
+    of a paid order (admin cancelling it). False if there was nothing to release"""
+    statuses = ["held", "committed"] if include_committed else ["held"]
+    reservation = await db.stock_reservations.find_one_and_update(
+        {"_id": ObjectId(order_id), "status": {"$in": statuses}},
+        {"$set": {"status": "released", "released_at": datetime.utcnow(), "release_reason": reason}},
+        projection={"items": 1}
+    )
+    if not reservation:
+        return False
+
+    await _restock(db, {item["product_id"]: item["quantity"] for item in reservation["items"]})
+    logger.info(f"📦 Released stock of order {order_id} ({reason})")
+    return True
+
+async def commit_stock(db, order_id) -> bool:
+    """Order paid - keep its stock. A hold released before the payment arrived
+    is taken again, even if that oversells. False if the order has no reservation"""
+    reservation = await db.stock_reservations.find_one_and_update(
+        {"_id": ObjectId(order_id), "status": {"$in": ["held", "released"]}},
+        {"$set": {"status": "committed", "committed_at": datetime.utcnow()}},
+        projection={"items": 1, "status": 1}
+    )
+    if not reservation:
+        return False
+
+    if reservation["status"] == "released":
+        await _restock(db, {item["product_id"]: -item["quantity"] for item in reservation["items"]})
+        logger.warning(f"⚠️ Order {order_id} paid after its stock hold was released - stock taken again")
+    return True
+
+# ==================== SWEEPER ====================
+
+async def release_expired_reservations(db) -> int:
+    """Release holds past their TTL unless the order got paid or a payment is
+    on its way (those get another TTL). Returns the number released"""
+    now = datetime.utcnow()
+    expired = await db.stock_reservations.find(
+        {"status": "held", "expires_at": {"$lte": now}}, {"_id": 1}
+    ).to_list(None)
+    if not expired:
+        return 0
+
+    busy_orders = await db.orders.find({
+        "_id": {"$in": [r["_id"] for r in expired]},
+        "$or": [
+            {"status": {"$in": STOCK_KEPT_STATUSES}},
+            {"payment.latest_status": {"$in": PAYMENT_IN_FLIGHT}}
+        ]
+    }, {"_id": 1}).to_list(None)
+    busy = {order["_id"] for order in busy_orders}
+    if busy:
+        await db.stock_reservations.update_many(
+            {"_id": {"$in": list(busy)}, "status": "held"},
+            {"$set": {"expires_at": now + RESERVATION_TTL}}
+        )
+
+    released = 0
+    for reservation in expired:
+        if reservation["_id"] not in busy and await release_stock(db, reservation["_id"], "expired"):
+            released += 1
+    return released
+
+async def stock_reservation_sweeper(db, interval: int = SWEEP_INTERVAL):
+    """Background task - indexes, then releases lapsed holds every interval"""
+    try:
+        await ensure_stock_indexes(db)
+    except Exception as e:
+        logger.error(f"Error creating stock reservation indexes: {e}")
+
+    while True:
+        try:
+            await release_expired_reservations(db)
+        except Exception as e:
+            logger.error(f"Error releasing expired stock reservations: {e}")
+        await asyncio.sleep(interval)
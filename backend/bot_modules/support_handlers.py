@@ -6,19 +6,24 @@ import logging
 
 from .support_tickets import *
 from .database import db
+from .session_store import session_store
 
 logger = logging.getLogger(__name__)
 
 SELECTING_CATEGORY, ENTERING_SUBJECT, ENTERING_DESCRIPTION, REPLYING_TO_TICKET = range(4)
+# Latest messages shown in the chat - Telegram caps a message at 4096 characters
+CONVERSATION_MESSAGES = 10
 
-user_ticket_context = {}
-user_ticket_state = {}
+user_ticket_context = session_store.namespace("ticket_context")
+user_ticket_state = session_store.namespace("ticket_state")
+# Ticket number the user is typing a reply to
+user_ticket_reply = session_store.namespace("ticket_reply")
 
 async def show_support_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = update.effective_user
     
-    user_ticket_state[user.id] = SELECTING_CATEGORY
+    await user_ticket_state.set(user.id, SELECTING_CATEGORY)
     
     keyboard = [
         [
@@ -55,18 +60,18 @@ async def handle_category_selection_callback(update: Update, context: ContextTyp
     
     if query.data == "my_tickets":
         await show_user_tickets(update, context)
-        user_ticket_state.pop(user_id, None)
+        await user_ticket_state.pop(user_id, None)
         return
     
     if query.data == "home":
         from .handlers import start_command
         await start_command(update, context)
-        user_ticket_state.pop(user_id, None)
+        await user_ticket_state.pop(user_id, None)
         return
     
     category = query.data.replace("ticket_cat_", "")
-    user_ticket_context[user_id] = {"category": category}
-    user_ticket_state[user_id] = ENTERING_SUBJECT
+    await user_ticket_context.set(user_id, {"category": category})
+    await user_ticket_state.set(user_id, ENTERING_SUBJECT)
     
     await query.edit_message_text(
         f"📝 *Creating Ticket - {category.upper()}*\n\n"
@@ -76,7 +81,7 @@ async def handle_category_selection_callback(update: Update, context: ContextTyp
 
 async def support_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    user_ticket_state[user.id] = SELECTING_CATEGORY
+    await user_ticket_state.set(user.id, SELECTING_CATEGORY)
     
     keyboard = [
         [
@@ -126,7 +131,7 @@ async def handle_category_selection(update: Update, context: ContextTypes.DEFAUL
         return ConversationHandler.END
     
     category = query.data.replace("ticket_cat_", "")
-    user_ticket_context[user_id] = {"category": category}
+    await user_ticket_context.set(user_id, {"category": category})
     
     await query.edit_message_text(
         f"📝 *Creating Ticket - {category.upper()}*\n\n"
@@ -144,8 +149,10 @@ async def handle_subject_input(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ Subject too short. Please enter at least 5 characters.")
         return ENTERING_SUBJECT
     
-    user_ticket_context[user_id]["subject"] = subject
-    user_ticket_state[user_id] = ENTERING_DESCRIPTION
+    ticket_context = await user_ticket_context.get(user_id, {})
+    ticket_context["subject"] = subject
+    await user_ticket_context.set(user_id, ticket_context)
+    await user_ticket_state.set(user_id, ENTERING_DESCRIPTION)
     
     await update.message.reply_text(
         "📝 *Describe your issue in detail:*\n\n"
@@ -165,7 +172,7 @@ async def handle_description_input(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("❌ Description too short. Please provide more details.")
         return ENTERING_DESCRIPTION
     
-    ticket_data = user_ticket_context.get(user.id, {})
+    ticket_data = await user_ticket_context.get(user.id, {})
     
     order_number = None
     for word in description.split():
@@ -215,15 +222,15 @@ async def handle_description_input(update: Update, context: ContextTypes.DEFAULT
         traceback.print_exc()
         await update.message.reply_text("❌ An error occurred while creating the ticket. Please try again.")
     
-    user_ticket_context.pop(user.id, None)
-    user_ticket_state.pop(user.id, None)
+    await user_ticket_context.pop(user.id, None)
+    await user_ticket_state.pop(user.id, None)
     return ConversationHandler.END
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    state = user_ticket_state.get(user_id)
+    state = await user_ticket_state.get(user_id)
     
-    logger.info(f"=== SUPPORT TEXT HANDLER: User {user_id}, State: {state}, States dict: {user_ticket_state}")
+    logger.info(f"=== SUPPORT TEXT HANDLER: User {user_id}, State: {state}")
     
     if state == ENTERING_SUBJECT:
         logger.info(f"User {user_id} entering ticket subject")
@@ -234,8 +241,10 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text("❌ Subject too short. Please enter at least 5 characters.")
             return
         
-        user_ticket_context[user_id]["subject"] = subject
-        user_ticket_state[user_id] = ENTERING_DESCRIPTION
+        ticket_context = await user_ticket_context.get(user_id, {})
+        ticket_context["subject"] = subject
+        await user_ticket_context.set(user_id, ticket_context)
+        await user_ticket_state.set(user_id, ENTERING_DESCRIPTION)
         logger.info(f"Subject saved for user {user_id}: {subject}")
         
         await update.message.reply_text(
@@ -253,7 +262,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text("❌ Description too short. Please provide more details.")
             return
         
-        ticket_data = user_ticket_context.get(user_id, {})
+        ticket_data = await user_ticket_context.get(user_id, {})
         logger.info(f"Ticket data for user {user_id}: {ticket_data}")
         
         order_number = None
@@ -306,25 +315,25 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             traceback.print_exc()
             await update.message.reply_text("❌ An error occurred while creating the ticket. Please try again.")
         
-        user_ticket_context.pop(user_id, None)
-        user_ticket_state.pop(user_id, None)
+        await user_ticket_context.pop(user_id, None)
+        await user_ticket_state.pop(user_id, None)
         logger.info(f"Cleared ticket state for user {user_id}")
         
     elif state == REPLYING_TO_TICKET:
         logger.info(f"User {user_id} replying to ticket")
         user = update.effective_user
         message = update.message.text
-        ticket_number = context.user_data.get("replying_to_ticket")
+        ticket_number = await user_ticket_reply.get(user_id)
         
         if not ticket_number:
             await update.message.reply_text("❌ Error: No ticket selected.")
-            user_ticket_state.pop(user_id, None)
+            await user_ticket_state.pop(user_id, None)
             return
         
         ticket = await get_ticket_by_number(ticket_number)
         if not ticket:
             await update.message.reply_text("❌ Ticket not found.")
-            user_ticket_state.pop(user_id, None)
+            await user_ticket_state.pop(user_id, None)
             return
         
         success = await add_ticket_message(
@@ -345,8 +354,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         else:
             await update.message.reply_text("❌ Failed to add reply.")
         
-        context.user_data.pop("replying_to_ticket", None)
-        user_ticket_state.pop(user_id, None)
+        await user_ticket_reply.pop(user_id, None)
+        await user_ticket_state.pop(user_id, None)
     else:
         logger.warning(f"Unknown state {state} for user {user_id}")
 
@@ -434,9 +443,9 @@ async def view_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"💬 *Conversation:*\n\n"
     )
     
-    for msg in ticket.get("messages", []):
+    for msg in await get_ticket_messages(ticket["_id"], limit=CONVERSATION_MESSAGES):
         sender = "You" if msg["sender_type"] == "customer" else "Support"
-        time = msg["timestamp"].strftime("%H:%M")
+        time = msg["created_at"].strftime("%H:%M")
         text += f"*{sender}* ({time}):\n{msg['message']}\n\n"
     
     keyboard = []
@@ -461,8 +470,8 @@ async def handle_ticket_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     if query.data.startswith("reply_ticket_"):
         ticket_number = query.data.replace("reply_ticket_", "")
-        context.user_data["replying_to_ticket"] = ticket_number
-        user_ticket_state[user_id] = REPLYING_TO_TICKET
+        await user_ticket_reply.set(user_id, ticket_number)
+        await user_ticket_state.set(user_id, REPLYING_TO_TICKET)
         
         await query.edit_message_text(
             f"💬 *Reply to Ticket {ticket_number}*\n\n"
@@ -488,7 +497,7 @@ async def handle_ticket_reply(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def process_ticket_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     message = update.message.text
-    ticket_number = context.user_data.get("replying_to_ticket")
+    ticket_number = await user_ticket_reply.get(user.id)
     
     if not ticket_number:
         await update.message.reply_text("❌ Error: No ticket selected.")
@@ -517,8 +526,8 @@ async def process_ticket_reply(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await update.message.reply_text("❌ Failed to add reply.")
     
-    context.user_data.pop("replying_to_ticket", None)
-    user_ticket_state.pop(user.id, None)
+    await user_ticket_reply.pop(user.id, None)
+    await user_ticket_state.pop(user.id, None)
     return ConversationHandler.END
 
 async def mytickets_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -8,6 +8,11 @@ import logging
 
 from .config import MONGODB_URI, BOT_TOKEN
 from .database import db
+from .id_service import next_ticket_number, insert_with_sequence
+from .ticket_messages import (
+    TICKET_LIST_PROJECTION, new_message, ticket_counters,
+    add_message, get_messages, mark_read
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +39,7 @@ class TicketCategory(str, Enum):
     OTHER = "other"
 
 async def generate_ticket_number() -> str:
-    count = await db.support_tickets.count_documents({})
-    year = datetime.now().year
-    ticket_number = f"TKT-{year}-{count + 1:04d}"
-    return ticket_number
+    return await next_ticket_number(db)
 
 async def create_support_ticket(
     telegram_id: int,
@@ -51,10 +53,9 @@ async def create_support_ticket(
     last_name: Optional[str] = None
 ) -> Dict[str, Any]:
     
-    ticket_number = await generate_ticket_number()
-    
+    first_message = new_message(ObjectId(), telegram_id, "customer", description)
     ticket_data = {
-        "ticket_number": ticket_number,
+        "_id": first_message["ticket_id"],
         "telegram_id": telegram_id,
         "username": username,
         "first_name": first_name,
@@ -67,13 +68,7 @@ async def create_support_ticket(
         "priority": priority,
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow(),
-        "messages": [{
-            "sender_id": telegram_id,
-            "sender_type": "customer",
-            "message": description,
-            "timestamp": datetime.utcnow(),
-            "read": False
-        }],
+        **ticket_counters(first_message),
         "assigned_to": None,
         "assigned_username": None,
         "resolved_at": None,
@@ -84,34 +79,32 @@ async def create_support_ticket(
         "feedback": None
     }
     
-    result = await db.support_tickets.insert_one(ticket_data)
+    result = await insert_with_sequence(db.support_tickets, ticket_data, "ticket_number", generate_ticket_number)
+    await db.ticket_messages.insert_one(first_message)
     ticket_data["_id"] = str(result.inserted_id)
     
     return ticket_data
 
 async def get_ticket_by_id(ticket_id: str) -> Optional[Dict[str, Any]]:
-    ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)})
+    ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)}, TICKET_LIST_PROJECTION)
     if ticket:
         ticket["_id"] = str(ticket["_id"])
     return ticket
 
 async def get_ticket_by_number(ticket_number: str) -> Optional[Dict[str, Any]]:
-    ticket = await db.support_tickets.find_one({"ticket_number": ticket_number})
+    ticket = await db.support_tickets.find_one({"ticket_number": ticket_number}, TICKET_LIST_PROJECTION)
     if ticket:
         ticket["_id"] = str(ticket["_id"])
     return ticket
 
 async def get_user_tickets(telegram_id: int, limit: int = 10) -> List[Dict[str, Any]]:
     tickets = await db.support_tickets.find(
-        {"telegram_id": telegram_id}
+        {"telegram_id": telegram_id}, TICKET_LIST_PROJECTION
     ).sort("created_at", -1).limit(limit).to_list(limit)
     
     for ticket in tickets:
         ticket["_id"] = str(ticket["_id"])
-        ticket["unread_count"] = sum(
-            1 for msg in ticket.get("messages", [])
-            if msg.get("sender_type") == "admin" and not msg.get("read", False)
-        )
+        ticket["unread_count"] = ticket.get("unread_customer", 0)
     
     return tickets
 
@@ -123,51 +116,19 @@ async def add_ticket_message(
     attachments: Optional[List[str]] = None
 ) -> bool:
     
-    message_data = {
-        "sender_id": sender_id,
-        "sender_type": sender_type,
-        "message": message,
-        "timestamp": datetime.utcnow(),
-        "read": False,
-        "attachments": attachments or []
-    }
-    
     status_update = {}
     if sender_type == "customer":
         status_update = {"status": TicketStatus.WAITING_ADMIN}
     elif sender_type == "admin":
         status_update = {"status": TicketStatus.WAITING_CUSTOMER}
     
-    result = await db.support_tickets.update_one(
-        {"_id": ObjectId(ticket_id)},
-        {
-            "$push": {"messages": message_data},
-            "$set": {
-                "updated_at": datetime.utcnow(),
-                **status_update
-            }
-        }
-    )
-    
-    return result.modified_count > 0
+    return await add_message(db, ticket_id, sender_id, sender_type, message, attachments, status_update)
+
+async def get_ticket_messages(ticket_id: str, before: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    return await get_messages(db, ticket_id, before, limit)
 
 async def mark_messages_as_read(ticket_id: str, reader_type: str) -> bool:
-    
-    ticket = await get_ticket_by_id(ticket_id)
-    if not ticket:
-        return False
-    
-    messages = ticket.get("messages", [])
-    for msg in messages:
-        if msg.get("sender_type") != reader_type:
-            msg["read"] = True
-    
-    result = await db.support_tickets.update_one(
-        {"_id": ObjectId(ticket_id)},
-        {"$set": {"messages": messages}}
-    )
-    
-    return result.modified_count > 0
+    return await mark_read(db, ticket_id, reader_type)
 
 async def update_ticket_status(
     ticket_id: str,
@@ -216,14 +177,12 @@ async def get_all_tickets(
     if assigned_to is not None:
         query["assigned_to"] = assigned_to
     
-    tickets = await db.support_tickets.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    tickets = await db.support_tickets.find(
+        query, TICKET_LIST_PROJECTION
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
     for ticket in tickets:
         ticket["_id"] = str(ticket["_id"])
-        ticket["unread_admin"] = sum(
-            1 for msg in ticket.get("messages", [])
-            if msg.get("sender_type") == "customer" and not msg.get("read", False)
-        )
     
     total = await db.support_tickets.count_documents(query)
     open_count = await db.support_tickets.count_documents({"status": TicketStatus.OPEN})
@@ -316,7 +275,7 @@ async def search_tickets(query: str, limit: int = 50) -> List[Dict[str, Any]]:
         ]
     }
     
-    tickets = await db.support_tickets.find(search_filter).sort("created_at", -1).limit(limit).to_list(limit)
+    tickets = await db.support_tickets.find(search_filter, TICKET_LIST_PROJECTION).sort("created_at", -1).limit(limit).to_list(limit)
     
     for ticket in tickets:
         ticket["_id"] = str(ticket["_id"])
@@ -0,0 +1,198 @@
+"""
+Ticket messages - support ticket conversations in their own collection
+
+Each reply is one document in ticket_messages, indexed by (ticket_id,
+created_at, _id), instead of an element of an ever-growing array on the ticket.
+The ticket keeps what lists need: message_count, a short last_message and
+two unread counters - unread_admin (customer messages the admin hasn't
+read) and unread_customer (admin replies the customer hasn't read). Lists
+read tickets with TICKET_LIST_PROJECTION and never touch message bodies.
+
+Tickets created before this still carry a messages array;
+migrate_embedded_messages() moves those out once.
+
+Functions take the db handle - the bot and the API each have their own client.
+"""
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 200
+MIGRATION_BATCH = 100
+# Legacy embedded arrays are never sent to lists
+TICKET_LIST_PROJECTION = {"messages": 0}
+# Whose unread counter a message raises, by sender_type
+UNREAD_FIELD = {"customer": "unread_admin", "admin": "unread_customer"}
+
+# ==================== MESSAGES ====================
+
+def message_preview(message: dict) -> dict:
+    """The ticket's last_message for a message document"""
+    return {
+        "sender_type": message["sender_type"],
+        "message": (message.get("message") or "")[:PREVIEW_LENGTH],
+        "created_at": message["created_at"]
+    }
+
+def new_message(ticket_id, sender_id: int, sender_type: str, message: str,
+                attachments: Optional[List[str]] = None) -> dict:
+    return {
+        "ticket_id": ObjectId(ticket_id),
+        "sender_id": sender_id,
+        "sender_type": sender_type,
+        "message": message,
+        "attachments": attachments or [],
+        "read": False,
+        "created_at": datetime.utcnow()
+    }
+
+def ticket_counters(message: dict) -> dict:
+    """Counter fields of a ticket whose only message is this one"""
+    counters = {"message_count": 1, "last_message": message_preview(message),
+                "unread_admin": 0, "unread_customer": 0}
+    unread_field = UNREAD_FIELD.get(message["sender_type"])
+    if unread_field:
+        counters[unread_field] = 1
+    return counters
+
+async def add_message(db, ticket_id, sender_id: int, sender_type: str, message: str,
+                      attachments: Optional[List[str]] = None, ticket_set: Optional[dict] = None) -> bool:
+    """Store a message and update the ticket's counters (plus ticket_set).
+    False if the ticket doesn't exist"""
+    message_data = new_message(ticket_id, sender_id, sender_type, message, attachments)
+
+    inc = {"message_count": 1}
+    unread_field = UNREAD_FIELD.get(sender_type)
+    if unread_field:
+        inc[unread_field] = 1
+
+    # Ticket first - no orphan messages for a ticket that was deleted
+    result = await db.support_tickets.update_one(
+        {"_id": message_data["ticket_id"]},
+        {
+            "$inc": inc,
+            "$set": {
+                "last_message": message_preview(message_data),
+                "updated_at": message_data["created_at"],
+                **(ticket_set or {})
+            }
+        }
+    )
+    if result.matched_count == 0:
+        return False
+
+    await db.ticket_messages.insert_one(message_data)
+    return True
+
+async def get_messages(db, ticket_id, before: Optional[str] = None, limit: int = 50) -> List[dict]:
+    """A page of the conversation in chronological order - the latest limit
+    messages older than the message with _id before (the newest without it).
+    Paging by message rather than by offset, so replies arriving meanwhile
+    don't shift the pages"""
+    query = {"ticket_id": ObjectId(ticket_id)}
+    if before:
+        anchor = await db.ticket_messages.find_one({"_id": ObjectId(before)}, {"created_at": 1})
+        if not anchor:
+            return []
+        query["$or"] = [
+            {"created_at": {"$lt": anchor["created_at"]}},
+            {"created_at": anchor["created_at"], "_id": {"$lt": anchor["_id"]}}
+        ]
+
+    messages = await db.ticket_messages.find(query).sort(
+        [("created_at", DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit).to_list(limit)
+    messages.reverse()
+
+    for message in messages:
+        message["_id"] = str(message["_id"])
+        message["ticket_id"] = str(message["ticket_id"])
+    return messages
+
+async def mark_read(db, ticket_id, reader_type: str) -> bool:
+    """Mark the other side's messages as read by reader_type"""
+    ticket_id = ObjectId(ticket_id)
+    sender_type = "admin" if reader_type == "customer" else "customer"
+
+    result = await db.ticket_messages.update_many(
+        {"ticket_id": ticket_id, "sender_type": sender_type, "read": False},
+        {"$set": {"read": True}}
+    )
+    # Take off only what was marked - add_message counts a reply before
+    # inserting it, so a reply in flight stays counted either way
+    if result.modified_count:
+        await db.support_tickets.update_one(
+            {"_id": ticket_id},
+            {"$inc": {UNREAD_FIELD[sender_type]: -result.modified_count}}
+        )
+    return result.modified_count > 0
+
+async def delete_messages(db, ticket_id) -> int:
+    result = await db.ticket_messages.delete_many({"ticket_id": ObjectId(ticket_id)})
+    return result.deleted_count
+
+# ==================== MIGRATION ====================
+
+async def ensure_ticket_message_indexes(db):
+    await db.ticket_messages.create_index([("ticket_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)])
+
+async def migrate_embedded_messages(db, batch_size: int = MIGRATION_BATCH) -> int:
+    """Move messages arrays out of old tickets into ticket_messages and set
+    the counters. Returns the number of tickets migrated"""
+    cursor = db.support_tickets.find(
+        {"messages": {"$exists": True}}, {"messages": 1}
+    ).batch_size(batch_size)
+
+    migrated = 0
+    async for ticket in cursor:
+        messages = []
+        for msg in ticket.get("messages") or []:
+            messages.append({
+                "ticket_id": ticket["_id"],
+                "sender_id": msg.get("sender_id"),
+                "sender_type": msg.get("sender_type"),
+                "message": msg.get("message"),
+                "attachments": msg.get("attachments") or [],
+                "read": msg.get("read", False),
+                "created_at": msg.get("timestamp") or datetime.utcnow(),
+                "migrated": True
+            })
+
+        # $inc - replies added after the deploy already counted themselves
+        counters = {"message_count": len(messages), "unread_admin": 0, "unread_customer": 0}
+        for message in messages:
+            unread_field = UNREAD_FIELD.get(message["sender_type"])
+            if unread_field and not message["read"]:
+                counters[unread_field] += 1
+
+        # Drop copies left by an earlier run that stopped half way
+        await db.ticket_messages.delete_many({"ticket_id": ticket["_id"], "migrated": True})
+        if messages:
+            await db.ticket_messages.insert_many(messages)
+        await db.support_tickets.update_one(
+            {"_id": ticket["_id"]},
+            {"$inc": counters, "$unset": {"messages": ""}}
+        )
+        if messages:
+            await db.support_tickets.update_one(
+                {"_id": ticket["_id"], "last_message": {"$exists": False}},
+                {"$set": {"last_message": message_preview(messages[-1])}}
+            )
+        migrated += 1
+
+    if migrated:
+        logger.info(f"🎫 Moved messages of {migrated} tickets to ticket_messages")
+    return migrated
+
+async def ticket_messages_migration(db):
+    """Background task - index, then move embedded messages out of old tickets"""
+    try:
+        await ensure_ticket_message_indexes(db)
+        await migrate_embedded_messages(db)
+    except Exception as e:
+        logger.error(f"Error migrating ticket messages: {e}")
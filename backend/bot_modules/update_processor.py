@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = int(os.getenv("BOT_MAX_CONCURRENT_UPDATES", "32"))
+# Updates accepted into the per-user queues before PTB holds new ones back
+MAX_PENDING_UPDATES = int(os.getenv("BOT_MAX_PENDING_UPDATES", "4096"))
+
+def update_user_key(update) -> Optional[int]:
+    """Updates of the same user (or chat, if there is no user) must stay in order"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+class _QueuedUpdate:
+    __slots__ = ("coroutine", "future")
+
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+        self.future = asyncio.get_running_loop().create_future()
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Shards updates by user onto per-user FIFO queues drained by a shared
+    worker pool.
+
+    A user is handed to at most one worker at a time, so one user's rapid
+    taps (quantity +/-, add to cart) never race on their cart or state,
+    while different users run in parallel. Users with queued work take
+    turns (one update per turn), so a flood from one user can't starve
+    the others.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, max_pending: int = MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending, workers))
+        self.workers = workers
+        self._queues: Dict[Any, Deque[_QueuedUpdate]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._running = 0
+        self._queued = 0
+        self.pending = 0  # accepted but not finished, including updates waiting for a slot
+        self.stats = {
+            "processed": 0,
+            "failed": 0,
+            "max_user_queue": 0,
+            "max_queued": 0
+        }
+
+    async def initialize(self) -> None:
+        if self._worker_tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"update_worker_{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"✅ Update processor: {self.workers} workers, per-user ordering")
+
+    async def shutdown(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+        for queue in self._queues.values():
+            for item in queue:
+                item.coroutine.close()
+                item.future.cancel()
+        self._queues.clear()
+        self._queued = 0
+
+    async def process_update(self, update, coroutine) -> None:
+        self.pending += 1
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self.pending -= 1
+
+    async def do_process_update(self, update, coroutine) -> None:
+        item = _QueuedUpdate(coroutine)
+        key = update_user_key(update)
+        if key is None:
+            key = item  # nothing to order against - runs on its own
+
+        queue = self._queues.get(key)
+        if queue is None:
+            # User wasn't queued or running - give them a turn
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append(item)
+        self._queued += 1
+
+        self.stats["max_user_queue"] = max(self.stats["max_user_queue"], len(queue))
+        self.stats["max_queued"] = max(self.stats["max_queued"], self._queued)
+
+        await item.future
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues.get(key)
+            if not queue:
+                self._queues.pop(key, None)
+                continue
+
+            item = queue.popleft()
+            self._queued -= 1
+            self._running += 1
+            try:
+                if item.future.done():
+                    item.coroutine.close()
+                else:
+                    await item.coroutine
+                    self.stats["processed"] += 1
+                    item.future.set_result(None)
+            except asyncio.CancelledError:
+                if not item.future.done():
+                    item.future.cancel()
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Error processing update for {key}: {e}")
+                if not item.future.done():
+                    item.future.set_result(None)
+            finally:
+                self._running -= 1
+
+            if queue:
+                # Back of the line - other users get a turn first
+                self._ready.put_nowait(key)
+            else:
+                del self._queues[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lengths = [len(queue) for queue in self._queues.values()]
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self._queued,
+            "users_waiting": sum(1 for length in lengths if length),
+            "longest_user_queue": max(lengths) if lengths else 0,
+            "pending": self.pending,
+            **self.stats,
+            "updated_at": datetime.utcnow()
+        }
+
+async def report_update_metrics(db, processor, interval: int = 30):
+    """Background task - publishes update queue metrics so the admin API can show them"""
+    while True:
+        try:
+            await asyncio.sleep(interval)
+            if isinstance(processor, UserOrderedUpdateProcessor):
+                await db.bot_metrics.update_one(
+                    {"_id": "update_processor"},
+                    {"$set": processor.get_metrics()},
+                    upsert=True
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reporting update metrics: {e}")
@@ -13,9 +13,21 @@ from main_modules.endpoints_system import router_system
 from main_modules.endpoints_chat_admin import router_chat_admin
 from main_modules.endpoints_notification_media import router_notification_media
 from main_modules.helpers import setup_chat_indexes
+from main_modules.chat_archive import chat_archive_scheduler
+from main_modules.config import db
+from bot_modules.seller_ledger import seller_ledger_scheduler
+from bot_modules.order_items import order_items_migration
+from bot_modules.stock import stock_reservation_sweeper
+from bot_modules.referrals import ensure_referral_indexes
+from bot_modules.id_service import ensure_id_sequences
+from bot_modules.ticket_messages import ticket_messages_migration
 from main_modules import endpoints_payouts
 from main_modules.endpoints_notifications import router as router_notifications
 from main_modules.endpoints_tickets import router_tickets
+from main_modules.telegram_webhook import (
+    router_telegram_webhook, TELEGRAM_WEBHOOK_URL,
+    start_telegram_webhook, stop_telegram_webhook
+)
 
 load_dotenv()
 
@@ -47,6 +59,25 @@ async def lifespan(app: FastAPI):
         await setup_chat_indexes()
         logger.info("Chat system initialized")
         
+        await endpoints_payouts.ensure_payout_indexes()
+        await ensure_referral_indexes(db)
+        await ensure_id_sequences(db)
+        
+        asyncio.create_task(order_items_migration(db))
+        asyncio.create_task(ticket_messages_migration(db))
+        
+        asyncio.create_task(chat_archive_scheduler())
+        logger.info("Started chat archive scheduler")
+        
+        asyncio.create_task(seller_ledger_scheduler(db))
+        logger.info("Started seller ledger reconciliation")
+        
+        asyncio.create_task(stock_reservation_sweeper(db))
+        logger.info("Started stock reservation sweeper")
+        
+        if TELEGRAM_WEBHOOK_URL:
+            await start_telegram_webhook()
+        
     except Exception as e:
         logger.error(f"Startup error: {e}")
         import traceback
@@ -54,6 +85,7 @@ async def lifespan(app: FastAPI):
     
     yield
     logger.info("Shutting down...")
+    await stop_telegram_webhook()
 
 app = FastAPI(
     title="AnabolicPizza API - Enhanced with NOWPayments",
@@ -78,6 +110,7 @@ app.include_router(router_notification_media)
 app.include_router(endpoints_payouts.router)
 app.include_router(router_notifications)
 app.include_router(router_tickets)
+app.include_router(router_telegram_webhook)
 
 
 try:
@@ -0,0 +1,176 @@
+# CHAT ARCHIVE - keeps chat_messages small by moving old messages to monthly collections
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .config import db, CHAT_HOT_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "chat_messages_archive_"
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_RUN_HOUR = 3  # UTC
+# chat_archive_counts document marking that counts were built for users
+# archived before they were kept (string _id - users are keyed by telegram_id)
+COUNTS_BACKFILL_MARKER = "backfilled"
+
+def archive_collection_name(timestamp: datetime) -> str:
+    """Monthly archive collection for a message timestamp"""
+    return f"{ARCHIVE_PREFIX}{timestamp.year:04d}_{timestamp.month:02d}"
+
+async def list_archive_collections() -> List[str]:
+    """Archive collection names, newest month first"""
+    names = await db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}"}})
+    return sorted(names, reverse=True)
+
+async def _copy_to_archive(name: str, docs: list):
+    collection = db[name]
+    await collection.create_index([("telegram_id", 1), ("timestamp", -1)])
+
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Re-running after an interrupted batch - already archived copies are fine
+        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        if errors:
+            raise
+
+async def archive_old_messages(hot_days: int = CHAT_HOT_RETENTION_DAYS) -> int:
+    """Move messages older than hot_days from chat_messages into monthly archives"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=hot_days)
+    archived = 0
+    await backfill_archive_counts()
+
+    while True:
+        batch = await db.chat_messages.find(
+            {"timestamp": {"$lt": cutoff}}
+        ).sort("timestamp", 1).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+
+        if not batch:
+            break
+
+        by_month = {}
+        for msg in batch:
+            msg["archived_at"] = datetime.now(timezone.utc)
+            by_month.setdefault(archive_collection_name(msg["timestamp"]), []).append(msg)
+
+        for name, docs in by_month.items():
+            await _copy_to_archive(name, docs)
+
+        # Only delete after every copy is safely written
+        await db.chat_messages.delete_many({"_id": {"$in": [msg["_id"] for msg in batch]}})
+        await _add_archive_counts(batch)
+        archived += len(batch)
+
+        await asyncio.sleep(0.05)
+
+    if archived:
+        logger.info(f"Archived {archived} chat messages older than {hot_days} days")
+
+    return archived
+
+async def _add_archive_counts(batch: list):
+    """Add an archived batch to the per-user counts"""
+    counts = {}
+    for msg in batch:
+        key = (msg.get("telegram_id"), archive_collection_name(msg["timestamp"]))
+        counts[key] = counts.get(key, 0) + 1
+
+    await db.chat_archive_counts.bulk_write([
+        UpdateOne({"_id": telegram_id}, {"$inc": {f"months.{name}": count}}, upsert=True)
+        for (telegram_id, name), count in counts.items()
+    ], ordered=False)
+
+async def backfill_archive_counts():
+    """Count, once, the archives written before per-user counts were kept.
+    Only called outside an archive run - with no batch half counted, the
+    counts are exact and replace whatever was there"""
+    if await db.chat_archive_counts.find_one({"_id": COUNTS_BACKFILL_MARKER}):
+        return
+
+    months_by_user = {}
+    for name in await list_archive_collections():
+        async for row in db[name].aggregate([{"$group": {"_id": "$telegram_id", "count": {"$sum": 1}}}]):
+            months_by_user.setdefault(row["_id"], {})[name] = row["count"]
+
+    if months_by_user:
+        await db.chat_archive_counts.bulk_write([
+            UpdateOne({"_id": telegram_id}, {"$set": {"months": months}}, upsert=True)
+            for telegram_id, months in months_by_user.items()
+        ], ordered=False)
+    await db.chat_archive_counts.update_one(
+        {"_id": COUNTS_BACKFILL_MARKER}, {"$set": {"at": datetime.now(timezone.utc)}}, upsert=True
+    )
+    logger.info(f"Counted archived chat messages of {len(months_by_user)} users")
+
+async def get_archive_counts(telegram_id: int) -> Dict[str, int]:
+    """Archived messages of a user per archive collection. Written only by
+    archive_old_messages() - no document means nothing archived"""
+    doc = await db.chat_archive_counts.find_one({"_id": telegram_id})
+    return doc.get("months", {}) if doc else {}
+
+async def get_archived_messages(telegram_id: int, skip: int, limit: int,
+                                counts: Optional[Dict[str, int]] = None) -> list:
+    """Read-through into archives, newest first. Only collections that hold
+    the requested page are queried"""
+    if counts is None:
+        counts = await get_archive_counts(telegram_id)
+    messages = []
+
+    for name in sorted(counts, reverse=True):
+        collection = db[name]
+        count = counts[name]
+
+        if len(messages) >= limit:
+            break
+
+        if count == 0:
+            continue
+
+        if skip >= count:
+            skip -= count
+            continue
+
+        remaining = limit - len(messages)
+        docs = await collection.find(
+            {"telegram_id": telegram_id}
+        ).sort("timestamp", -1).skip(skip).limit(remaining).to_list(remaining)
+        messages.extend(docs)
+        skip = 0
+
+    return messages
+
+async def delete_archived_conversation(telegram_id: int) -> int:
+    deleted = 0
+    for name in await list_archive_collections():
+        result = await db[name].delete_many({"telegram_id": telegram_id})
+        deleted += result.deleted_count
+    await db.chat_archive_counts.delete_one({"_id": telegram_id})
+    return deleted
+
+def _seconds_until_next_run() -> float:
+    now = datetime.now(timezone.utc)
+    next_run = now.replace(hour=ARCHIVE_RUN_HOUR, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+async def chat_archive_scheduler():
+    """Background task - archives old chat messages every night"""
+    try:
+        await backfill_archive_counts()
+    except Exception as e:
+        logger.error(f"Error counting archived chat messages: {e}")
+
+    while True:
+        try:
+            await asyncio.sleep(_seconds_until_next_run())
+            await archive_old_messages()
+        except Exception as e:
+            logger.error(f"Error in chat archive scheduler: {e}")
+            await asyncio.sleep(300)
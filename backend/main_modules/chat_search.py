@@ -0,0 +1,100 @@
+# CHAT SEARCH - query building, cursor paging and snippet highlighting for /api/chat/search
+
+from bson import ObjectId
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+import re
+
+SNIPPET_RADIUS = 60
+MAX_SEARCH_TERMS = 8
+
+def split_terms(query: str) -> List[str]:
+    """Lowercased search terms, longest first so overlapping highlights prefer full words"""
+    terms = {term.lower() for term in re.findall(r"\w+", query)}
+    return sorted(terms, key=len, reverse=True)[:MAX_SEARCH_TERMS]
+
+def encode_cursor(message: dict) -> str:
+    timestamp = message["timestamp"]
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return f"{int(timestamp.timestamp() * 1000)}_{message['_id']}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    millis, oid = cursor.split("_", 1)
+    return datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc), ObjectId(oid)
+
+def build_search_filter(
+    query: str,
+    telegram_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    partial: bool = False
+) -> dict:
+    """Build the Mongo filter for a chat search.
+
+    A message matches only if it contains every term (AND), on both paths.
+    Whole-word searches use the text index, with each term quoted - $text
+    ORs bare terms but requires every quoted phrase. Partial-word searches
+    (and any search scoped to one user, whose history the
+    telegram_id/timestamp index already bounds) use one case-insensitive
+    regex per term, which $text can't do.
+    """
+    clauses = []
+    terms = split_terms(query)
+
+    if telegram_id:
+        clauses.append({"telegram_id": telegram_id})
+
+    if partial or telegram_id:
+        for term in terms:
+            clauses.append({"message": {"$regex": re.escape(term), "$options": "i"}})
+    else:
+        clauses.append({"$text": {"$search": " ".join(f'"{term}"' for term in terms)}})
+
+    if date_from or date_to:
+        timestamp_range = {}
+        if date_from:
+            timestamp_range["$gte"] = date_from
+        if date_to:
+            timestamp_range["$lte"] = date_to
+        clauses.append({"timestamp": timestamp_range})
+
+    if cursor:
+        timestamp, oid = decode_cursor(cursor)
+        clauses.append({"$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": oid}}
+        ]})
+
+    return {"$and": clauses}
+
+def make_snippet(text: str, terms: List[str]) -> Tuple[str, List[List[int]]]:
+    """Cut a snippet around the first match. Returns (snippet, [[start, end], ...]) highlight offsets"""
+    text = text or ""
+    lowered = text.lower()
+
+    positions = [lowered.find(term) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    first = min(positions) if positions else 0
+
+    start = max(0, first - SNIPPET_RADIUS)
+    end = min(len(text), first + SNIPPET_RADIUS * 2)
+    snippet = text[start:end]
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+
+    window = snippet.lower()
+    taken = [False] * len(window)
+    highlights = []
+    for term in terms:
+        pos = window.find(term)
+        while pos >= 0:
+            if not any(taken[pos:pos + len(term)]):
+                for i in range(pos, pos + len(term)):
+                    taken[i] = True
+                highlights.append([pos + len(prefix), pos + len(prefix) + len(term)])
+            pos = window.find(term, pos + len(term))
+
+    highlights.sort()
+    return f"{prefix}{snippet}{suffix}", highlights
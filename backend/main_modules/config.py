@@ -15,3 +15,6 @@ ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 # Database
 mongo_client = AsyncIOMotorClient(MONGODB_URI)
 db = mongo_client.telegram_shop
+
+# Chat archival - messages older than this many days move to monthly archives
+CHAT_HOT_RETENTION_DAYS = int(os.getenv("CHAT_HOT_RETENTION_DAYS", "30"))
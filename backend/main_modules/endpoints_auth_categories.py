@@ -7,7 +7,7 @@ from typing import Optional
 
 from .config import db, ADMIN_EMAIL, ADMIN_PASSWORD
 from .models import LoginModel, CategoryModel
-from .helpers import create_token, verify_token
+from .helpers import create_token, verify_token, bump_bot_config_version
 
 router_auth_categories = APIRouter()
 
@@ -50,6 +50,7 @@ async def create_category(category: CategoryModel, email: str = Depends(verify_t
     category_dict["created_at"] = datetime.now(timezone.utc)
     
     result = await db.categories.insert_one(category_dict)
+    await bump_bot_config_version("categories", result.inserted_id)
     return {"id": str(result.inserted_id), "message": "Category created"}
 
 @router_auth_categories.put("/api/categories/{category_id}")
@@ -65,6 +66,7 @@ async def update_category(category_id: str, category: CategoryModel, email: str
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    await bump_bot_config_version("categories", category_id)
     return {"message": "Category updated"}
 
 @router_auth_categories.delete("/api/categories/{category_id}")
@@ -78,4 +80,5 @@ async def delete_category(category_id: str, email: str = Depends(verify_token)):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    await bump_bot_config_version("categories", category_id)
     return {"message": "Category deleted"}
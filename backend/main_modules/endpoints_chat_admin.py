@@ -2,6 +2,7 @@
 
 from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime, timezone
 from typing import Optional, List
 import logging
@@ -11,6 +12,9 @@ from .config import db, ADMIN_EMAIL
 from .models import *
 from .helpers import verify_token
 from .websocket import manager, new_message_event, new_message_telegram_id
+from .chat_archive import get_archive_counts, get_archived_messages, delete_archived_conversation
+from .chat_search import build_search_filter, split_terms, make_snippet, encode_cursor
+from bot_modules.seller_ledger import reset_order_commissions
 
 router_chat_admin = APIRouter()
 logger = logging.getLogger(__name__)
@@ -273,6 +277,18 @@ async def get_messages(
         {"telegram_id": telegram_id}
     ).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
     
+    hot_total = await db.chat_messages.count_documents({"telegram_id": telegram_id})
+    
+    archive_counts = await get_archive_counts(telegram_id)
+    archived_total = sum(archive_counts.values())
+    
+    # Paging past the hot window reads through into the monthly archives
+    if len(messages) < limit and archived_total:
+        archive_skip = max(0, skip - hot_total)
+        messages.extend(await get_archived_messages(
+            telegram_id, archive_skip, limit - len(messages), archive_counts
+        ))
+    
     for msg in messages:
         msg["_id"] = str(msg["_id"])
         msg["timestamp"] = msg.get("timestamp", datetime.now(timezone.utc))
@@ -307,7 +323,7 @@ async def get_messages(
     return {
         "messages": list(reversed(messages)),
         "user": user_info,
-        "total": await db.chat_messages.count_documents({"telegram_id": telegram_id})
+        "total": hot_total + archived_total
     }
 
 @router_chat_admin.post("/api/chat/send")
@@ -394,48 +410,75 @@ async def delete_conversation(
         raise HTTPException(status_code=403, detail="Only main admin can delete conversations")
     
     result = await db.chat_messages.delete_many({"telegram_id": telegram_id})
+    messages_deleted = result.deleted_count + await delete_archived_conversation(telegram_id)
     
     await db.audit_logs.insert_one({
         "admin_id": email,
         "action": "DELETE_CONVERSATION",
         "telegram_id": telegram_id,
-        "messages_deleted": result.deleted_count,
+        "messages_deleted": messages_deleted,
         "timestamp": datetime.now(timezone.utc)
     })
     
     return {
         "success": True,
-        "messages_deleted": result.deleted_count
+        "messages_deleted": messages_deleted
     }
 
 @router_chat_admin.get("/api/chat/search")
 async def search_messages(
     query: str,
     telegram_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    partial: bool = False,
     email: str = Depends(verify_token)
 ):
-    """Search in messages"""
+    """Search in messages.
     
-    search_filter = {
-        "$text": {"$search": query}
-    }
+    Results contain all of the query's words, scoped or not. Global searches
+    find them through the text index; partial=true and searches scoped to a
+    telegram_id also match them inside longer words."""
     
-    if telegram_id:
-        search_filter["telegram_id"] = telegram_id
+    terms = split_terms(query)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query required")
     
-    messages = await db.chat_messages.find(
-        search_filter,
-        {"score": {"$meta": "textScore"}}
-    ).sort([("score", {"$meta": "textScore"})]).limit(50).to_list(50)
+    limit = max(1, min(limit, 200))
+    
+    try:
+        search_filter = build_search_filter(query, telegram_id, date_from, date_to, cursor, partial)
+    except (ValueError, OverflowError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Newest first with _id as tiebreaker so cursors stay stable between pages
+    messages = await db.chat_messages.find(search_filter).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_cursor = encode_cursor(messages[-1]) if has_more else None
+    
+    user_ids = list({msg["telegram_id"] for msg in messages})
+    users = await db.users.find(
+        {"telegram_id": {"$in": user_ids}},
+        {"telegram_id": 1, "username": 1}
+    ).to_list(len(user_ids))
+    usernames = {u["telegram_id"]: u.get("username") for u in users}
     
     for msg in messages:
         msg["_id"] = str(msg["_id"])
-        user = await db.users.find_one({"telegram_id": msg["telegram_id"]})
-        msg["username"] = user.get("username", f"User{msg['telegram_id']}") if user else f"User{msg['telegram_id']}"
+        msg["username"] = usernames.get(msg["telegram_id"]) or f"User{msg['telegram_id']}"
+        msg["snippet"], msg["highlights"] = make_snippet(msg.get("message", ""), terms)
     
     return {
         "results": messages,
-        "total": len(messages)
+        "total": len(messages),
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }
 
 @router_chat_admin.get("/api/chat/stats")
@@ -523,6 +566,8 @@ async def clear_orders(email: str = Depends(verify_token)):
     result = await db.orders.delete_many({})
     await db.users.update_many({}, {"$set": {"total_orders": 0, "total_spent_usdt": 0, "referrals_used": []}})
     await db.products.update_many({}, {"$set": {"sold_count": 0}})
+    await reset_order_commissions(db)
+    await db.payout_checkpoints.delete_many({})
     
     return {"message": f"Deleted {result.deleted_count} orders and reset stats"}
 
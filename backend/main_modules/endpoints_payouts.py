@@ -1,13 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime, timedelta
 from bson import ObjectId
-import asyncio
+import hashlib
+import json
+import logging
 from pydantic import BaseModel, Field
 from decimal import Decimal
 from .config import db
+from .payout_pipeline import DeductionPipeline, add_partner_totals
 
 router = APIRouter(prefix="/api/payouts", tags=["payouts"])
+logger = logging.getLogger(__name__)
 
 class PayoutPartner(BaseModel):
     name: str
@@ -40,6 +46,44 @@ class PayoutTransaction(BaseModel):
     payment_method: Optional[str] = "USDT"
     notes: Optional[str] = None
 
+async def ensure_payout_indexes():
+    await db.payout_transactions.create_index([("partner_id", 1), ("status", 1)])
+
+def month_start_utc() -> datetime:
+    now = datetime.utcnow()
+    return datetime(now.year, now.month, 1)
+
+async def partner_transaction_totals(partner_ids: List[ObjectId]) -> dict:
+    """Pending and paid totals for all partners in one $group by (partner_id, status)"""
+    rows = await db.payout_transactions.aggregate([
+        {"$match": {"partner_id": {"$in": partner_ids}, "status": {"$in": ["pending", "paid"]}}},
+        {
+            "$group": {
+                "_id": {"partner_id": "$partner_id", "status": "$status"},
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+                "month_total": {
+                    "$sum": {"$cond": [{"$gte": ["$paid_at", month_start_utc()]}, "$amount", 0]}
+                }
+            }
+        }
+    ]).to_list(None)
+    
+    totals = {
+        partner_id: {"pending_amount": 0, "pending_count": 0, "total_paid": 0, "monthly_paid": 0}
+        for partner_id in partner_ids
+    }
+    for row in rows:
+        partner = totals[row["_id"]["partner_id"]]
+        if row["_id"]["status"] == "pending":
+            partner["pending_amount"] = row["total"]
+            partner["pending_count"] = row["count"]
+        else:
+            partner["total_paid"] = row["total"]
+            partner["monthly_paid"] = row["month_total"]
+    
+    return totals
+
 @router.get("/partners")
 async def get_payout_partners():
     try:
@@ -47,44 +91,14 @@ async def get_payout_partners():
             {"is_active": True}
         ).sort("priority", 1).to_list(None)
         
+        totals = await partner_transaction_totals([partner["_id"] for partner in partners])
+        
         for partner in partners:
+            partner_totals = totals[partner["_id"]]
             partner["_id"] = str(partner["_id"])
-            
-            pending = await db.payout_transactions.aggregate([
-                {
-                    "$match": {
-                        "partner_id": ObjectId(partner["_id"]),
-                        "status": "pending"
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": None,
-                        "total": {"$sum": "$amount"},
-                        "count": {"$sum": 1}
-                    }
-                }
-            ]).to_list(1)
-            
-            partner["pending_amount"] = pending[0]["total"] if pending else 0
-            partner["pending_count"] = pending[0]["count"] if pending else 0
-            
-            paid = await db.payout_transactions.aggregate([
-                {
-                    "$match": {
-                        "partner_id": ObjectId(partner["_id"]),
-                        "status": "paid"
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": None,
-                        "total": {"$sum": "$amount"}
-                    }
-                }
-            ]).to_list(1)
-            
-            partner["total_paid"] = paid[0]["total"] if paid else 0
+            partner["pending_amount"] = partner_totals["pending_amount"]
+            partner["pending_count"] = partner_totals["pending_count"]
+            partner["total_paid"] = partner_totals["total_paid"]
         
         return {"partners": partners}
     except Exception as e:
@@ -267,139 +281,113 @@ async def pay_expense(expense_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+PAYOUT_ORDER_STATUSES = ["paid", "completed", "processing"]
+# Orders younger than this can still change status - incremental runs include
+# them in the response but only checkpoint orders older than this
+PAYOUT_CHECKPOINT_SETTLE = timedelta(hours=48)
+PAYOUT_CURSOR_BATCH = 500
+
+async def load_calculation_context():
+    """Everything a per-order calculation needs, fetched once per request"""
+    partners = await db.payout_partners.find(
+        {"is_active": True}
+    ).sort("priority", 1).to_list(None)
+    
+    all_products = await db.products.find({}, {"name": 1, "purchase_price_usdt": 1}).to_list(None)
+    products_by_name = {p["name"]: p for p in all_products}
+    
+    recurring_expenses = await db.expenses.find({
+        "apply_per_order": True,
+        "status": {"$ne": "cancelled"}
+    }).to_list(None)
+    
+    sellers = await db.sellers.find({}, {"name": 1, "commission_percentage": 1}).to_list(None)
+    sellers_by_id = {str(seller["_id"]): seller for seller in sellers}
+    
+    referrals = await db.referral_codes.find(
+        {"seller_id": {"$nin": [None, ""]}}, {"code": 1, "seller_id": 1}
+    ).to_list(None)
+    sellers_by_code = {
+        referral["code"]: sellers_by_id[referral["seller_id"]]
+        for referral in referrals
+        if referral["seller_id"] in sellers_by_id
+    }
+    
+    return {
+        "partners": partners,
+        "products_by_name": products_by_name,
+        "recurring_expenses": recurring_expenses,
+        "sellers_by_code": sellers_by_code
+    }
+
+def calculation_fingerprint(context: dict) -> str:
+    """Changes whenever partners, expenses, seller rates or purchase prices change -
+    persisted partner totals computed under another fingerprint are stale"""
+    data = {
+        "partners": [
+            (str(p["_id"]), p.get("type"), p.get("commission_percentage")) for p in context["partners"]
+        ],
+        "expenses": [
+            (str(e["_id"]), e.get("amount_type"), e.get("percentage"), e.get("amount"), e.get("name"), e.get("type"))
+            for e in context["recurring_expenses"]
+        ],
+        "sellers": sorted(
+            (code, s.get("name"), s.get("commission_percentage", 30)) for code, s in context["sellers_by_code"].items()
+        ),
+        "products": sorted(
+            (name, p.get("purchase_price_usdt", 0)) for name, p in context["products_by_name"].items()
+        )
+    }
+    return hashlib.sha1(json.dumps(data, default=str).encode()).hexdigest()
+
+async def invalidate_payout_checkpoint(order: dict, old_status: str, new_status: str):
+    """Called when an order's status changes. An order at or before the
+    checkpoint moving into or out of PAYOUT_ORDER_STATUSES makes the persisted
+    partner totals wrong - drop them so the next incremental run is a full pass"""
+    if (old_status in PAYOUT_ORDER_STATUSES) == (new_status in PAYOUT_ORDER_STATUSES):
+        return
+    
+    query = {"_id": "partner_totals"}
+    created_at = order.get("created_at")
+    # Orders without created_at are always counted as settled
+    if created_at:
+        query["$or"] = [
+            {"last_created_at": {"$gt": created_at}},
+            {"last_created_at": created_at, "last_order_id": {"$gte": order["_id"]}}
+        ]
+    
+    result = await db.payout_checkpoints.delete_one(query)
+    if result.deleted_count:
+        logger.info(f"💸 Payout checkpoint dropped - settled order {order['_id']} went {old_status} -> {new_status}")
+
+def merge_partner_totals(target: dict, source: dict):
+    for partner_id, partner_total in source.items():
+        merged = target.setdefault(partner_id, {"name": partner_total["name"], "total": 0, "count": 0})
+        merged["total"] += partner_total["total"]
+        merged["count"] += partner_total["count"]
+
+def ndjson_line(data: dict) -> bytes:
+    return (json.dumps(jsonable_encoder(data)) + "\n").encode()
+
 @router.get("/calculations")
 async def get_payout_calculations(skip: int = 0, limit: int = 100):
     try:
-        partners = await db.payout_partners.find(
-            {"is_active": True}
-        ).sort("priority", 1).to_list(None)
+        pipeline = DeductionPipeline(await load_calculation_context())
         
         total_orders = await db.orders.count_documents(
-            {"status": {"$in": ["paid", "completed", "processing"]}}
+            {"status": {"$in": PAYOUT_ORDER_STATUSES}}
         )
         
         orders = await db.orders.find(
-            {"status": {"$in": ["paid", "completed", "processing"]}}
+            {"status": {"$in": PAYOUT_ORDER_STATUSES}}
         ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
-        all_products = await db.products.find({}).to_list(None)
-        products_by_name = {p["name"]: p for p in all_products}
-        
-        recurring_expenses = await db.expenses.find({
-            "apply_per_order": True,
-            "status": {"$ne": "cancelled"}
-        }).to_list(None)
-        
         calculations = []
         total_partner_payouts = {}
         
         for order in orders:
-            order_calc = {
-                "order_number": order.get("order_number"),
-                "order_date": order.get("created_at"),
-                "total_usdt": float(order.get("total_usdt", 0)),
-                "base_profit": 0,
-                "deductions": [],
-                "final_profit": 0
-            }
-            
-            original_total = float(order.get("total_usdt", 0))
-            discount_amount = float(order.get("discount_amount", 0))
-            original_price_before_discount = original_total + discount_amount
-            
-            base_profit = 0
-            total_purchase_cost = 0
-            
-            if order.get("items") and len(order["items"]) > 0:
-                for item in order["items"]:
-                    quantity = item.get("quantity", 1)
-                    
-                    purchase_price = float(item.get("purchase_price_usdt", 0))
-                    
-                    if purchase_price == 0:
-                        product_name = item.get("product_name", "")
-                        product = products_by_name.get(product_name)
-                        if product:
-                            purchase_price = float(product.get("purchase_price_usdt", 0))
-                    
-                    total_purchase_cost += purchase_price * quantity
-            
-            base_profit = original_price_before_discount - total_purchase_cost
-            order_calc["base_profit"] = base_profit
-            
-            current_profit = base_profit
-            
-            for expense in recurring_expenses:
-                expense_amount = 0
-                expense_name = expense.get('name')
-                
-                if expense.get('amount_type') == 'percentage' and expense.get('percentage'):
-                    percentage = float(expense.get('percentage', 0))
-                    if percentage > 0 and current_profit > 0:
-                        expense_amount = current_profit * (percentage / 100)
-                        expense_name = f"{expense.get('name')} ({percentage}%)"
-                else:
-                    expense_amount = float(expense.get('amount', 0))
-                
-                if expense_amount > 0:
-                    order_calc["deductions"].append({
-                        "type": "expense",
-                        "name": f"{expense_name} ({expense.get('type', 'expense')})",
-                        "rate": expense.get('percentage', 0) if expense.get('amount_type') == 'percentage' else 0,
-                        "amount": expense_amount
-                    })
-                    current_profit -= expense_amount
-            
-            if discount_amount > 0:
-                order_calc["deductions"].append({
-                    "type": "discount",
-                    "name": "Customer Discount",
-                    "rate": 0,
-                    "amount": discount_amount
-                })
-                current_profit -= discount_amount
-            
-            if order.get("referral_code"):
-                referral = await db.referral_codes.find_one({"code": order["referral_code"]})
-                if referral and referral.get("seller_id"):
-                    seller = await db.sellers.find_one({"_id": ObjectId(referral["seller_id"])})
-                    if seller and current_profit > 0:
-                        commission_rate = float(seller.get("commission_percentage", 30))
-                        commission = current_profit * (commission_rate / 100)
-                        order_calc["deductions"].append({
-                            "type": "seller_commission",
-                            "name": seller.get("name"),
-                            "rate": commission_rate,
-                            "amount": commission
-                        })
-                        current_profit -= commission
-            
-            for partner in partners:
-                if partner["type"] == "partner" and partner.get("commission_percentage") and current_profit > 0:
-                    commission_rate = float(partner["commission_percentage"])
-                    commission = current_profit * (commission_rate / 100)
-                    
-                    order_calc["deductions"].append({
-                        "type": "partner_commission",
-                        "name": partner["name"],
-                        "rate": commission_rate,
-                        "amount": commission,
-                        "base_amount": current_profit
-                    })
-                    
-                    partner_id = str(partner["_id"])
-                    if partner_id not in total_partner_payouts:
-                        total_partner_payouts[partner_id] = {
-                            "name": partner["name"],
-                            "total": 0,
-                            "count": 0
-                        }
-                    total_partner_payouts[partner_id]["total"] += commission
-                    total_partner_payouts[partner_id]["count"] += 1
-                    
-                    current_profit -= commission
-            
-            order_calc["final_profit"] = current_profit
+            order_calc = pipeline.calculate(order)
+            add_partner_totals(total_partner_payouts, order_calc)
             calculations.append(order_calc)
         
         return {
@@ -476,197 +464,117 @@ async def get_payout_history(partner_id: Optional[str] = None):
 @router.get("/stats")
 async def get_payout_stats():
     try:
-        now = datetime.utcnow()
-        month_start = datetime(now.year, now.month, 1)
-        
         active_partners = await db.payout_partners.find(
-            {"is_active": True}
+            {"is_active": True}, {"_id": 1}
         ).to_list(None)
-        active_partner_ids = [p["_id"] for p in active_partners]
         
-        pending_payouts = await db.payout_transactions.aggregate([
-            {
-                "$match": {
-                    "status": "pending",
-                    "partner_id": {"$in": active_partner_ids}
-                }
-            },
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]).to_list(1)
-        
-        monthly_payouts = await db.payout_transactions.aggregate([
-            {
-                "$match": {
-                    "status": "paid",
-                    "paid_at": {"$gte": month_start},
-                    "partner_id": {"$in": active_partner_ids}
-                }
-            },
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]).to_list(1)
+        totals = await partner_transaction_totals([p["_id"] for p in active_partners])
         
         pending_expenses = await db.expenses.aggregate([
             {"$match": {"status": "pending", "apply_per_order": {"$ne": True}}},
             {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
         ]).to_list(1)
         
-        active_partners_count = len(active_partners)
-        
         return {
-            "total_pending": pending_payouts[0]["total"] if pending_payouts else 0,
-            "monthly_paid": monthly_payouts[0]["total"] if monthly_payouts else 0,
+            "total_pending": sum(t["pending_amount"] for t in totals.values()),
+            "monthly_paid": sum(t["monthly_paid"] for t in totals.values()),
             "pending_expenses": pending_expenses[0]["total"] if pending_expenses else 0,
-            "active_partners": active_partners_count
+            "active_partners": len(active_partners)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/calculations/all")
-async def get_all_payout_calculations():
-    try:
-        partners = await db.payout_partners.find(
-            {"is_active": True}
-        ).sort("priority", 1).to_list(None)
-        
-        batch_size = 100
-        skip = 0
-        all_calculations = []
-        total_partner_payouts = {}
-        
-        all_products = await db.products.find({}).to_list(None)
-        products_by_name = {p["name"]: p for p in all_products}
-        
-        recurring_expenses = await db.expenses.find({
-            "apply_per_order": True,
-            "status": {"$ne": "cancelled"}
-        }).to_list(None)
-        
-        while True:
-            orders = await db.orders.find(
-                {"status": {"$in": ["paid", "completed", "processing"]}}
-            ).sort("created_at", -1).skip(skip).limit(batch_size).to_list(batch_size)
-            
-            if not orders:
-                break
-            
-            for order in orders:
-                order_calc = {
-                    "order_number": order.get("order_number"),
-                    "order_date": order.get("created_at"),
-                    "total_usdt": float(order.get("total_usdt", 0)),
-                    "base_profit": 0,
-                    "deductions": [],
-                    "final_profit": 0
-                }
-                
-                original_total = float(order.get("total_usdt", 0))
-                discount_amount = float(order.get("discount_amount", 0))
-                original_price_before_discount = original_total + discount_amount
-                
-                base_profit = 0
-                total_purchase_cost = 0
-                
-                if order.get("items") and len(order["items"]) > 0:
-                    for item in order["items"]:
-                        quantity = item.get("quantity", 1)
-                        
-                        purchase_price = float(item.get("purchase_price_usdt", 0))
-                        
-                        if purchase_price == 0:
-                            product_name = item.get("product_name", "")
-                            product = products_by_name.get(product_name)
-                            if product:
-                                purchase_price = float(product.get("purchase_price_usdt", 0))
-                        
-                        total_purchase_cost += purchase_price * quantity
-                
-                base_profit = original_price_before_discount - total_purchase_cost
-                order_calc["base_profit"] = base_profit
-                
-                current_profit = base_profit
-                
-                for expense in recurring_expenses:
-                    expense_amount = 0
-                    expense_name = expense.get('name')
-                    
-                    if expense.get('amount_type') == 'percentage' and expense.get('percentage'):
-                        percentage = float(expense.get('percentage', 0))
-                        if percentage > 0 and current_profit > 0:
-                            expense_amount = current_profit * (percentage / 100)
-                            expense_name = f"{expense.get('name')} ({percentage}%)"
-                    else:
-                        expense_amount = float(expense.get('amount', 0))
-                    
-                    if expense_amount > 0:
-                        order_calc["deductions"].append({
-                            "type": "expense",
-                            "name": f"{expense_name} ({expense.get('type', 'expense')})",
-                            "rate": expense.get('percentage', 0) if expense.get('amount_type') == 'percentage' else 0,
-                            "amount": expense_amount
-                        })
-                        current_profit -= expense_amount
-                
-                if discount_amount > 0:
-                    order_calc["deductions"].append({
-                        "type": "discount",
-                        "name": "Customer Discount",
-                        "rate": 0,
-                        "amount": discount_amount
-                    })
-                    current_profit -= discount_amount
+async def get_all_payout_calculations(incremental: bool = False, details: bool = True):
+    """Streams every payout-relevant order as NDJSON: one {"type": "calculation"}
+    line per order (oldest first), then a {"type": "summary"} line with partner
+    totals. Incremental mode only calculates orders after the stored checkpoint
+    and adds them to the persisted partner totals. details=false skips the
+    per-order lines and computes the totals in batches."""
+    context = await load_calculation_context()
+    fingerprint = calculation_fingerprint(context)
+    pipeline = DeductionPipeline(context)
+    
+    checkpoint = await db.payout_checkpoints.find_one({"_id": "partner_totals"})
+    if not incremental or not checkpoint or checkpoint.get("fingerprint") != fingerprint:
+        # Full pass - also rebuilds the checkpoint from scratch
+        checkpoint = None
+    
+    query = {"status": {"$in": PAYOUT_ORDER_STATUSES}}
+    if checkpoint:
+        query["$or"] = [
+            {"created_at": {"$gt": checkpoint["last_created_at"]}},
+            {"created_at": checkpoint["last_created_at"], "_id": {"$gt": checkpoint["last_order_id"]}}
+        ]
+    
+    settle_before = datetime.utcnow() - PAYOUT_CHECKPOINT_SETTLE
+    
+    async def stream():
+        settled_totals = dict(checkpoint["partner_totals"]) if checkpoint else {}
+        previously_counted = checkpoint.get("orders_counted", 0) if checkpoint else 0
+        settled_count = previously_counted
+        recent_totals = {}
+        last_settled = None
+        streamed = 0
+        # Totals-only mode: orders waiting to be added in one vectorized batch
+        settled_batch = []
+        recent_batch = []
+        
+        try:
+            cursor = db.orders.find(query).sort([("created_at", 1), ("_id", 1)]).batch_size(PAYOUT_CURSOR_BATCH)
+            async for order in cursor:
+                created_at = order.get("created_at")
+                settled = not created_at or created_at.replace(tzinfo=None) < settle_before
+                if settled:
+                    settled_count += 1
+                    if created_at:
+                        last_settled = order
+                streamed += 1
                 
-                if order.get("referral_code"):
-                    referral = await db.referral_codes.find_one({"code": order["referral_code"]})
-                    if referral and referral.get("seller_id"):
-                        seller = await db.sellers.find_one({"_id": ObjectId(referral["seller_id"])})
-                        if seller and current_profit > 0:
-                            commission_rate = float(seller.get("commission_percentage", 30))
-                            commission = current_profit * (commission_rate / 100)
-                            order_calc["deductions"].append({
-                                "type": "seller_commission",
-                                "name": seller.get("name"),
-                                "rate": commission_rate,
-                                "amount": commission
-                            })
-                            current_profit -= commission
+                if not details:
+                    batch = settled_batch if settled else recent_batch
+                    batch.append(order)
+                    if len(batch) >= PAYOUT_CURSOR_BATCH:
+                        pipeline.partner_totals(batch, settled_totals if settled else recent_totals)
+                        batch.clear()
+                    continue
                 
-                for partner in partners:
-                    if partner["type"] == "partner" and partner.get("commission_percentage") and current_profit > 0:
-                        commission_rate = float(partner["commission_percentage"])
-                        commission = current_profit * (commission_rate / 100)
-                        
-                        order_calc["deductions"].append({
-                            "type": "partner_commission",
-                            "name": partner["name"],
-                            "rate": commission_rate,
-                            "amount": commission,
-                            "base_amount": current_profit
-                        })
-                        
-                        partner_id = str(partner["_id"])
-                        if partner_id not in total_partner_payouts:
-                            total_partner_payouts[partner_id] = {
-                                "name": partner["name"],
-                                "total": 0,
-                                "count": 0
-                            }
-                        total_partner_payouts[partner_id]["total"] += commission
-                        total_partner_payouts[partner_id]["count"] += 1
-                        
-                        current_profit -= commission
-                
-                order_calc["final_profit"] = current_profit
-                all_calculations.append(order_calc)
+                order_calc = pipeline.calculate(order)
+                add_partner_totals(settled_totals if settled else recent_totals, order_calc)
+                yield ndjson_line({"type": "calculation", **order_calc})
             
-            skip += batch_size
+            pipeline.partner_totals(settled_batch, settled_totals)
+            pipeline.partner_totals(recent_batch, recent_totals)
             
-            await asyncio.sleep(0.01)
-        
-        return {
-            "calculations": all_calculations,
-            "partner_totals": total_partner_payouts,
-            "total_orders": len(all_calculations)
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            if last_settled is not None or not checkpoint:
+                if last_settled is None:
+                    # Nothing settled yet - start from the beginning next time
+                    last_settled = {"created_at": datetime.min, "_id": ObjectId("0" * 24)}
+                await db.payout_checkpoints.replace_one(
+                    {"_id": "partner_totals"},
+                    {
+                        "fingerprint": fingerprint,
+                        "last_created_at": last_settled["created_at"],
+                        "last_order_id": last_settled["_id"],
+                        "partner_totals": settled_totals,
+                        "orders_counted": settled_count,
+                        "updated_at": datetime.utcnow()
+                    },
+                    upsert=True
+                )
+            
+            partner_totals = {partner_id: dict(total) for partner_id, total in settled_totals.items()}
+            merge_partner_totals(partner_totals, recent_totals)
+            
+            yield ndjson_line({
+                "type": "summary",
+                "incremental": checkpoint is not None,
+                "partner_totals": partner_totals,
+                "total_orders": previously_counted + streamed,
+                "calculated_orders": streamed
+            })
+        except Exception as e:
+            logger.error(f"Error streaming payout calculations: {e}")
+            yield ndjson_line({"type": "error", "detail": str(e)})
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
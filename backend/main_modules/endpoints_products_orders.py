@@ -8,7 +8,12 @@ import logging
 
 from .config import db
 from .models import ProductModel, OrderStatusModel
-from .helpers import format_price, generate_order_id, verify_token
+from .helpers import format_price, verify_token, bump_bot_config_version
+from bot_modules.seller_ledger import accrue_order_commission, reverse_order_commission, PAID_STATUSES
+from bot_modules.order_items import increment_sold_counts, load_products
+from bot_modules.stock import commit_stock, release_stock, stock_level, STOCK_KEPT_STATUSES
+from bot_modules.id_service import next_order_number
+from .endpoints_payouts import invalidate_payout_checkpoint
 
 router_products_orders = APIRouter()
 logger = logging.getLogger(__name__)
@@ -77,6 +82,8 @@ async def get_orders(skip: int = 0, limit: int = 100):
     try:
         orders = await db.orders.find({}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
+        products = await load_products(db, orders, {"name": 1, "purchase_price_usdt": 1})
+        
         # Sanitize all orders first to convert ObjectIds
         orders = [sanitize_document(order) for order in orders]
         
@@ -93,29 +100,22 @@ async def get_orders(skip: int = 0, limit: int = 100):
                         item["price_usdt"] = format_price(item.get("price_usdt", 0))
                         item["subtotal_usdt"] = format_price(item.get("subtotal_usdt", 0))
                         
-                        # Find product to get purchase price
-                        product = await db.products.find_one({"name": item.get("product_name")})
-                        if product:
-                            purchase_price = product.get("purchase_price_usdt", 0)
-                            # If no purchase price, estimate at 30% of selling price
-                            if purchase_price == 0:
-                                purchase_price = item["price_usdt"] * 0.3
-                            
-                            selling_price = item["price_usdt"]
-                            quantity = item.get("quantity", 1)
-                            
-                            # Calculate profit for this item
-                            item_profit = (selling_price - purchase_price) * quantity
-                            base_profit += item_profit
-                            
-                            # Store purchase price in item for frontend
-                            item["purchase_price_usdt"] = format_price(purchase_price)
-                            item["profit_per_unit"] = format_price(selling_price - purchase_price)
-                        else:
-                            # Product not found, use estimated cost
-                            item["purchase_price_usdt"] = format_price(item["price_usdt"] * 0.3)
-                            item["profit_per_unit"] = format_price(item["price_usdt"] * 0.7)
-                            base_profit += item["price_usdt"] * 0.7 * item.get("quantity", 1)
+                        # Cost stored on the item, else the product's
+                        purchase_price = products.purchase_price(item)
+                        # Unknown or no purchase price, estimate at 30% of selling price
+                        if not purchase_price:
+                            purchase_price = item["price_usdt"] * 0.3
+                        
+                        selling_price = item["price_usdt"]
+                        quantity = item.get("quantity", 1)
+                        
+                        # Calculate profit for this item
+                        item_profit = (selling_price - purchase_price) * quantity
+                        base_profit += item_profit
+                        
+                        # Store purchase price in item for frontend
+                        item["purchase_price_usdt"] = format_price(purchase_price)
+                        item["profit_per_unit"] = format_price(selling_price - purchase_price)
                     except Exception as e:
                         logger.warning(f"Error processing item in order {order.get('_id')}: {e}")
                         # Set safe defaults
@@ -174,7 +174,7 @@ async def get_orders(skip: int = 0, limit: int = 100):
             
             # Ensure order number exists
             if not order.get("order_number"):
-                order["order_number"] = generate_order_id()
+                order["order_number"] = await next_order_number(db)
                 # Update in database
                 await db.orders.update_one(
                     {"_id": ObjectId(order["_id"])},
@@ -203,11 +203,13 @@ async def create_product(product: ProductModel, email: str = Depends(verify_toke
     product_dict["purchase_price_usdt"] = format_price(product_dict.get("purchase_price_usdt", 0))
     product_dict["created_at"] = datetime.now(timezone.utc)
     product_dict["sold_count"] = 0
+    product_dict["stock_level"] = stock_level(product_dict.get("stock_quantity"))
     
     if product_dict.get("category_id"):
         product_dict["category_id"] = ObjectId(product_dict["category_id"])
     
     result = await db.products.insert_one(product_dict)
+    await bump_bot_config_version("products", result.inserted_id)
     return {"id": str(result.inserted_id), "message": "Product created"}
 
 @router_products_orders.put("/api/products/{product_id}")
@@ -216,6 +218,7 @@ async def update_product(product_id: str, product: ProductModel, email: str = De
     product_dict["price_usdt"] = format_price(product_dict["price_usdt"])
     product_dict["purchase_price_usdt"] = format_price(product_dict.get("purchase_price_usdt", 0))
     product_dict["updated_at"] = datetime.now(timezone.utc)
+    product_dict["stock_level"] = stock_level(product_dict.get("stock_quantity"))
     
     if product_dict.get("category_id"):
         product_dict["category_id"] = ObjectId(product_dict["category_id"])
@@ -224,11 +227,13 @@ async def update_product(product_id: str, product: ProductModel, email: str = De
         {"_id": ObjectId(product_id)},
         {"$set": product_dict}
     )
+    await bump_bot_config_version("products", product_id)
     return {"message": "Product updated"}
 
 @router_products_orders.delete("/api/products/{product_id}")
 async def delete_product(product_id: str, email: str = Depends(verify_token)):
     await db.products.delete_one({"_id": ObjectId(product_id)})
+    await bump_bot_config_version("products", product_id)
     return {"message": "Product deleted"}
 
 @router_products_orders.patch("/api/orders/{order_id}/status")
@@ -253,12 +258,7 @@ async def update_order_status(order_id: str, status_update: OrderStatusModel, em
         
         # Update product sold counts and user stats when order is paid/completed
         if old_status not in ["paid", "completed"] and new_status in ["paid", "completed"]:
-            if order.get("items"):
-                for item in order["items"]:
-                    await db.products.update_one(
-                        {"name": item["product_name"]},
-                        {"$inc": {"sold_count": item.get("quantity", 1)}}
-                    )
+            await increment_sold_counts(db, order)
             
             await db.users.update_one(
                 {"telegram_id": order["telegram_id"]},
@@ -269,6 +269,20 @@ async def update_order_status(order_id: str, status_update: OrderStatusModel, em
                     }
                 }
             )
+            
+            await accrue_order_commission(db, order)
+        
+        # Reserved stock follows the status: kept once paid, returned on cancel
+        if new_status in STOCK_KEPT_STATUSES:
+            await commit_stock(db, order["_id"])
+        elif new_status == "cancelled":
+            await release_stock(db, order["_id"], "cancelled_by_admin", include_committed=True)
+        
+        # Paid order cancelled/refunded - seller commission goes back out
+        if old_status in PAID_STATUSES and new_status not in PAID_STATUSES:
+            await reverse_order_commission(db, order)
+        
+        await invalidate_payout_checkpoint(order, old_status, new_status)
         
         # Log the status change
         await db.audit_logs.insert_one({
@@ -9,14 +9,56 @@ import asyncio
 
 from .config import db, ADMIN_EMAIL
 from .models import *
-from .helpers import format_price, verify_token
+from .helpers import format_price, verify_token, bump_bot_config_version
 from .websocket import manager, new_message_event, new_message_telegram_id
+from bot_modules.order_items import load_products
 
 router_system = APIRouter()
 logger = logging.getLogger(__name__)
 
 # ==================== DASHBOARD ENDPOINTS ====================
 
+async def calculate_order_profits(orders: List[dict]) -> List[float]:
+    """Profit per order: item margins, minus discount, minus seller commission.
+    Products, referral codes and sellers are fetched once for all orders."""
+    products = await load_products(db, orders, {"name": 1, "purchase_price_usdt": 1})
+    
+    codes = list({order["referral_code"] for order in orders if order.get("referral_code")})
+    referrals = await db.referral_codes.find(
+        {"code": {"$in": codes}}, {"code": 1, "seller_id": 1}
+    ).to_list(None) if codes else []
+    seller_ids = {r["seller_id"] for r in referrals if r.get("seller_id") and ObjectId.is_valid(r["seller_id"])}
+    sellers = await db.sellers.find(
+        {"_id": {"$in": [ObjectId(seller_id) for seller_id in seller_ids]}}, {"commission_percentage": 1}
+    ).to_list(None) if seller_ids else []
+    sellers_by_id = {str(seller["_id"]): seller for seller in sellers}
+    sellers_by_code = {
+        r["code"]: sellers_by_id[r["seller_id"]] for r in referrals if r.get("seller_id") in sellers_by_id
+    }
+    
+    profits = []
+    for order in orders:
+        order_profit = 0
+        
+        # Base profit from items (before discounts)
+        for item in order.get("items") or []:
+            purchase_price = products.purchase_price(item)
+            if purchase_price is not None:
+                order_profit += (item.get("price_usdt", 0) - purchase_price) * item.get("quantity", 1)
+        
+        # SUBTRACT discounts from profit (discounts reduce our profit!)
+        order_profit -= order.get("discount_amount", 0)
+        
+        # Seller commission is calculated from the profit AFTER discount
+        seller = sellers_by_code.get(order.get("referral_code"))
+        if seller and order_profit > 0:
+            commission_rate = seller.get("commission_percentage", 30)
+            order_profit -= order_profit * (commission_rate / 100)
+        
+        profits.append(order_profit)
+    
+    return profits
+
 @router_system.get("/api/dashboard/stats")
 async def get_stats():
     total_orders = await db.orders.count_documents({})
@@ -33,43 +75,8 @@ async def get_stats():
     total_revenue = format_price(revenue_result[0]["total"] if revenue_result else 0)
     
     # FIXED PROFIT CALCULATION
-    total_profit = 0
     paid_orders = await db.orders.find({"status": {"$in": ["paid", "completed"]}}).to_list(None)
-    
-    for order in paid_orders:
-        order_profit = 0
-        
-        if order.get("items"):
-            # Calculate base profit from items (before discounts)
-            for item in order["items"]:
-                product = await db.products.find_one({"name": item["product_name"]})
-                if product:
-                    purchase_price = product.get("purchase_price_usdt", 0)
-                    selling_price = item.get("price_usdt", 0)
-                    quantity = item.get("quantity", 1)
-                    
-                    # Profit per item = (selling price - purchase price) * quantity
-                    item_profit = (selling_price - purchase_price) * quantity
-                    order_profit += item_profit
-        
-        # SUBTRACT discounts from profit (discounts reduce our profit!)
-        discount_amount = order.get("discount_amount", 0)
-        order_profit = order_profit - discount_amount
-        
-        # If there's a seller commission, subtract it too
-        if order.get("referral_code"):
-            # Find the referral code to get seller commission
-            referral = await db.referral_codes.find_one({"code": order["referral_code"]})
-            if referral and referral.get("seller_id"):
-                seller = await db.sellers.find_one({"_id": ObjectId(referral["seller_id"])})
-                if seller:
-                    commission_rate = seller.get("commission_percentage", 30)
-                    # Commission is calculated from the profit AFTER discount
-                    if order_profit > 0:  # Only pay commission on positive profit
-                        seller_commission = order_profit * (commission_rate / 100)
-                        order_profit = order_profit - seller_commission
-        
-        total_profit += order_profit
+    total_profit = sum(await calculate_order_profits(paid_orders))
     
     # Get other stats
     active_referrals = await db.referral_codes.count_documents({"is_active": True})
@@ -96,40 +103,11 @@ async def get_stats():
     today_revenue = format_price(today_revenue_result[0]["total"] if today_revenue_result else 0)
     
     # Today's profit (with same calculation logic)
-    today_profit = 0
     today_paid_orders = await db.orders.find({
         "created_at": {"$gte": today_start},
         "status": {"$in": ["paid", "completed"]}
     }).to_list(None)
-    
-    for order in today_paid_orders:
-        order_profit = 0
-        
-        if order.get("items"):
-            for item in order["items"]:
-                product = await db.products.find_one({"name": item["product_name"]})
-                if product:
-                    purchase_price = product.get("purchase_price_usdt", 0)
-                    selling_price = item.get("price_usdt", 0)
-                    quantity = item.get("quantity", 1)
-                    item_profit = (selling_price - purchase_price) * quantity
-                    order_profit += item_profit
-        
-        # Subtract discount
-        discount_amount = order.get("discount_amount", 0)
-        order_profit = order_profit - discount_amount
-        
-        # Subtract seller commission if applicable
-        if order.get("referral_code"):
-            referral = await db.referral_codes.find_one({"code": order["referral_code"]})
-            if referral and referral.get("seller_id"):
-                seller = await db.sellers.find_one({"_id": ObjectId(referral["seller_id"])})
-                if seller and order_profit > 0:
-                    commission_rate = seller.get("commission_percentage", 30)
-                    seller_commission = order_profit * (commission_rate / 100)
-                    order_profit = order_profit - seller_commission
-        
-        today_profit += order_profit
+    today_profit = sum(await calculate_order_profits(today_paid_orders))
     
     pending_orders = await db.orders.count_documents({"status": "pending"})
     avg_order_value = format_price(total_revenue / total_orders if total_orders > 0 else 0)
@@ -199,52 +177,33 @@ async def get_analytics(days: int = 30):
     
     daily_sales = await db.orders.aggregate(pipeline).to_list(None)
     
+    # Profit per day from one pass over the period's orders
+    period_orders = await db.orders.find({
+        "created_at": {"$gte": start_date, "$lte": end_date},
+        "status": {"$in": ["paid", "completed"]}
+    }).to_list(None)
+    profit_by_day = {}
+    for order, order_profit in zip(period_orders, await calculate_order_profits(period_orders)):
+        day = order["created_at"].strftime("%Y-%m-%d")
+        profit_by_day[day] = profit_by_day.get(day, 0) + order_profit
+    
     for day in daily_sales:
-        day_profit = 0
-        day_orders = await db.orders.find({
-            "created_at": {
-                "$gte": datetime.strptime(day["_id"], "%Y-%m-%d"),
-                "$lt": datetime.strptime(day["_id"], "%Y-%m-%d") + timedelta(days=1)
-            },
-            "status": {"$in": ["paid", "completed"]}
-        }).to_list(None)
-        
-        for order in day_orders:
-            order_profit = 0
-            if order.get("items"):
-                for item in order["items"]:
-                    product = await db.products.find_one({"name": item["product_name"]})
-                    if product:
-                        purchase_price = product.get("purchase_price_usdt", 0)
-                        selling_price = item.get("price_usdt", 0)
-                        quantity = item.get("quantity", 1)
-                        item_profit = (selling_price - purchase_price) * quantity
-                        order_profit += item_profit
-            
-            # Subtract discount
-            discount_amount = order.get("discount_amount", 0)
-            order_profit = order_profit - discount_amount
-            
-            # Subtract seller commission if applicable
-            if order.get("referral_code"):
-                referral = await db.referral_codes.find_one({"code": order["referral_code"]})
-                if referral and referral.get("seller_id"):
-                    seller = await db.sellers.find_one({"_id": ObjectId(referral["seller_id"])})
-                    if seller and order_profit > 0:
-                        commission_rate = seller.get("commission_percentage", 30)
-                        seller_commission = order_profit * (commission_rate / 100)
-                        order_profit = order_profit - seller_commission
-            
-            day_profit += order_profit
-        
-        day["profit"] = format_price(day_profit)
+        day["profit"] = format_price(profit_by_day.get(day["_id"], 0))
         day["revenue"] = format_price(day["revenue"])
     
     category_sales = []
     categories = await db.categories.find({"is_active": True}).to_list(None)
     
+    sold_products = await db.products.find(
+        {"category_id": {"$in": [category["_id"] for category in categories]}, "sold_count": {"$gt": 0}},
+        {"category_id": 1, "price_usdt": 1, "sold_count": 1}
+    ).to_list(None)
+    products_by_category = {}
+    for product in sold_products:
+        products_by_category.setdefault(product["category_id"], []).append(product)
+    
     for category in categories:
-        category_products = await db.products.find({"category_id": category["_id"]}).to_list(None)
+        category_products = products_by_category.get(category["_id"], [])
         category_revenue = 0
         category_quantity = 0
         
@@ -326,6 +285,7 @@ async def create_bot_message(
     message_dict["created_by"] = email
     
     result = await db.bot_messages.insert_one(message_dict)
+    await bump_bot_config_version("bot_messages", result.inserted_id)
     
     await db.audit_logs.insert_one({
         "admin_id": email,
@@ -357,6 +317,7 @@ async def update_bot_message(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Message not found")
     
+    await bump_bot_config_version("bot_messages", message_id)
     return {"message": "Bot message updated"}
 
 @router_system.delete("/api/bot/messages/{message_id}")
@@ -370,6 +331,7 @@ async def delete_bot_message(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Message not found")
     
+    await bump_bot_config_version("bot_messages", message_id)
     return {"message": "Bot message deleted"}
 
 @router_system.post("/api/bot/messages/bulk-update")
@@ -391,6 +353,8 @@ async def bulk_update_messages(
                 {"$set": update}
             )
             updated_count += result.modified_count
+            if result.modified_count:
+                await bump_bot_config_version("bot_messages", message_id)
     
     return {"message": f"Updated {updated_count} messages"}
 
@@ -419,6 +383,7 @@ async def create_bot_command(
     command_dict["created_by"] = email
     
     result = await db.bot_commands.insert_one(command_dict)
+    await bump_bot_config_version("bot_commands", result.inserted_id)
     
     return {"id": str(result.inserted_id), "message": "Bot command created"}
 
@@ -441,6 +406,7 @@ async def update_bot_command(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Command not found")
     
+    await bump_bot_config_version("bot_commands", command_id)
     return {"message": "Bot command updated"}
 
 @router_system.delete("/api/bot/commands/{command_id}")
@@ -454,6 +420,7 @@ async def delete_bot_command(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Command not found")
     
+    await bump_bot_config_version("bot_commands", command_id)
     return {"message": "Bot command deleted"}
 
 @router_system.get("/api/bot/settings")
@@ -485,6 +452,7 @@ async def update_bot_settings(
         {"$set": settings_dict},
         upsert=True
     )
+    await bump_bot_config_version("bot_settings", "main")
     
     return {"message": "Bot settings updated"}
 
@@ -547,6 +515,9 @@ async def initialize_bot_messages(email: str = Depends(verify_token)):
             await db.bot_commands.insert_one(cmd_data)
             initialized += 1
     
+    if initialized:
+        await bump_bot_config_version("all")
+    
     return {"message": f"Initialized {initialized} messages and commands"}
 
 @router_system.post("/api/bot/restart")
@@ -558,8 +529,34 @@ async def restart_bot(email: str = Depends(verify_token)):
         "timestamp": datetime.now(timezone.utc)
     })
     
+    # The bot reloads its whole configuration within a second
+    await bump_bot_config_version("all")
+    
     return {"message": "Bot restart initiated"}
 
+@router_system.get("/api/bot/outbound-metrics")
+async def get_outbound_metrics(email: str = Depends(verify_token)):
+    """Outbound Telegram queue depth for the bot process and this API process"""
+    from bot_modules.outbound_scheduler import outbound_scheduler
+    
+    bot_metrics = await db.bot_metrics.find_one({"_id": "outbound_scheduler"})
+    if bot_metrics:
+        bot_metrics.pop("_id", None)
+    
+    return {
+        "bot": bot_metrics,
+        "api": outbound_scheduler.get_metrics()
+    }
+
+@router_system.get("/api/bot/update-metrics")
+async def get_update_metrics(email: str = Depends(verify_token)):
+    """Incoming update queues of the bot - per-user backlog and worker usage"""
+    metrics = await db.bot_metrics.find_one({"_id": "update_processor"})
+    if metrics:
+        metrics.pop("_id", None)
+    
+    return {"bot": metrics}
+
 # ==================== NOTIFICATION ENDPOINTS ====================
 
 @router_system.get("/api/notifications/settings")
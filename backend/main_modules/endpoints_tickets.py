@@ -5,6 +5,7 @@ from bson import ObjectId
 
 from .config import db
 from .helpers import verify_token
+from bot_modules.ticket_messages import TICKET_LIST_PROJECTION, get_messages, delete_messages
 
 router_tickets = APIRouter(prefix="/api/tickets", tags=["Support Tickets"])
 
@@ -22,14 +23,12 @@ async def get_tickets(
     if priority:
         query["priority"] = priority
     
-    tickets = await db.support_tickets.find(query).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    tickets = await db.support_tickets.find(
+        query, TICKET_LIST_PROJECTION
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
     
     for ticket in tickets:
         ticket["_id"] = str(ticket["_id"])
-        ticket["unread_admin"] = sum(
-            1 for msg in ticket.get("messages", [])
-            if msg.get("sender_type") == "customer" and not msg.get("read", False)
-        )
     
     total = await db.support_tickets.count_documents(query)
     
@@ -91,16 +90,28 @@ async def get_ticket_stats(email: str = Depends(verify_token)):
 @router_tickets.get("/{ticket_id}")
 async def get_ticket(
     ticket_id: str,
+    before: Optional[str] = None,
+    limit: int = 50,
     email: str = Depends(verify_token)
 ):
+    """Ticket with a page of its conversation - the messages before the
+    message _id before, the newest ones without it"""
     try:
-        ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)})
+        ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)}, TICKET_LIST_PROJECTION)
     except:
-        ticket = await db.support_tickets.find_one({"ticket_number": ticket_id})
+        ticket = await db.support_tickets.find_one({"ticket_number": ticket_id}, TICKET_LIST_PROJECTION)
     
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
+    if before and not ObjectId.is_valid(before):
+        raise HTTPException(status_code=400, detail="Invalid message id")
+    
+    limit = max(1, min(limit, 200))
+    # One extra to know whether there is an older page
+    messages = await get_messages(db, ticket["_id"], before, limit + 1)
+    ticket["has_more_messages"] = len(messages) > limit
+    ticket["messages"] = messages[-limit:]
     ticket["_id"] = str(ticket["_id"])
     return ticket
 
@@ -114,9 +125,9 @@ async def reply_to_ticket(
         from bot_modules.support_tickets import add_ticket_message
         
         try:
-            ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)})
+            ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)}, TICKET_LIST_PROJECTION)
         except:
-            ticket = await db.support_tickets.find_one({"ticket_number": ticket_id})
+            ticket = await db.support_tickets.find_one({"ticket_number": ticket_id}, TICKET_LIST_PROJECTION)
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -159,9 +170,9 @@ async def update_ticket_status(
         from bot_modules.support_tickets import update_ticket_status
         
         try:
-            ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)})
+            ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)}, TICKET_LIST_PROJECTION)
         except:
-            ticket = await db.support_tickets.find_one({"ticket_number": ticket_id})
+            ticket = await db.support_tickets.find_one({"ticket_number": ticket_id}, TICKET_LIST_PROJECTION)
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -191,9 +202,9 @@ async def assign_ticket(
         from bot_modules.support_tickets import assign_ticket
         
         try:
-            ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)})
+            ticket = await db.support_tickets.find_one({"_id": ObjectId(ticket_id)}, TICKET_LIST_PROJECTION)
         except:
-            ticket = await db.support_tickets.find_one({"ticket_number": ticket_id})
+            ticket = await db.support_tickets.find_one({"ticket_number": ticket_id}, TICKET_LIST_PROJECTION)
         
         if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
@@ -233,13 +244,15 @@ async def delete_ticket(
         from bson import ObjectId
         
         try:
-            result = await db.support_tickets.delete_one({"_id": ObjectId(ticket_id)})
+            ticket = await db.support_tickets.find_one_and_delete({"_id": ObjectId(ticket_id)}, {"_id": 1})
         except:
-            result = await db.support_tickets.delete_one({"ticket_number": ticket_id})
+            ticket = await db.support_tickets.find_one_and_delete({"ticket_number": ticket_id}, {"_id": 1})
         
-        if result.deleted_count == 0:
+        if not ticket:
             raise HTTPException(status_code=404, detail="Ticket not found")
         
+        await delete_messages(db, ticket["_id"])
+        
         return {"success": True, "message": "Ticket deleted"}
         
     except HTTPException:
@@ -6,10 +6,16 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional
 import logging
 import traceback
+from pymongo.errors import DuplicateKeyError
 
 from .config import db
 from .models import *
 from .helpers import format_price, generate_referral_code, verify_token, get_top_sellers
+from bot_modules.seller_ledger import (
+    COMMISSION_TYPES, get_seller_balances, pending_balance, create_seller_payout, reconcile_ledger,
+    accrue_code_commissions
+)
+from bot_modules.referrals import normalize_referral_code
 
 router_users_sellers = APIRouter()
 logger = logging.getLogger(__name__)
@@ -230,7 +236,7 @@ async def get_referrals(skip: int = 0, limit: int = 100):
 
 @router_users_sellers.post("/api/referrals")
 async def create_referral(referral: ReferralCodeModel, email: str = Depends(verify_token)):
-    code = referral.code.upper().replace(" ", "")
+    code = normalize_referral_code(referral.code)
     if not code.isalnum():
         raise HTTPException(status_code=400, detail="Code must be alphanumeric only")
     
@@ -251,19 +257,25 @@ async def create_referral(referral: ReferralCodeModel, email: str = Depends(veri
         if referral_dict["discount_value"] < 0:
             raise HTTPException(status_code=400, detail="Fixed discount must be positive")
     
-    result = await db.referral_codes.insert_one(referral_dict)
+    try:
+        result = await db.referral_codes.insert_one(referral_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Referral code already exists")
     return {"id": str(result.inserted_id), "code": code, "message": "Referral code created"}
 
 @router_users_sellers.put("/api/referrals/{referral_id}")
 async def update_referral(referral_id: str, referral: ReferralCodeModel, email: str = Depends(verify_token)):
     referral_dict = referral.model_dump()
-    referral_dict["code"] = referral_dict["code"].upper()
+    referral_dict["code"] = normalize_referral_code(referral_dict["code"])
     referral_dict["updated_at"] = datetime.now(timezone.utc)
     
-    result = await db.referral_codes.update_one(
-        {"_id": ObjectId(referral_id)},
-        {"$set": referral_dict}
-    )
+    try:
+        result = await db.referral_codes.update_one(
+            {"_id": ObjectId(referral_id)},
+            {"$set": referral_dict}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Referral code already exists")
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Referral code not found")
@@ -307,124 +319,71 @@ async def assign_seller_to_referral(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Referral code not found")
     
+    # Orders paid before the code had a seller were marked as not a seller's
+    referral = await db.referral_codes.find_one({"_id": ObjectId(referral_id)}, {"code": 1})
+    if referral:
+        await accrue_code_commissions(db, referral["code"])
+    
     return {"message": "Seller assigned to referral code"}
 
-# ==================== SELLER ENDPOINTS - FIXED COMMISSION CALCULATION ====================
+# ==================== SELLER ENDPOINTS - LEDGER BALANCES ====================
 
-def calculate_order_profit(order, products_cache=None):
-    """Helper function to calculate actual profit from an order"""
-    total_profit = 0
-    
-    if order.get("items"):
-        for item in order["items"]:
-            # Try to find product by ID first, then by name
-            product = None
-            if products_cache and item.get("product_name") in products_cache:
-                product = products_cache[item.get("product_name")]
-            
-            if product:
-                purchase_price = product.get("purchase_price_usdt", 0)
-                selling_price = item.get("price_usdt", 0)
-                quantity = item.get("quantity", 1)
-                
-                # Calculate profit per item
-                item_profit = (selling_price - purchase_price) * quantity
-                total_profit += item_profit
-    
-    # Subtract discount from profit (discount reduces our profit!)
-    discount_amount = order.get("discount_amount", 0)
-    actual_profit = max(0, total_profit - discount_amount)
+def seller_totals(balance: Optional[dict]) -> dict:
+    """Seller screen totals from a seller_balances document"""
+    balance = balance or {}
+    total_commission = balance.get("total_commission", 0)
+    total_paid = balance.get("total_paid", 0)
     
-    return actual_profit
+    return {
+        "total_sales": format_price(balance.get("total_sales", 0)),
+        "total_commission": format_price(total_commission),
+        "total_earnings": format_price(total_commission),
+        "pending_earnings": format_price(total_commission - total_paid),
+        "total_paid": format_price(total_paid),
+        "total_orders": balance.get("total_orders", 0)
+    }
 
 @router_users_sellers.get("/api/sellers")
 async def get_sellers(email: str = Depends(verify_token)):
-    """Get all sellers with their CORRECTED stats"""
+    """Get all sellers with stats from their ledger balances"""
     sellers = await db.sellers.find({
         "deleted_at": {"$exists": False}
     }).to_list(100)
     
-    # Cache all products for performance
-    all_products = await db.products.find({}).to_list(None)
-    products_cache = {p["name"]: p for p in all_products}
+    seller_ids = [str(seller["_id"]) for seller in sellers]
+    balances = await get_seller_balances(db, seller_ids)
+    
+    codes_by_seller = {}
+    codes = await db.referral_codes.find(
+        {"seller_id": {"$in": seller_ids}}, {"code": 1, "seller_id": 1}
+    ).to_list(None)
+    for code in codes:
+        codes_by_seller.setdefault(code["seller_id"], []).append(code["code"])
     
     for seller in sellers:
         seller["_id"] = str(seller["_id"])
+        seller["commission_percentage"] = seller.get("commission_percentage", 30)
+        seller["created_at"] = seller.get("created_at", datetime.now(timezone.utc))
         
         if seller.get("is_active") == False:
             seller["referral_codes"] = []
-            seller["total_sales"] = "0.00"
-            seller["total_commission"] = "0.00"
-            seller["total_earnings"] = "0.00"
-            seller["pending_earnings"] = "0.00"
-            seller["total_paid"] = "0.00"
-            seller["total_orders"] = 0
-            seller["commission_percentage"] = seller.get("commission_percentage", 30)
-            seller["created_at"] = seller.get("created_at", datetime.now(timezone.utc))
+            seller.update(seller_totals(None))
             continue
         
-        referral_codes = await db.referral_codes.find({
-            "seller_id": str(seller["_id"])
-        }).to_list(100)
+        balance = balances.get(seller["_id"])
+        code_stats = balance.get("codes", {}) if balance else {}
         
         seller["referral_codes"] = []
-        total_commission = 0
-        total_sales = 0
-        total_orders = 0
-        
-        for code in referral_codes:
-            code["_id"] = str(code["_id"])
-            orders = await db.orders.find({
-                "referral_code": code["code"],
-                "status": {"$in": ["paid", "completed"]}
-            }).to_list(1000)
-            
-            code_commission = 0
-            code_sales = 0
-            
-            for order in orders:
-                # Total sales (revenue)
-                code_sales += order.get("total_usdt", 0)
-                
-                # Calculate ACTUAL PROFIT using the helper function
-                actual_profit = calculate_order_profit(order, products_cache)
-                
-                # Calculate commission from PROFIT, not revenue!
-                commission_rate = seller.get("commission_percentage", 30)
-                commission = actual_profit * (commission_rate / 100)
-                code_commission += commission
-                total_orders += 1
-            
-            code["total_commission"] = format_price(code_commission)
-            code["total_sales"] = format_price(code_sales)
-            code["uses"] = len(orders)
-            
+        for code in codes_by_seller.get(seller["_id"], []):
+            stats = code_stats.get(code, {})
             seller["referral_codes"].append({
-                "code": code["code"],
-                "commission": format_price(code_commission),
-                "sales": format_price(code_sales),
-                "uses": len(orders)
+                "code": code,
+                "commission": format_price(stats.get("commission", 0)),
+                "sales": format_price(stats.get("sales", 0)),
+                "uses": stats.get("uses", 0)
             })
-            
-            total_commission += code_commission
-            total_sales += code_sales
-        
-        # Get payouts
-        payouts = await db.seller_payouts.find({
-            "seller_id": str(seller["_id"])
-        }).to_list(100)
-        
-        total_paid = sum(p.get("amount", 0) for p in payouts)
-        pending_commission = total_commission - total_paid
         
-        seller["total_sales"] = format_price(total_sales)
-        seller["total_commission"] = format_price(total_commission)
-        seller["total_earnings"] = format_price(total_commission)
-        seller["pending_earnings"] = format_price(pending_commission)
-        seller["total_paid"] = format_price(total_paid)
-        seller["total_orders"] = total_orders
-        seller["commission_percentage"] = seller.get("commission_percentage", 30)
-        seller["created_at"] = seller.get("created_at", datetime.now(timezone.utc))
+        seller.update(seller_totals(balance))
     
     return {"sellers": sellers, "total": len(sellers)}
 
@@ -485,6 +444,8 @@ async def delete_seller(
         logger.info(f"Hard deleting seller {seller_id}")
         
         await db.seller_payouts.delete_many({"seller_id": seller_id})
+        await db.seller_ledger.delete_many({"seller_id": seller_id})
+        await db.seller_balances.delete_one({"_id": seller_id})
         
         await db.referral_codes.update_many(
             {"seller_id": seller_id},
@@ -534,49 +495,35 @@ async def delete_seller(
         return {"message": "Seller deactivated", "type": "soft_delete", "success": True}
 
 @router_users_sellers.get("/api/sellers/{seller_id}/earnings")
-async def get_seller_earnings(seller_id: str, email: str = Depends(verify_token)):
-    """Get detailed earnings for a seller - FIXED CALCULATION"""
+async def get_seller_earnings(seller_id: str, limit: int = 500, email: str = Depends(verify_token)):
+    """Get detailed earnings for a seller from the commission ledger"""
     seller = await db.sellers.find_one({"_id": ObjectId(seller_id)})
     if not seller:
         raise HTTPException(status_code=404, detail="Seller not found")
     
-    # Cache products
-    all_products = await db.products.find({}).to_list(None)
-    products_cache = {p["name"]: p for p in all_products}
+    entries = await db.seller_ledger.find({
+        "seller_id": seller_id,
+        "type": {"$in": COMMISSION_TYPES}
+    }).sort("created_at", -1).limit(limit).to_list(limit)
     
-    referral_codes = await db.referral_codes.find({
-        "seller_id": seller_id
-    }).to_list(100)
+    order_ids = list({entry["order_id"] for entry in entries})
+    orders = await db.orders.find({"_id": {"$in": order_ids}}, {"status": 1}).to_list(None)
+    statuses = {order["_id"]: order.get("status") for order in orders}
     
     earnings_details = []
-    total_earnings = 0
-    
-    for code in referral_codes:
-        orders = await db.orders.find({
-            "referral_code": code["code"],
-            "status": {"$in": ["paid", "completed"]}
-        }).sort("created_at", -1).to_list(100)
-        
-        for order in orders:
-            # Use helper to calculate actual profit
-            actual_profit = calculate_order_profit(order, products_cache)
-            
-            # Calculate commission from PROFIT
-            commission_rate = seller.get("commission_percentage", 30)
-            commission = actual_profit * (commission_rate / 100)
-            total_earnings += commission
-            
-            earnings_details.append({
-                "order_id": str(order["_id"]),
-                "order_number": order.get("order_number"),
-                "date": order.get("created_at"),
-                "order_total": format_price(order.get("total_usdt", 0)),
-                "order_profit": format_price(actual_profit),
-                "commission_rate": commission_rate,
-                "commission_earned": format_price(commission),
-                "referral_code": code["code"],
-                "status": order.get("status")
-            })
+    for entry in entries:
+        earnings_details.append({
+            "order_id": str(entry["order_id"]),
+            "order_number": entry.get("order_number"),
+            "date": entry.get("created_at"),
+            "type": entry["type"],
+            "order_total": format_price(entry.get("order_total", 0)),
+            "order_profit": format_price(entry.get("order_profit", 0)),
+            "commission_rate": entry.get("commission_rate"),
+            "commission_earned": format_price(entry["amount"]),
+            "referral_code": entry.get("referral_code"),
+            "status": statuses.get(entry["order_id"], "deleted")
+        })
     
     # Get payouts
     payouts = await db.seller_payouts.find({
@@ -586,8 +533,7 @@ async def get_seller_earnings(seller_id: str, email: str = Depends(verify_token)
     for payout in payouts:
         payout["_id"] = str(payout["_id"])
     
-    total_paid = sum(p.get("amount", 0) for p in payouts)
-    pending = total_earnings - total_paid
+    totals = seller_totals((await get_seller_balances(db, [seller_id])).get(seller_id))
     
     return {
         "seller": {
@@ -597,10 +543,10 @@ async def get_seller_earnings(seller_id: str, email: str = Depends(verify_token)
         },
         "earnings": earnings_details,
         "summary": {
-            "total_earnings": format_price(total_earnings),
-            "total_paid": format_price(total_paid),
-            "pending_payout": format_price(pending),
-            "total_orders": len(earnings_details)
+            "total_earnings": totals["total_earnings"],
+            "total_paid": totals["total_paid"],
+            "pending_payout": totals["pending_earnings"],
+            "total_orders": totals["total_orders"]
         },
         "payout_history": payouts
     }
@@ -616,15 +562,6 @@ async def create_payout(
     if not seller:
         raise HTTPException(status_code=404, detail="Seller not found")
     
-    earnings = await get_seller_earnings(seller_id, email)
-    pending = float(earnings["summary"]["pending_payout"])
-    
-    if payout.amount > pending:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Payout amount exceeds pending earnings (${pending:.2f})"
-        )
-    
     payout_dict = payout.model_dump()
     payout_dict["seller_id"] = seller_id
     payout_dict["seller_name"] = seller["name"]
@@ -632,7 +569,16 @@ async def create_payout(
     payout_dict["created_by"] = email
     payout_dict["status"] = "completed"
     
-    result = await db.seller_payouts.insert_one(payout_dict)
+    # Debits the balance only if pending earnings cover the amount
+    payout_id = await create_seller_payout(db, seller_id, payout_dict)
+    balance = (await get_seller_balances(db, [seller_id])).get(seller_id)
+    pending = pending_balance(balance)
+    
+    if not payout_id:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Payout amount exceeds pending earnings (${pending:.2f})"
+        )
     
     await db.audit_logs.insert_one({
         "admin_id": email,
@@ -647,55 +593,25 @@ async def create_payout(
     })
     
     return {
-        "id": str(result.inserted_id),
+        "id": payout_id,
         "message": f"Payout of ${payout.amount:.2f} created successfully",
-        "new_pending": format_price(pending - payout.amount)
+        "new_pending": format_price(pending)
     }
 
 @router_users_sellers.get("/api/sellers/stats")
 async def get_sellers_stats(email: str = Depends(verify_token)):
-    """Get overall seller program statistics - FIXED"""
+    """Get overall seller program statistics from ledger balances"""
     total_sellers = await db.sellers.count_documents({"is_active": True})
     
-    all_sellers = await db.sellers.find({}).to_list(100)
-    total_earnings = 0
-    total_pending = 0
-    
-    # Cache products
-    all_products = await db.products.find({}).to_list(None)
-    products_cache = {p["name"]: p for p in all_products}
-    
-    for seller in all_sellers:
-        seller_id = str(seller["_id"])
-        
-        # Get referral codes for this seller
-        codes = await db.referral_codes.find({"seller_id": seller_id}).to_list(100)
-        
-        seller_total_earnings = 0
-        for code in codes:
-            # Get orders using this code
-            orders = await db.orders.find({
-                "referral_code": code["code"],
-                "status": {"$in": ["paid", "completed"]}
-            }).to_list(None)
-            
-            for order in orders:
-                # Calculate actual profit
-                actual_profit = calculate_order_profit(order, products_cache)
-                
-                # Calculate commission from profit
-                commission_rate = seller.get("commission_percentage", 30)
-                commission = actual_profit * (commission_rate / 100)
-                seller_total_earnings += commission
-        
-        total_earnings += seller_total_earnings
-        
-        # Get payouts
-        payouts = await db.seller_payouts.find({"seller_id": seller_id}).to_list(None)
-        total_paid = sum(p.get("amount", 0) for p in payouts)
-        
-        pending = seller_total_earnings - total_paid
-        total_pending += pending
+    totals = await db.seller_balances.aggregate([
+        {"$group": {
+            "_id": None,
+            "earnings": {"$sum": "$total_commission"},
+            "paid": {"$sum": {"$ifNull": ["$total_paid", 0]}}
+        }}
+    ]).to_list(1)
+    total_earnings = totals[0]["earnings"] if totals else 0
+    total_pending = total_earnings - (totals[0]["paid"] if totals else 0)
     
     # Monthly payouts
     month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0)
@@ -712,6 +628,12 @@ async def get_sellers_stats(email: str = Depends(verify_token)):
         "top_sellers": await get_top_sellers()
     }
 
+@router_users_sellers.post("/api/sellers/reconcile")
+async def reconcile_sellers(email: str = Depends(verify_token)):
+    """Verify the commission ledger against orders and payouts and fix balances"""
+    report = await reconcile_ledger(db)
+    return {"success": True, **report}
+
 @router_users_sellers.get("/api/sellers/{seller_id}/referral-codes")
 async def get_seller_referral_codes(seller_id: str, email: str = Depends(verify_token)):
     """Get all referral codes assigned to a seller"""
@@ -16,12 +16,6 @@ def format_price(value):
     except:
         return 0
 
-def generate_order_id():
-    """Generate random order ID"""
-    part1 = secrets.token_hex(2).upper()
-    part2 = secrets.token_hex(2).upper()
-    return f"APZ-{part1}-{part2}"
-
 def generate_referral_code():
     """Generate unique referral code"""
     return secrets.token_hex(4).upper()
@@ -40,66 +34,11 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         raise HTTPException(status_code=401, detail="Invalid token")
 
 async def get_top_sellers():
-    """Helper to get top performing sellers - FIXED VERSION"""
+    """Helper to get top performing sellers - cached leaderboard, never blocks on the aggregation"""
     from .config import db
-    from bson import ObjectId
-    
-    sellers = await db.sellers.find({
-        "is_active": {"$ne": False},
-        "deleted_at": {"$exists": False}
-    }).to_list(100)
-    
-    # Cache all products for performance
-    all_products = await db.products.find({}).to_list(None)
-    products_cache = {p["name"]: p for p in all_products}
-    
-    seller_earnings = []
+    from bot_modules.seller_ledger import top_sellers_cache
     
-    for seller in sellers:
-        total_commission = 0
-        codes = await db.referral_codes.find({"seller_id": str(seller["_id"])}).to_list(100)
-        
-        for code in codes:
-            orders = await db.orders.find({
-                "referral_code": code["code"],
-                "status": {"$in": ["paid", "completed"]}
-            }).to_list(100)
-            
-            for order in orders:
-                # Calculate actual profit from order
-                actual_profit = 0
-                
-                if order.get("items"):
-                    for item in order["items"]:
-                        product = products_cache.get(item.get("product_name"))
-                        
-                        if product:
-                            purchase_price = product.get("purchase_price_usdt", 0)
-                            selling_price = item.get("price_usdt", 0)
-                            quantity = item.get("quantity", 1)
-                            
-                            # Calculate profit per item
-                            item_profit = (selling_price - purchase_price) * quantity
-                            actual_profit += item_profit
-                
-                # Subtract discount from profit (discounts reduce profit!)
-                discount_amount = order.get("discount_amount", 0)
-                actual_profit = max(0, actual_profit - discount_amount)
-                
-                # Calculate commission from PROFIT, not revenue
-                seller_commission_rate = seller.get("commission_percentage", 30)
-                commission = actual_profit * (seller_commission_rate / 100)
-                total_commission += commission
-        
-        if total_commission > 0:
-            seller_earnings.append({
-                "name": seller["name"],
-                "earnings": format_price(total_commission)
-            })
-    
-    # Sort by earnings
-    seller_earnings.sort(key=lambda x: float(x["earnings"]), reverse=True)
-    return seller_earnings[:5]
+    return await top_sellers_cache.get(db)
 
 async def setup_chat_indexes():
     """Setup MongoDB indexes for chat"""
@@ -111,4 +50,13 @@ async def setup_chat_indexes():
     await db.chat_messages.create_index([("message", "text")])
     await db.chat_messages.create_index([("telegram_id", 1), ("timestamp", -1)])
     await db.chat_messages.create_index([("read", 1), ("direction", 1)])
-    logger.info("Chat indexes created")
\ No newline at end of file
+    await db.chat_messages.create_index([("timestamp", -1), ("_id", -1)])
+    logger.info("Chat indexes created")
+
+async def bump_bot_config_version(collection: str, doc_id=None):
+    """Tell the bot a config document changed (read by its version polling when
+    MongoDB has no change streams). collection "all" forces a full reload."""
+    from .config import db
+    from bot_modules.message_loader import bump_config_version
+    
+    await bump_config_version(db, collection, doc_id)
@@ -0,0 +1,228 @@
+# PAYOUT PIPELINE - per-order profit deductions compiled once per request
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_SUPPORT = True
+except ImportError:
+    np = None
+    NUMPY_SUPPORT = False
+
+# A compiled step: current profit -> (amount, deduction) or None when it doesn't apply
+Step = Callable[[float], Optional[Tuple[float, dict]]]
+
+def _percentage_step(rate: float, deduction: dict) -> Step:
+    factor = rate / 100
+
+    def step(current_profit: float):
+        if current_profit <= 0:
+            return None
+        amount = current_profit * factor
+        return amount, {**deduction, "amount": amount}
+
+    return step
+
+def _fixed_step(amount: float, deduction: dict) -> Step:
+    applied = {**deduction, "amount": amount}
+
+    def step(current_profit: float):
+        return amount, dict(applied)
+
+    return step
+
+class DeductionPipeline:
+    """Payout calculation for many orders with the same partners and expenses.
+
+    Expenses and partner splits are turned into an ordered list of steps once;
+    per order only the discount and the seller (by referral code) vary. Order
+    of deductions: recurring expenses, customer discount, seller commission,
+    partner commissions - each taken from the profit left after the previous.
+    partner_totals() runs the same steps vectorized with NumPy when installed.
+    """
+
+    def __init__(self, context: dict):
+        self.products_by_name = context["products_by_name"]
+        self.sellers_by_code = context["sellers_by_code"]
+        # ("percentage" | "fixed", rate or amount) per expense step, for the vectorized path
+        self.expenses: List[Tuple[str, float]] = []
+        self.expense_steps: List[Step] = []
+        for expense in context["recurring_expenses"]:
+            self._compile_expense(expense)
+        # (partner_id, name, rate) for partners that take a share
+        self.partners = [
+            (str(p["_id"]), p["name"], float(p["commission_percentage"]))
+            for p in context["partners"]
+            if p["type"] == "partner" and p.get("commission_percentage")
+        ]
+        self.partner_steps = [
+            _percentage_step(rate, {
+                "type": "partner_commission",
+                "partner_id": partner_id,
+                "name": name,
+                "rate": rate
+            })
+            for partner_id, name, rate in self.partners
+        ]
+        self.seller_steps: Dict[str, Step] = {
+            code: _percentage_step(float(seller.get("commission_percentage", 30)), {
+                "type": "seller_commission",
+                "name": seller.get("name"),
+                "rate": float(seller.get("commission_percentage", 30))
+            })
+            for code, seller in self.sellers_by_code.items()
+        }
+
+    def _compile_expense(self, expense: dict):
+        expense_type = expense.get('type', 'expense')
+        is_percentage = expense.get('amount_type') == 'percentage'
+        rate = expense.get('percentage', 0) if is_percentage else 0
+
+        if is_percentage and expense.get('percentage'):
+            percentage = float(expense['percentage'])
+            if percentage <= 0:
+                return
+            self.expenses.append(("percentage", percentage))
+            self.expense_steps.append(_percentage_step(percentage, {
+                "type": "expense",
+                "name": f"{expense.get('name')} ({percentage}%) ({expense_type})",
+                "rate": rate
+            }))
+            return
+
+        amount = float(expense.get('amount', 0))
+        if amount <= 0:
+            return
+        self.expenses.append(("fixed", amount))
+        self.expense_steps.append(_fixed_step(amount, {
+            "type": "expense",
+            "name": f"{expense.get('name')} ({expense_type})",
+            "rate": rate
+        }))
+
+    # ==================== PER ORDER ====================
+
+    def base_profit(self, order: dict) -> float:
+        """Price before discount minus purchase cost (from the item, else the current product)"""
+        total_purchase_cost = 0
+
+        for item in order.get("items") or []:
+            purchase_price = float(item.get("purchase_price_usdt", 0))
+            if purchase_price == 0:
+                product = self.products_by_name.get(item.get("product_name", ""))
+                if product:
+                    purchase_price = float(product.get("purchase_price_usdt", 0))
+            total_purchase_cost += purchase_price * item.get("quantity", 1)
+
+        return float(order.get("total_usdt", 0)) + float(order.get("discount_amount", 0)) - total_purchase_cost
+
+    def calculate(self, order: dict) -> dict:
+        """Profit breakdown of one order"""
+        base_profit = self.base_profit(order)
+        current_profit = base_profit
+        deductions = []
+
+        for step in self.expense_steps:
+            applied = step(current_profit)
+            if applied:
+                current_profit -= applied[0]
+                deductions.append(applied[1])
+
+        discount_amount = float(order.get("discount_amount", 0))
+        if discount_amount > 0:
+            deductions.append({
+                "type": "discount",
+                "name": "Customer Discount",
+                "rate": 0,
+                "amount": discount_amount
+            })
+            current_profit -= discount_amount
+
+        seller_step = self.seller_steps.get(order.get("referral_code"))
+        if seller_step:
+            applied = seller_step(current_profit)
+            if applied:
+                current_profit -= applied[0]
+                deductions.append(applied[1])
+
+        for step in self.partner_steps:
+            applied = step(current_profit)
+            if applied:
+                applied[1]["base_amount"] = current_profit
+                current_profit -= applied[0]
+                deductions.append(applied[1])
+
+        return {
+            "order_number": order.get("order_number"),
+            "order_date": order.get("created_at"),
+            "total_usdt": float(order.get("total_usdt", 0)),
+            "base_profit": base_profit,
+            "deductions": deductions,
+            "final_profit": current_profit
+        }
+
+    # ==================== BATCHES ====================
+
+    def _order_arrays(self, orders: List[dict]):
+        base = np.fromiter((self.base_profit(o) for o in orders), dtype=np.float64, count=len(orders))
+        discounts = np.fromiter(
+            (max(0.0, float(o.get("discount_amount", 0))) for o in orders), dtype=np.float64, count=len(orders)
+        )
+        seller_rates = np.fromiter(
+            (float(self.sellers_by_code[o.get("referral_code")].get("commission_percentage", 30))
+             if o.get("referral_code") in self.sellers_by_code else 0.0 for o in orders),
+            dtype=np.float64, count=len(orders)
+        )
+        return base, discounts, seller_rates
+
+    def _vectorized(self, orders: List[dict]):
+        current, discounts, seller_rates = self._order_arrays(orders)
+
+        for kind, value in self.expenses:
+            if kind == "fixed":
+                current = current - value
+            else:
+                current = current - np.where(current > 0, current * (value / 100), 0.0)
+
+        current = current - discounts
+        current = current - np.where((seller_rates > 0) & (current > 0), current * seller_rates / 100, 0.0)
+
+        partner_amounts = []
+        for _, _, rate in self.partners:
+            applies = current > 0
+            amounts = np.where(applies, current * (rate / 100), 0.0)
+            partner_amounts.append((float(amounts.sum()), int(applies.sum())))
+            current = current - amounts
+
+        return current, partner_amounts
+
+    def partner_totals(self, orders: List[dict], totals: Optional[dict] = None) -> dict:
+        """Add the orders' partner commissions to totals ({partner_id: {name, total, count}})"""
+        totals = totals if totals is not None else {}
+        if not orders:
+            return totals
+
+        if NUMPY_SUPPORT:
+            _, partner_amounts = self._vectorized(orders)
+            for (partner_id, name, _), (amount, count) in zip(self.partners, partner_amounts):
+                if count:
+                    partner_total = totals.setdefault(partner_id, {"name": name, "total": 0, "count": 0})
+                    partner_total["total"] += amount
+                    partner_total["count"] += count
+            return totals
+
+        for order in orders:
+            add_partner_totals(totals, self.calculate(order))
+        return totals
+
+def add_partner_totals(totals: dict, order_calc: dict):
+    for deduction in order_calc["deductions"]:
+        if deduction["type"] != "partner_commission":
+            continue
+        partner_total = totals.setdefault(deduction["partner_id"], {
+            "name": deduction["name"],
+            "total": 0,
+            "count": 0
+        })
+        partner_total["total"] += deduction["amount"]
+        partner_total["count"] += 1
@@ -0,0 +1,86 @@
+"""
+Webhook mode for the Telegram bot - updates are pushed into the API process
+instead of being long-polled by bot.py
+"""
+import logging
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")  # public base URL of this API
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")  # required in webhook mode
+TELEGRAM_WEBHOOK_PATH = "/api/telegram/webhook"
+# Above this many accepted-but-unfinished updates we answer 503 and let Telegram retry
+WEBHOOK_MAX_PENDING = int(os.getenv("TELEGRAM_WEBHOOK_MAX_PENDING", "1000"))
+
+router_telegram_webhook = APIRouter()
+
+telegram_application = None
+
+async def start_telegram_webhook():
+    """Build the bot application, start its update workers and register the webhook"""
+    global telegram_application
+
+    if not TELEGRAM_WEBHOOK_SECRET:
+        # Without it anyone could POST forged updates to the webhook endpoint
+        logger.error("❌ TELEGRAM_WEBHOOK_SECRET is not set - webhook mode not started")
+        return
+
+    from telegram import Update
+    from bot import build_application
+
+    application = build_application()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    webhook_url = TELEGRAM_WEBHOOK_URL.rstrip("/") + TELEGRAM_WEBHOOK_PATH
+    await application.bot.set_webhook(
+        url=webhook_url,
+        secret_token=TELEGRAM_WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=True,
+        max_connections=100
+    )
+    telegram_application = application
+    logger.info(f"✅ Telegram webhook registered: {webhook_url}")
+
+async def stop_telegram_webhook():
+    global telegram_application
+
+    application = telegram_application
+    if application is None:
+        return
+    telegram_application = None
+
+    try:
+        await application.stop()
+        await application.shutdown()
+    except Exception as e:
+        logger.error(f"Error stopping telegram application: {e}")
+
+@router_telegram_webhook.post(TELEGRAM_WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    application = telegram_application
+    if application is None:
+        raise HTTPException(status_code=404, detail="Webhook mode is not enabled")
+
+    if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != TELEGRAM_WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    if getattr(application.update_processor, "pending", 0) >= WEBHOOK_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Bot is busy")
+
+    from telegram import Update
+
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid update")
+
+    # Acknowledge right away - handlers run on the application's update workers
+    await application.update_queue.put(update)
+    return {"ok": True}
@@ -0,0 +1,43 @@
+# migrate_order_items.py
+"""
+AnabolicPizza Shop - Order items migration
+Doplní product_id, category_id a purchase_price_usdt do položiek starých
+objednávok podľa názvu produktu. Dá sa spustiť opakovane - spracuje len
+položky, ktoré ešte product_id nemajú. API to robí aj samo pri štarte.
+
+Usage: python migrate_order_items.py
+"""
+
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+
+from bot_modules.order_items import ensure_order_item_indexes, backfill_order_items
+
+load_dotenv()
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+
+async def main():
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client.telegram_shop
+    
+    try:
+        pending = await db.orders.count_documents(
+            {"items": {"$elemMatch": {"product_id": {"$exists": False}}}}
+        )
+        print(f"🧾 Objednávky bez product_id v položkách: {pending}")
+        
+        await ensure_order_item_indexes(db)
+        updated = await backfill_order_items(db)
+        print(f"✅ Aktualizovaných objednávok: {updated}")
+        
+        unmatched = await db.orders.count_documents({"items.product_id": None})
+        if unmatched:
+            print(f"⚠️  {unmatched} objednávok má položky bez existujúceho produktu (product_id = null)")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
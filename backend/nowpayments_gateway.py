@@ -421,12 +421,10 @@ class NOWPaymentsGateway:
             )
             
             # Update product sold counts
-            if order.get("items"):
-                for item in order["items"]:
-                    await self.db.products.update_one(
-                        {"name": item["product_name"]},
-                        {"$inc": {"sold_count": item.get("quantity", 1)}}
-                    )
+            from bot_modules.order_items import increment_sold_counts
+            from bot_modules.stock import commit_stock
+            await increment_sold_counts(self.db, order)
+            await commit_stock(self.db, order["_id"])
             
             # Update user stats
             await self.db.users.update_one(
@@ -439,6 +437,12 @@ class NOWPaymentsGateway:
                 }
             )
             
+            try:
+                from bot_modules.seller_ledger import accrue_order_commission
+                await accrue_order_commission(self.db, order)
+            except Exception as e:
+                logger.error(f"Seller commission error: {e}")
+            
             # Try to update Telegram message
             message_id = order.get("payment", {}).get("message_id")
             if message_id:
@@ -523,7 +527,7 @@ _Time to get massive! Your gains are on the way!_ 🍕💉
     
     async def handle_expired_payment(self, order_number: str, payment_id: str):
         try:
-            await self.db.orders.update_one(
+            order = await self.db.orders.find_one_and_update(
                 {"order_number": order_number},
                 {
                     "$set": {
@@ -531,16 +535,21 @@ _Time to get massive! Your gains are on the way!_ 🍕💉
                         "status": "cancelled",
                         "payment.latest_status": "expired"
                     }
-                }
+                },
+                projection={"_id": 1}
             )
             
+            if order:
+                from bot_modules.stock import release_stock
+                await release_stock(self.db, order["_id"], "payment_expired")
+            
             logger.info(f"Order {order_number} payment expired")
         except Exception as e:
             logger.error(f"Error handling expired payment: {e}")
     
     async def handle_failed_payment(self, order_number: str, payment_id: str):
         try:
-            await self.db.orders.update_one(
+            order = await self.db.orders.find_one_and_update(
                 {"order_number": order_number},
                 {
                     "$set": {
@@ -548,9 +557,14 @@ _Time to get massive! Your gains are on the way!_ 🍕💉
                         "status": "cancelled",
                         "payment.latest_status": "failed"
                     }
-                }
+                },
+                projection={"_id": 1}
             )
             
+            if order:
+                from bot_modules.stock import release_stock
+                await release_stock(self.db, order["_id"], "payment_failed")
+            
             logger.info(f"Order {order_number} payment failed")
         except Exception as e:
             logger.error(f"Error handling failed payment: {e}")
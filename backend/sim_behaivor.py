@@ -11,9 +11,14 @@ from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import os
 from dotenv import load_dotenv
 
+from bot_modules.seller_ledger import ensure_ledger_indexes, reconcile_ledger
+from bot_modules.order_items import ensure_order_item_indexes
+from bot_modules.id_service import next_order_number
+
 load_dotenv()
 
 # ==============================================================================
@@ -123,6 +128,8 @@ async def clear_existing_data():
     await db.sellers.delete_many({})
     await db.referral_codes.delete_many({})
     await db.seller_payouts.delete_many({})
+    await db.seller_ledger.delete_many({})
+    await db.seller_balances.delete_many({})
     await db.products.update_many({}, {"$set": {"sold_count": 0}})
     
     print("✅ Databáza vyčistená")
@@ -327,11 +334,13 @@ async def generate_orders(users, products, referral_codes):
                     price = price * (1 - user["vip_discount_percentage"] / 100)
                 
                 item = {
-                    "product_id": str(product["_id"]),
+                    "product_id": product["_id"],
+                    "category_id": product.get("category_id"),
                     "product_name": product["name"],
                     "quantity": quantity,
                     "price_usdt": price,
-                    "subtotal_usdt": price * quantity
+                    "subtotal_usdt": price * quantity,
+                    "purchase_price_usdt": product.get("purchase_price_usdt", 0)
                 }
                 items.append(item)
                 subtotal += item["subtotal_usdt"]
@@ -365,7 +374,7 @@ async def generate_orders(users, products, referral_codes):
             # Vytvor objednávku
             order = {
                 "_id": ObjectId(),
-                "order_number": f"APZ-{secrets.token_hex(2).upper()}-{secrets.token_hex(2).upper()}",
+                "order_number": await next_order_number(db),
                 "user_id": str(user["_id"]),
                 "telegram_id": user["telegram_id"],
                 "items": items,
@@ -432,25 +441,20 @@ async def update_statistics():
             }}
         )
     
-    # Aktualizuj produkty
-    products = await db.products.find({}).to_list(None)
-    for product in products:
-        sold_count = 0
-        
-        orders = await db.orders.find({
-            "items.product_name": product["name"],
-            "status": {"$in": ["paid", "completed", "processing"]}
-        }).to_list(None)
-        
-        for order in orders:
-            for item in order.get("items", []):
-                if item.get("product_name") == product["name"]:
-                    sold_count += item.get("quantity", 1)
-        
-        await db.products.update_one(
-            {"_id": product["_id"]},
-            {"$set": {"sold_count": sold_count}}
-        )
+    # Aktualizuj produkty - jedna agregácia cez product_id položiek
+    sold = await db.orders.aggregate([
+        {"$match": {"status": {"$in": ["paid", "completed", "processing"]}}},
+        {"$unwind": "$items"},
+        {"$group": {"_id": "$items.product_id", "sold_count": {"$sum": {"$ifNull": ["$items.quantity", 1]}}}}
+    ]).to_list(None)
+    sold_by_id = {entry["_id"]: entry["sold_count"] for entry in sold if entry["_id"]}
+    
+    products = await db.products.find({}, {"_id": 1}).to_list(None)
+    if products:
+        await db.products.bulk_write([
+            UpdateOne({"_id": product["_id"]}, {"$set": {"sold_count": sold_by_id.get(product["_id"], 0)}})
+            for product in products
+        ], ordered=False)
 
 async def generate_payouts(sellers):
     """Generuj výplaty pre predajcov"""
@@ -565,6 +569,12 @@ async def main():
         if CONFIG['GENERATE_PAYOUTS']:
             await generate_payouts(sellers)
         
+        # Provízny ledger z vygenerovaných objednávok a výplat
+        await ensure_ledger_indexes(db)
+        await ensure_order_item_indexes(db)
+        report = await reconcile_ledger(db)
+        print(f"🧾 Ledger: {report['accrued']} provízií, {report['payouts_recorded']} výplat")
+        
         # Súhrn
         await print_summary()
         
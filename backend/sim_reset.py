@@ -84,6 +84,10 @@ async def reset_data(keep_products=True):
     deleted["Výplaty"] = result.deleted_count
     print(f"❌ Vymazaných {result.deleted_count} výplat")
     
+    # Provízny ledger a zostatky predajcov
+    await db.seller_ledger.delete_many({})
+    await db.seller_balances.delete_many({})
+    
     # Chat správy (voliteľné)
     result = await db.chat_messages.delete_many({})
     if result.deleted_count > 0:
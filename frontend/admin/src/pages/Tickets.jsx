@@ -319,10 +319,11 @@ const MobileTicketCard = ({ ticket, onStatusUpdate, onViewDetails, onDelete }) =
   );
 };
 
-const TicketDetailModal = ({ ticket, isOpen, onClose, onStatusUpdate, onDelete, onReply }) => {
+const TicketDetailModal = ({ ticket, isOpen, onClose, onStatusUpdate, onDelete, onReply, onLoadOlder }) => {
   const [newStatus, setNewStatus] = useState(ticket?.status || 'open');
   const [replyText, setReplyText] = useState('');
   const [updating, setUpdating] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const isMobile = window.innerWidth < 768;
 
   useEffect(() => {
@@ -347,6 +348,12 @@ const TicketDetailModal = ({ ticket, isOpen, onClose, onStatusUpdate, onDelete,
     setReplyText('');
   };
 
+  const handleLoadOlder = async () => {
+    setLoadingOlder(true);
+    await onLoadOlder(ticket._id);
+    setLoadingOlder(false);
+  };
+
   if (!ticket) return null;
 
   const StatusIcon = statusConfig[ticket.status]?.icon || ClockIcon;
@@ -446,6 +453,16 @@ const TicketDetailModal = ({ ticket, isOpen, onClose, onStatusUpdate, onDelete,
                 <ScrollArea style={{ maxHeight: '300px' }}>
                   {ticket.messages && ticket.messages.length > 0 ? (
                     <Flex direction="column" gap="2">
+                      {ticket.has_more_messages && (
+                        <Button
+                          size="1"
+                          variant="soft"
+                          onClick={handleLoadOlder}
+                          disabled={loadingOlder}
+                        >
+                          {loadingOlder ? 'Loading...' : 'Load older messages'}
+                        </Button>
+                      )}
                       {ticket.messages.map((msg, idx) => (
                         <Box key={idx} style={{
                           padding: '10px',
@@ -462,7 +479,7 @@ const TicketDetailModal = ({ ticket, isOpen, onClose, onStatusUpdate, onDelete,
                               {msg.sender_type === 'customer' ? ticket.username : 'Admin'}
                             </Text>
                             <Text size="1" style={{ color: 'rgba(255, 255, 255, 0.5)' }}>
-                              {new Date(msg.timestamp).toLocaleString()}
+                              {new Date(msg.created_at).toLocaleString()}
                             </Text>
                           </Flex>
                           <Text size="2">{msg.message}</Text>
@@ -682,36 +699,50 @@ const Tickets = () => {
     try {
       await ticketsAPI.reply(ticketId, { message });
       
-      const updatedTicket = tickets.find(t => t._id === ticketId);
-      if (updatedTicket) {
-        const newMessage = {
-          sender_type: 'admin',
-          message: message,
-          timestamp: new Date().toISOString()
-        };
-        
-        const updatedMessages = [...(updatedTicket.messages || []), newMessage];
-        
-        setTickets(prevTickets => 
-          prevTickets.map(ticket => 
-            ticket._id === ticketId 
-              ? { ...ticket, messages: updatedMessages }
-              : ticket
-          )
-        );
-        
-        if (selectedTicket && selectedTicket._id === ticketId) {
-          setSelectedTicket({
-            ...selectedTicket,
-            messages: updatedMessages
-          });
-        }
+      const newMessage = {
+        sender_type: 'admin',
+        message: message,
+        created_at: new Date().toISOString()
+      };
+      
+      setTickets(prevTickets => 
+        prevTickets.map(ticket => 
+          ticket._id === ticketId 
+            ? { ...ticket, last_message: newMessage, message_count: (ticket.message_count || 0) + 1 }
+            : ticket
+        )
+      );
+      
+      if (selectedTicket && selectedTicket._id === ticketId) {
+        setSelectedTicket({
+          ...selectedTicket,
+          last_message: newMessage,
+          messages: [...(selectedTicket.messages || []), newMessage]
+        });
       }
     } catch (error) {
       console.error('Error sending reply:', error);
     }
   };
 
+  const loadOlderMessages = async (ticketId) => {
+    try {
+      // Page back from the oldest message shown - new replies don't shift it
+      const oldest = selectedTicket?.messages?.find(msg => msg._id);
+      if (!oldest) return;
+      const data = await ticketsAPI.getById(ticketId, { before: oldest._id });
+      setSelectedTicket(current => current && current._id === ticketId
+        ? {
+            ...current,
+            messages: [...(data.messages || []), ...(current.messages || [])],
+            has_more_messages: data.has_more_messages
+          }
+        : current);
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    }
+  };
+
   const toggleRowExpansion = (ticketId) => {
     const newExpanded = new Set(expandedRows);
     if (newExpanded.has(ticketId)) {
@@ -722,9 +753,15 @@ const Tickets = () => {
     setExpandedRows(newExpanded);
   };
 
-  const openTicketModal = (ticket) => {
+  const openTicketModal = async (ticket) => {
     setSelectedTicket(ticket);
     setModalOpen(true);
+    try {
+      const data = await ticketsAPI.getById(ticket._id);
+      setSelectedTicket(current => current && current._id === ticket._id ? data : current);
+    } catch (error) {
+      console.error('Error fetching ticket:', error);
+    }
   };
 
   const filteredTickets = useMemo(() => {
@@ -1310,13 +1347,13 @@ const Tickets = () => {
                                         <Box>
                                           <Heading size="3" mb="3">Description</Heading>
                                           <Text size="2" style={{ color: 'rgba(255, 255, 255, 0.8)' }}>
-                                            {ticket.description || ticket.messages?.[0]?.message || 'No description available'}
+                                            {ticket.description || 'No description available'}
                                           </Text>
                                         </Box>
                                         
                                         <Box>
                                           <Heading size="3" mb="3">Latest Activity</Heading>
-                                          {ticket.messages && ticket.messages.length > 0 ? (
+                                          {ticket.last_message ? (
                                             <Box style={{
                                               padding: '10px',
                                               background: 'rgba(255, 255, 255, 0.02)',
@@ -1324,15 +1361,15 @@ const Tickets = () => {
                                             }}>
                                               <Flex justify="between" mb="1">
                                                 <Text size="2" weight="medium">
-                                                  {ticket.messages[ticket.messages.length - 1].sender_type === 'customer' ? 
+                                                  {ticket.last_message.sender_type === 'customer' ? 
                                                     ticket.username : 'Admin'}
                                                 </Text>
                                                 <Text size="1" style={{ color: 'rgba(255, 255, 255, 0.5)' }}>
-                                                  {new Date(ticket.messages[ticket.messages.length - 1].timestamp).toLocaleString()}
+                                                  {new Date(ticket.last_message.created_at).toLocaleString()}
                                                 </Text>
                                               </Flex>
                                               <Text size="2">
-                                                {ticket.messages[ticket.messages.length - 1].message}
+                                                {ticket.last_message.message}
                                               </Text>
                                             </Box>
                                           ) : (
@@ -1378,6 +1415,7 @@ const Tickets = () => {
         onStatusUpdate={updateStatus}
         onDelete={deleteTicket}
         onReply={sendReply}
+        onLoadOlder={loadOlderMessages}
       />
     </Box>
   );
@@ -1043,11 +1043,44 @@ export const payoutsAPI = {
         return response.json();
     },
     
-    getAllCalculations: async () => {
-        const response = await fetch('/api/payouts/calculations/all', {
+    getAllCalculations: async (incremental = false) => {
+        // NDJSON stream: one "calculation" line per order (oldest first), then a "summary" line
+        const response = await fetch(`/api/payouts/calculations/all?incremental=${incremental}`, {
             headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
         });
-        return response.json();
+        if (!response.ok) {
+            throw new Error(`Failed to load calculations: ${response.status}`);
+        }
+
+        const result = { calculations: [], partner_totals: {}, total_orders: 0 };
+        const handleLine = (line) => {
+            if (!line.trim()) return;
+            const { type, ...data } = JSON.parse(line);
+            if (type === 'calculation') {
+                result.calculations.push(data);
+            } else if (type === 'summary') {
+                Object.assign(result, data);
+            } else if (type === 'error') {
+                throw new Error(data.detail);
+            }
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer + decoder.decode());
+
+        // Newest first, like the paged endpoint
+        result.calculations.reverse();
+        return result;
     },
     
     processPayout: async (payoutData) => {
@@ -1085,8 +1118,9 @@ export const ticketsAPI = {
     return response.data;
   },
   
-  getById: async (id) => {
-    const response = await api.get(`/tickets/${id}`);
+  getById: async (id, params = {}) => {
+    const query = new URLSearchParams(params).toString();
+    const response = await api.get(`/tickets/${id}${query ? `?${query}` : ''}`);
     return response.data;
   },
   